@@ -2,6 +2,9 @@
 import tkinter as tk
 from tkinter import ttk
 from frames import add_patient, add_observation  # More can be added later
+from frames.worker import AsyncWorker
+from app.database import SYNC_DATABASE_URL
+from app.schema import ensure_schema
 
 class CDSSApp(tk.Tk):
     def __init__(self):
@@ -9,6 +12,13 @@ class CDSSApp(tk.Tk):
         self.title("Clinical Decision Support System")
         self.geometry("800x600")
 
+        # Create or upgrade the schema before any view queries it
+        ensure_schema(SYNC_DATABASE_URL).dispose()
+
+        # Single background event loop for all database work
+        self.worker = AsyncWorker(self)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
         # Sidebar
         self.sidebar = tk.Frame(self, width=200, bg="#f0f0f0")
         self.sidebar.pack(side=tk.LEFT, fill=tk.Y)
@@ -34,6 +44,10 @@ class CDSSApp(tk.Tk):
             b = tk.Button(self.sidebar, text=label, command=command)
             b.pack(padx=10, pady=5, fill=tk.X)
 
+    def on_close(self):
+        self.worker.stop()
+        self.destroy()
+
     def clear_content(self):
         for widget in self.content.winfo_children():
             widget.destroy()
@@ -0,0 +1,52 @@
+# app/cache.py
+import threading
+from collections import OrderedDict
+
+# Returned by LRUCache.get when a key is absent, so None can be cached as a value
+MISSING = object()
+
+
+class LRUCache:
+    """
+    Bounded, thread-safe least-recently-used mapping.
+    The GUI runs queries from worker threads, so every operation takes the lock.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def put(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def discard_where(self, predicate) -> int:
+        """Drop every entry whose key satisfies predicate; returns how many were dropped."""
+        with self._lock:
+            stale = [k for k in self._data if predicate(k)]
+            for k in stale:
+                del self._data[k]
+            return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -5,3 +5,29 @@ DATABASE_URL = config(
     "DATABASE_URL",
     default="sqlite+aiosqlite:///./cdss.db",
 )
+
+# SQLite storage profile, applied as PRAGMAs to every new connection.
+# Each value can be overridden from the environment or .env; empty disables it.
+SQLITE_PROFILE = {
+    # First, so the journal_mode switch waits for locks instead of failing
+    "busy_timeout": config("SQLITE_BUSY_TIMEOUT_MS", default="5000"),
+    # WAL lets the GUI's readers run while a writer commits
+    "journal_mode": config("SQLITE_JOURNAL_MODE", default="WAL"),
+    # NORMAL is durable against application crashes in WAL mode
+    "synchronous":  config("SQLITE_SYNCHRONOUS", default="NORMAL"),
+    # Negative means KiB: 64 MiB page cache per connection
+    "cache_size":   config("SQLITE_CACHE_SIZE", default="-65536"),
+    "mmap_size":    config("SQLITE_MMAP_SIZE", default=str(256 * 1024 * 1024)),
+    "temp_store":   config("SQLITE_TEMP_STORE", default="MEMORY"),
+}
+
+# Connection pool sizing (file databases only)
+DB_POOL_SIZE    = config("DB_POOL_SIZE", default=5, cast=int)
+DB_MAX_OVERFLOW = config("DB_MAX_OVERFLOW", default=10, cast=int)
+DB_POOL_TIMEOUT = config("DB_POOL_TIMEOUT", default=30, cast=int)
+
+# Rule tables loaded over the built-in knowledge base: a directory of CSV
+# files or a .yaml file (see app/kb_loader.py). Empty uses the built-in rules.
+KB_RULES_PATH = config("KB_RULES_PATH", default="")
+# How often, at most, the rule files are checked for changes
+KB_RELOAD_SECONDS = config("KB_RELOAD_SECONDS", default=2.0, cast=float)
@@ -1,30 +1,142 @@
+import re
+import asyncio
+import hashlib
 from datetime import datetime, timedelta
-from typing import Optional, List
-from sqlalchemy import select, and_, or_, desc
+from typing import Optional, List, Dict, Tuple, AsyncIterator
+from sqlalchemy import (
+    select, insert, update, and_, or_, func, text, column, tuple_,
+    values as sa_values, delete as sa_delete, Integer, String, DateTime,
+)
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
 from app import models, schemas
+from app.cache import LRUCache, MISSING
+from app.intervals import IntervalTree
+import numpy as np
 import pandas as pd
 from app.knowledge_base import get_hemoglobin_state_with_timing
-from app.models import Observation, Patient
-from app.knowledge_base import (
-    get_hemoglobin_state_with_timing,
-    treatment_rules
-)
-from app.knowledge_base import get_toxicity_grade_from_features, treatment_rules
+from app.models import Patient
+from app.knowledge_base import grade_toxicity, grade_toxicity_labels
+
+def _fts_query(test_name: str) -> Optional[str]:
+    """Turn free text into an FTS5 query: every word must match as a prefix."""
+    terms = re.findall(r"\w+", test_name.lower())
+    if not terms:
+        return None
+    return " ".join(f'"{t}"*' for t in terms)
+
+# The loinc table is static reference data: cache lookups in-process.
+# Misses are not cached: the CLI may seed the table while a GUI is running.
+loinc_name_cache   = LRUCache(maxsize=8192)    # loinc_num -> common_name
+loinc_search_cache = LRUCache(maxsize=1024)    # (normalised text, limit) -> matches
+
+def invalidate_loinc_cache() -> None:
+    """Forget cached LOINC lookups; call after the loinc table is reloaded."""
+    loinc_name_cache.clear()
+    loinc_search_cache.clear()
+
+async def search_loinc_by_name(db: AsyncSession, test_name: str, limit: int = 10) -> List[Tuple[str, str]]:
+    """
+    Returns up to `limit` (loinc_num, common_name) pairs matching test_name,
+    best match first (bm25 rank, then shorter names, then code).
+    """
+    query = _fts_query(test_name)
+    if query is None:
+        return []
+    key = (query, limit)
+    cached = loinc_search_cache.get(key)
+    if cached is not MISSING:
+        return list(cached)
+    try:
+        rows = await db.execute(
+            text(
+                "SELECT loinc_num, common_name FROM loinc_fts "
+                "WHERE loinc_fts MATCH :query "
+                "ORDER BY rank, length(common_name), loinc_num "
+                "LIMIT :limit"
+            ),
+            {"query": query, "limit": limit}
+        )
+    except OperationalError:
+        # Search index not created yet (schema not upgraded): fall back to a scan
+        rows = await db.execute(
+            select(models.Loinc.loinc_num, models.Loinc.common_name)
+            .where(models.Loinc.common_name.ilike(f"%{test_name}%"))
+            .order_by(func.length(models.Loinc.common_name), models.Loinc.loinc_num)
+            .limit(limit)
+        )
+    matches = [(code, name) for code, name in rows]
+    if matches:
+        loinc_search_cache.put(key, tuple(matches))
+    for code, name in matches:
+        loinc_name_cache.put(code, name)
+    return matches
 
 async def get_loinc_code_by_name(db: AsyncSession, test_name: str) -> Optional[str]:
-    row = (await db.scalars(
-        select(models.Loinc).where(models.Loinc.common_name.ilike(f"%{test_name}%"))
-    )).first()
-    return row.loinc_num if row else None
+    matches = await search_loinc_by_name(db, test_name, limit=1)
+    return matches[0][0] if matches else None
+
+# Folded full name -> column values of the patients with that name. Misses are
+# not cached: a patient added by another process (the CLI, the importer) must be found.
+patient_name_cache = LRUCache(maxsize=4096)
+_PATIENT_COLUMNS = tuple(column.key for column in models.Patient.__table__.columns)
+
+def _forget_patient_names(patients) -> None:
+    for data in patients:
+        patient_name_cache.pop(models.fold_name(f"{data.first_name} {data.last_name}"))
 
 async def create_patient(db: AsyncSession, data: schemas.PatientCreate) -> models.Patient:
     p = models.Patient(**data.dict())
     db.add(p)
     await db.commit()
     await db.refresh(p)
+    _forget_patient_names([data])
     return p
 
+async def find_patients_by_name(db: AsyncSession, patient_name: str) -> List[models.Patient]:
+    """
+    All patients called patient_name ("First Last", any case, accents or
+    spacing), lowest ID first. Answered from the name index, then the cache.
+    """
+    key = models.fold_name(patient_name)
+    if not key:
+        return []
+    rows = patient_name_cache.get(key)
+    if rows is MISSING:
+        P = models.Patient
+        patients = (await db.scalars(
+            select(P).where(P.name_key == key).order_by(P.patient_id)
+        )).all()
+        if patients:
+            patient_name_cache.put(key, tuple(
+                tuple(getattr(p, column) for column in _PATIENT_COLUMNS) for p in patients
+            ))
+        return list(patients)
+    # Rebuilt from the cached columns; merge(load=False) attaches them without a
+    # SELECT, or returns the instance the session already holds
+    patients = []
+    for row in rows:
+        p = models.Patient(**dict(zip(_PATIENT_COLUMNS, row)))
+        make_transient_to_detached(p)
+        patients.append(await db.merge(p, load=False))
+    return patients
+
+async def find_patient_by_name(db: AsyncSession, patient_name: str) -> Optional[models.Patient]:
+    """First (lowest ID) patient called patient_name, or None."""
+    patients = await find_patients_by_name(db, patient_name)
+    return patients[0] if patients else None
+
+async def count_patients(db: AsyncSession) -> int:
+    return await db.scalar(select(func.count()).select_from(models.Patient))
+
+async def list_patients(db: AsyncSession, offset: int = 0, limit: Optional[int] = None) -> List[models.Patient]:
+    stmt = select(models.Patient).order_by(models.Patient.patient_id).offset(offset)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return (await db.scalars(stmt)).all()
+
 async def create_observation(db: AsyncSession, data: schemas.ObservationCreate) -> models.Observation:
     o = models.Observation(
         patient_id  = data.patient_id,
@@ -32,34 +144,235 @@ async def create_observation(db: AsyncSession, data: schemas.ObservationCreate)
         value_num   = data.value_num,
         valid_start = data.start,
         valid_end   = data.end,
-        txn_start   = datetime.utcnow(),
+        txn_start   = data.txn_start or datetime.utcnow(),
         txn_end     = None
     )
     db.add(o)
+    await db.flush()
+    await sync_state_intervals(db, [o.obs_id])
+    _forget_recommendations(db, [(o.patient_id, o.loinc_num)])
     await db.commit()
     await db.refresh(o)
     return o
 
-async def observations_history(
+# Rows per INSERT ... RETURNING statement in bulk ingestion
+OBSERVATION_CHUNK_SIZE = 5000
+
+async def _chunked(items, size: int):
+    """Groups a sync or async iterable into lists of at most `size` items."""
+    chunk = []
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            chunk.append(item)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    else:
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+async def create_observations_bulk(
     db: AsyncSession,
+    observations,
+    chunk_size: int = OBSERVATION_CHUNK_SIZE,
+    commit: bool = True,
+    collect_ids: bool = True
+) -> List[int]:
+    """
+    Inserts an iterable (or async iterable) of ObservationCreate in chunks of
+    executemany INSERT ... RETURNING, committing once at the end (unless
+    commit=False, leaving the transaction to the caller).
+    Returns the assigned obs_ids in input order; with collect_ids=False they
+    are dropped after each chunk and [] is returned, so memory stays bounded
+    by chunk_size however long the input is.
+    """
+    # Core insert on the table: skips per-row ORM bookkeeping
+    table = models.Observation.__table__
+    stmt = insert(table).returning(table.c.obs_id)
+    txn_start = datetime.utcnow()
+    obs_ids = []
+    try:
+        async for chunk in _chunked(observations, chunk_size):
+            rows = [
+                {
+                    "patient_id":  data.patient_id,
+                    "loinc_num":   data.loinc_num,
+                    "value_num":   data.value_num,
+                    "valid_start": data.start,
+                    "valid_end":   data.end,
+                    "txn_start":   data.txn_start or txn_start,
+                    "txn_end":     None,
+                }
+                for data in chunk
+            ]
+            # SQLite hands out increasing rowids within a statement, so sorting
+            # restores input order far cheaper than sort_by_parameter_order
+            chunk_ids = sorted(await db.scalars(stmt, rows))
+            if collect_ids:
+                obs_ids.extend(chunk_ids)
+            await sync_state_intervals(db, [
+                obs_id for obs_id, data in zip(chunk_ids, chunk) if data.loinc_num in STATE_LOINCS
+            ])
+            _forget_recommendations(db, [(data.patient_id, data.loinc_num) for data in chunk])
+        if commit:
+            await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    return obs_ids
+
+# Keeps IN (...) lists well under SQLite's bound-parameter limit
+IN_CLAUSE_CHUNK = 900
+
+async def create_patients_bulk(
+    db: AsyncSession,
+    patients,
+    chunk_size: int = OBSERVATION_CHUNK_SIZE,
+    commit: bool = True
+) -> List[int]:
+    """
+    Bulk counterpart of create_patient for an iterable (or async iterable) of
+    PatientCreate. Returns the assigned patient_ids in input order.
+    """
+    table = models.Patient.__table__
+    stmt = insert(table).returning(table.c.patient_id)
+    patient_ids = []
+    try:
+        async for chunk in _chunked(patients, chunk_size):
+            rows = [data.dict() for data in chunk]
+            patient_ids.extend(sorted(await db.scalars(stmt, rows)))
+            _forget_patient_names(chunk)
+        if commit:
+            await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    return patient_ids
+
+async def close_superseded_versions(db: AsyncSession, patient_ids) -> int:
+    """
+    For the given patients, ends every current version that has a later
+    recording of the same (LOINC, valid_start): txn_end becomes the next
+    txn_start. Used after loading historical corrections. Does not commit.
+    """
+    O = models.Observation
+    ids = sorted(set(patient_ids))
+    closed = 0
+    for i in range(0, len(ids), IN_CLAUSE_CHUNK):
+        # One ordered pass per chunk instead of a correlated subquery per row
+        versions = (
+            select(
+                O.obs_id,
+                O.patient_id,
+                O.loinc_num,
+                O.txn_start,
+                O.txn_end,
+                func.lead(O.txn_start, type_=O.txn_start.type).over(
+                    partition_by=(O.patient_id, O.loinc_num, O.valid_start),
+                    order_by=(O.txn_start, O.obs_id)
+                ).label("next_txn")
+            )
+            .where(O.patient_id.in_(ids[i:i + IN_CLAUSE_CHUNK]))
+            .subquery()
+        )
+        rows = (await db.execute(
+            select(versions.c.obs_id, versions.c.next_txn, versions.c.patient_id, versions.c.loinc_num)
+            .where(versions.c.txn_end == None)
+            .where(versions.c.next_txn > versions.c.txn_start)
+        )).all()
+        updates = [{"obs_id": obs_id, "txn_end": next_txn} for obs_id, next_txn, _, _ in rows]
+        if updates:
+            await db.execute(update(O), updates)
+            await sync_state_intervals(db, [u["obs_id"] for u in updates])
+            _forget_recommendations(db, [(pid, loinc) for _, _, pid, loinc in rows])
+        closed += len(updates)
+    return closed
+
+def known_at(as_of: Optional[datetime] = None):
+    """
+    Transaction-time filter: the versions the database held at as_of
+    (txn_start <= as_of < txn_end), or the current versions when as_of is None.
+    """
+    O = models.Observation
+    if as_of is None:
+        return O.txn_end == None
+    return and_(O.txn_start <= as_of, or_(O.txn_end == None, O.txn_end > as_of))
+
+def _history_stmt(
     patient_id: int,
     loinc: str,
     since: datetime,
-    until: datetime
-) -> List[models.Observation]:
-    stmt = (
-        select(models.Observation)
-        .where(models.Observation.patient_id == patient_id)
-        .where(models.Observation.loinc_num    == loinc)
-        .where(models.Observation.txn_end      == None)
-        .where(models.Observation.valid_start <= until)
+    until: datetime,
+    as_of: Optional[datetime] = None
+):
+    O = models.Observation
+    return (
+        select(O)
+        .where(O.patient_id == patient_id)
+        .where(O.loinc_num  == loinc)
+        .where(known_at(as_of))
+        .where(O.valid_start <= until)
         .where(or_(
-            models.Observation.valid_end == None,
-            models.Observation.valid_end >= since
+            O.valid_end == None,
+            O.valid_end >= since
         ))
-        .order_by(models.Observation.valid_start)
+        # obs_id breaks ties so the order is total (needed for keyset paging)
+        .order_by(O.valid_start, O.obs_id)
     )
-    return (await db.scalars(stmt)).all()
+
+async def observations_history(
+    db: AsyncSession,
+    patient_id: int,
+    loinc: str,
+    since: datetime,
+    until: datetime,
+    as_of: Optional[datetime] = None
+) -> List[models.Observation]:
+    """Observations valid in [since, until], as known at as_of (default: now)."""
+    return (await db.scalars(_history_stmt(patient_id, loinc, since, until, as_of))).all()
+
+# Rows per keyset page, and per fetch within a page, when streaming a history
+HISTORY_PAGE_SIZE  = 2000
+HISTORY_FETCH_SIZE = 100
+
+async def stream_observations_history(
+    db: AsyncSession,
+    patient_id: int,
+    loinc: str,
+    since: datetime,
+    until: datetime,
+    as_of: Optional[datetime] = None,
+    page_size: int = HISTORY_PAGE_SIZE
+) -> AsyncIterator[models.Observation]:
+    """
+    Yields the rows of observations_history one at a time, in the same order.
+    Pages are keyset-paginated on (valid_start, obs_id) and streamed, so the
+    first rows arrive at once and memory does not grow with the history.
+    """
+    O = models.Observation
+    stmt = _history_stmt(patient_id, loinc, since, until, as_of).limit(page_size)
+    last = None
+    while True:
+        page = stmt if last is None else stmt.where(tuple_(O.valid_start, O.obs_id) > last)
+        count = 0
+        result = await db.stream_scalars(page)
+        try:
+            # Partitions: one round trip to the driver per batch, not per row
+            async for rows in result.partitions(HISTORY_FETCH_SIZE):
+                for o in rows:
+                    count += 1
+                    last = (o.valid_start, o.obs_id)
+                    yield o
+        finally:
+            # Also reached when the caller stops early
+            await result.close()
+        if count < page_size:
+            return
 
 async def update_observation_value(
     db: AsyncSession,
@@ -70,6 +383,9 @@ async def update_observation_value(
     if not old:
         return None
     old.txn_end = datetime.utcnow()
+    await db.flush()
+    await sync_state_intervals(db, [old.obs_id])
+    _forget_recommendations(db, [(old.patient_id, old.loinc_num)])
     await db.commit()
 
     new = models.Observation(
@@ -82,11 +398,174 @@ async def update_observation_value(
         txn_end     = None
     )
     db.add(new)
+    await db.flush()
+    await sync_state_intervals(db, [new.obs_id])
     await db.commit()
     await db.refresh(new)
     return new
 
-from datetime import timedelta
+# Corrections matched per statement (5 bound parameters each)
+CORRECTION_CHUNK_SIZE = 500
+
+async def _correction_targets(db: AsyncSession, corrections) -> Dict[int, List[int]]:
+    """
+    Maps item index -> obs_ids of the current versions each correction may apply
+    to, best match first, matching every item of a chunk in one statement.
+    Timed items get the versions measured within a second of measured_at; items
+    with measured_at=None get the latest ones, one more than the deletes in the
+    batch on that measurement, so they can step past versions deleted before them.
+    """
+    O = models.Observation
+    deletes = {}
+    latest = {}             # (patient_id, loinc_num) -> indexes of its measured_at=None items
+    requests = []
+    for idx, c in enumerate(corrections):
+        key = (c.patient_id, c.loinc_num)
+        if c.new_value is None:
+            deletes[key] = deletes.get(key, 0) + 1
+        if c.measured_at is None:
+            latest.setdefault(key, []).append(idx)
+        else:
+            # Same one-second tolerance as the interactive editor
+            requests.append((idx, c.patient_id, c.loinc_num,
+                             c.measured_at, c.measured_at + timedelta(seconds=1), None))
+    # One request per measurement for its "latest" items, keyed by the first of them
+    for key, indexes in latest.items():
+        requests.append((indexes[0], *key, None, None, deletes.get(key, 0) + 1))
+
+    found = {}
+    for first in range(0, len(requests), CORRECTION_CHUNK_SIZE):
+        req = sa_values(
+            column("idx", Integer),
+            column("patient_id", Integer),
+            column("loinc_num", String),
+            column("measured_from", DateTime),
+            column("measured_to", DateTime),
+            column("depth", Integer),
+            name="req"
+        ).data(requests[first:first + CORRECTION_CHUNK_SIZE]).cte("req")
+        # (a CTE: SQLite has no column aliases on a VALUES subquery)
+        ranked = (
+            select(
+                req.c.idx,
+                req.c.depth,
+                O.obs_id,
+                func.row_number().over(
+                    partition_by=req.c.idx,
+                    order_by=(O.valid_start.desc(), O.txn_start.desc(), O.obs_id.desc())
+                ).label("rn")
+            )
+            .select_from(req)
+            .join(O, and_(
+                O.patient_id == req.c.patient_id,
+                O.loinc_num == req.c.loinc_num,
+                O.txn_end == None,
+                or_(
+                    req.c.measured_from == None,
+                    O.valid_start.between(req.c.measured_from, req.c.measured_to)
+                )
+            ))
+            .subquery()
+        )
+        rows = await db.execute(
+            select(ranked.c.idx, ranked.c.obs_id)
+            .where(or_(ranked.c.depth == None, ranked.c.rn <= ranked.c.depth))
+            .order_by(ranked.c.idx, ranked.c.rn)
+        )
+        for idx, obs_id in rows:
+            found.setdefault(idx, []).append(obs_id)
+
+    for indexes in latest.values():
+        if indexes[0] in found:
+            found.update((idx, found[indexes[0]]) for idx in indexes[1:])
+    return found
+
+async def apply_corrections(db: AsyncSession, corrections) -> List[dict]:
+    """
+    Applies a batch of ObservationCorrection atomically: one transaction, one
+    matching pass, one bulk close of old versions and one bulk insert of new ones.
+    Items hitting the same measurement are applied in input order, as if one by one.
+
+    Returns one dict per item: {"status": "updated" | "deleted" | "not_found",
+    "old_id": closed obs_id or None, "new_id": inserted obs_id or None}.
+    """
+    O = models.Observation
+    corrections = list(corrections)
+    results = [{"status": "not_found", "old_id": None, "new_id": None} for _ in corrections]
+    if not corrections:
+        return results
+
+    try:
+        # Resolve in input order: an item whose best match was deleted earlier
+        # in the batch falls through to the next one, as it would one by one
+        candidates = await _correction_targets(db, corrections)
+        chains, deleted = {}, set()
+        for idx in sorted(candidates):
+            target = next((obs_id for obs_id in candidates[idx] if obs_id not in deleted), None)
+            if target is None:
+                continue
+            chains.setdefault(target, []).append(idx)
+            if corrections[idx].new_value is None:
+                deleted.add(target)
+
+        versions = {}
+        target_ids = list(chains)
+        for i in range(0, len(target_ids), IN_CLAUSE_CHUNK):
+            rows = await db.execute(
+                select(O.obs_id, O.patient_id, O.loinc_num, O.valid_start, O.valid_end)
+                .where(O.obs_id.in_(target_ids[i:i + IN_CLAUSE_CHUNK]))
+            )
+            versions.update({row.obs_id: row for row in rows})
+
+        closes, inserts, insert_owner = [], [], []
+        for obs_id, items in chains.items():
+            old = versions[obs_id]
+            pending = None          # index in `inserts` of the version being replaced
+            # A delete, if any, ends the chain: later items resolved elsewhere
+            for idx in items:
+                c = corrections[idx]
+                if pending is None:
+                    closes.append({"obs_id": obs_id, "txn_end": c.txn_at})
+                    results[idx]["old_id"] = obs_id
+                else:
+                    # Replacing a version inserted earlier in this batch
+                    inserts[pending]["txn_end"] = c.txn_at
+                    results[idx]["old_id"] = ("pending", pending)
+                if c.new_value is None:
+                    results[idx]["status"] = "deleted"
+                    continue
+                inserts.append({
+                    "patient_id":  old.patient_id,
+                    "loinc_num":   old.loinc_num,
+                    "value_num":   c.new_value,
+                    "valid_start": old.valid_start,
+                    "valid_end":   old.valid_end,
+                    "txn_start":   c.txn_at,
+                    "txn_end":     None,
+                })
+                insert_owner.append(idx)
+                pending = len(inserts) - 1
+                results[idx]["status"] = "updated"
+
+        new_ids = []
+        if closes:
+            await db.execute(update(O), closes)
+        if inserts:
+            table = O.__table__
+            new_ids = sorted(await db.scalars(insert(table).returning(table.c.obs_id), inserts))
+            for pos, idx in enumerate(insert_owner):
+                results[idx]["new_id"] = new_ids[pos]
+            for r in results:
+                if isinstance(r["old_id"], tuple):
+                    r["old_id"] = new_ids[r["old_id"][1]]
+        await sync_state_intervals(db, [c["obs_id"] for c in closes] + new_ids)
+        _forget_recommendations(db, [(versions[obs_id].patient_id, versions[obs_id].loinc_num) for obs_id in chains])
+
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    return results
 
 async def retroactive_update(
     db: AsyncSession,
@@ -96,51 +575,21 @@ async def retroactive_update(
     txn_at: datetime,
     new_value: float
 ) -> List[models.Observation]:
-    first, last = patient_name.split(maxsplit=1)
-
-    p = (await db.scalars(
-        select(models.Patient)
-        .where(and_(
-            models.Patient.first_name == first,
-            models.Patient.last_name == last
-        ))
-    )).first()
+    p = await find_patient_by_name(db, patient_name)
     if not p:
         return []
 
-    # חיפוש תצפית בטווח זמן של שנייה
-    old = (await db.scalars(
-        select(models.Observation)
-        .where(models.Observation.patient_id == p.patient_id)
-        .where(models.Observation.loinc_num == loinc_code)
-        .where(models.Observation.valid_start.between(measured_at, measured_at + timedelta(seconds=1)))
-        .order_by(desc(models.Observation.txn_start))
-        .limit(1)
-    )).first()
-
-    if not old:
+    result, = await apply_corrections(db, [schemas.ObservationCorrection(
+        patient_id=p.patient_id, loinc_num=loinc_code,
+        measured_at=measured_at, txn_at=txn_at, new_value=new_value
+    )])
+    if result["status"] != "updated":
         return []
-
-    old.txn_end = txn_at
-    await db.commit()
-
-    new = models.Observation(
-        patient_id  = old.patient_id,
-        loinc_num   = old.loinc_num,
-        value_num   = new_value,
-        valid_start = old.valid_start,
-        valid_end   = old.valid_end,
-        txn_start   = txn_at,
-        txn_end     = None
-    )
-    db.add(new)
-    await db.commit()
-    await db.refresh(new)
+    old = await db.get(models.Observation, result["old_id"], populate_existing=True)
+    new = await db.get(models.Observation, result["new_id"])
     return [old, new]
 
 
-from datetime import timedelta
-
 async def retroactive_delete(
     db: AsyncSession,
     patient_name: str,
@@ -148,68 +597,96 @@ async def retroactive_delete(
     delete_at: datetime,
     measured_at: Optional[datetime] = None
 ) -> List[models.Observation]:
-    first, last = patient_name.split(maxsplit=1)
-
-    p = (await db.scalars(
-        select(models.Patient)
-        .where(and_(
-            models.Patient.first_name == first,
-            models.Patient.last_name == last
-        ))
-    )).first()
+    p = await find_patient_by_name(db, patient_name)
     if not p:
         return []
 
-    base = select(models.Observation).where(
-        models.Observation.patient_id == p.patient_id,
-        models.Observation.loinc_num == loinc_code,
-        models.Observation.txn_end == None
-    )
-
-    old = (await db.scalars(base.order_by(desc(models.Observation.valid_start)).limit(1))).first()
-    if not old:
+    result, = await apply_corrections(db, [schemas.ObservationCorrection(
+        patient_id=p.patient_id, loinc_num=loinc_code,
+        measured_at=measured_at, txn_at=delete_at, new_value=None
+    )])
+    if result["status"] != "deleted":
         return []
-
-    old.txn_end = delete_at
-    await db.commit()
-    return [old]
+    return [await db.get(models.Observation, result["old_id"], populate_existing=True)]
 
 
 async def get_loinc_name(db: AsyncSession, loinc_code: str) -> Optional[str]:
-    lo = (await db.scalars(
-            select(models.Loinc).where(models.Loinc.loinc_num==loinc_code)
-          )).first()
-    return lo.common_name if lo else None
+    cached = loinc_name_cache.get(loinc_code)
+    if cached is not MISSING:
+        return cached
+    name = await db.scalar(
+        select(models.Loinc.common_name).where(models.Loinc.loinc_num == loinc_code)
+    )
+    if name is not None:
+        loinc_name_cache.put(loinc_code, name)
+    return name
 
 
-from app.knowledge_base import hemoglobin_state, hematological_state, treatment_rules
+from app.knowledge_base import compiled_kb, revalidate_kb
+from app.kb_tables import TOXICITY_GRADES
 
 def get_hemoglobin_state(gender: str, value: float) -> str:
-    for low, high, label, _, _ in hemoglobin_state[gender]:
-        if low <= value < high:
-            return label
-    return "Unknown"
+    return compiled_kb().hemoglobin_label(gender, value)
 
 def get_hematological_state(gender: str, h_value: float, wbc_value: float) -> str:
-    for h_range, wbc_map in hematological_state[gender].items():
-        if h_range[0] <= h_value < h_range[1]:
-            for wbc_range, label in wbc_map.items():
-                if wbc_range[0] <= wbc_value < wbc_range[1]:
-                    return label
-    return "Unknown"
+    return compiled_kb().hematological_label(gender, h_value, wbc_value)
 
 def get_treatment(gender: str, hemo_state: str, hema_state: str) -> list:
-    return treatment_rules.get(gender, {}).get((hemo_state, hema_state), ["No recommendation found"])
+    rules = compiled_kb().tables["treatment_rules"]
+    return rules.get(gender, {}).get((hemo_state, hema_state), ["No recommendation found"])
 
 # Define time validity windows
 GOOD_BEFORE = pd.Timedelta(days=1)
 GOOD_AFTER = pd.Timedelta(days=3)
 
+def infer_hemoglobin_intervals(obs_times, values, gender: str) -> pd.DataFrame:
+    """
+    Columnar infer_state_intervals for hemoglobin: obs_times and values are
+    equal-length arrays (NumPy, pandas or lists). Bands are found with one
+    np.searchsorted and the validity windows by vector arithmetic.
+    Returns a DataFrame with the interval dict keys as columns, in input order.
+    """
+    revalidate_kb()
+    bands = compiled_kb().hemoglobin_arrays[gender]
+    obs_times = pd.to_datetime(obs_times).to_numpy()
+    values = np.asarray(values, dtype=float)
+    idx = bands.bands(values)
+    return pd.DataFrame({
+        "state":    bands.labels[idx],
+        "start":    obs_times - bands.good_before[idx],
+        "end":      obs_times + bands.good_after[idx],
+        "value":    values,
+        "obs_time": obs_times,
+    })
+
+# State functions with a columnar counterpart taking (obs_times, values, gender)
+COLUMNAR_STATE_FUNCS = {
+    get_hemoglobin_state_with_timing: infer_hemoglobin_intervals,
+}
+
+def _pydatetimes(column: pd.Series) -> np.ndarray:
+    """Plain datetimes: datetime -/+ pd.Timedelta on the per-value path gives datetime, not Timestamp."""
+    return column.to_numpy(dtype="datetime64[us]").astype(object)
+
 def infer_state_intervals(observations: list, gender: str, state_func) -> list:
     """
     Given a list of (obs_time, value), return list of interval dicts
     using dynamic good_before and good_after per state.
+    State functions in COLUMNAR_STATE_FUNCS are applied to the whole list at once.
     """
+    columnar = COLUMNAR_STATE_FUNCS.get(state_func)
+    if columnar is not None:
+        observations = list(observations)
+        if not observations:
+            return []
+        frame = columnar([t for t, _ in observations], [v for _, v in observations], gender)
+        return [
+            {"state": state, "start": start, "end": end, "value": value, "obs_time": obs_time}
+            for state, start, end, (obs_time, value)
+            in zip(frame["state"].tolist(), _pydatetimes(frame["start"]), _pydatetimes(frame["end"]), observations)
+        ]
+
+    revalidate_kb()
     intervals = []
     for obs_time, value in observations:
         result = state_func(gender, value)
@@ -238,69 +715,489 @@ def filter_intervals_by_state(intervals: list, target_state: str) -> list:
     return [interval for interval in intervals if interval["state"] == target_state]
 
 
-from datetime import timedelta
+# LOINC codes feeding the treatment rules
+HEMOGLOBIN_LOINC = "718-7"
+WBC_LOINC        = "11218-5"
+FEVER_LOINC      = "8310-5"
+CHILLS_LOINC     = "75326-8"
+SKIN_LOINC       = "39106-0"
+ALLERGY_LOINC    = "69730-0"
+
+TREATMENT_LOINCS = (
+    HEMOGLOBIN_LOINC,
+    WBC_LOINC,
+    FEVER_LOINC,
+    CHILLS_LOINC,
+    SKIN_LOINC,
+    ALLERGY_LOINC,
+)
+
+
+# ── Materialized state intervals ────────────────────────────────────────────
+
+# Abstractions kept in state_intervals: name -> (LOINC, state function).
+# Each current observation of the LOINC owns one interval row.
+HEMOGLOBIN_ABSTRACTION = "hemoglobin_state"
+STATE_ABSTRACTIONS = {
+    HEMOGLOBIN_ABSTRACTION: (HEMOGLOBIN_LOINC, get_hemoglobin_state_with_timing),
+}
+STATE_LOINCS = {code for code, _ in STATE_ABSTRACTIONS.values()}
 
-async def get_current_treatment_at_time(db, patient_id: int, time_point: datetime):
+def state_intervals_fingerprint() -> str:
+    """Changes whenever the rules behind a materialized abstraction change."""
+    return hashlib.sha256(repr((
+        sorted(STATE_ABSTRACTIONS),
+        compiled_kb().tables["hemoglobin_state"],
+    )).encode()).hexdigest()
+
+def state_interval_rows(observations) -> List[dict]:
     """
-    Returns treatment recommendation for a patient at a given time, based on Hemoglobin state,
-    Hematological state, and Systemic Toxicity grade.
+    state_intervals rows, as infer_state_intervals would derive them, for
+    (obs_id, patient_id, loinc_num, valid_start, value_num, gender) tuples.
     """
-    from .models import Observation, Patient
-    from .knowledge_base import toxicity_rules, treatment_rules
-    from .crud import get_hemoglobin_state, get_hematological_state, get_toxicity_grade
+    revalidate_kb()
+    groups = {}     # (abstraction, gender) -> observations
+    for obs in observations:
+        _, _, loinc, _, _, gender = obs
+        for abstraction, (code, _) in STATE_ABSTRACTIONS.items():
+            if code == loinc:
+                key = (abstraction, "Male" if gender.upper() == "M" else "Female")
+                groups.setdefault(key, []).append(obs)
+
+    rows = []
+    for (abstraction, gender), group in groups.items():
+        state_func = STATE_ABSTRACTIONS[abstraction][1]
+        columnar = COLUMNAR_STATE_FUNCS.get(state_func)
+        if columnar is not None:
+            frame = columnar([o[3] for o in group], [o[4] for o in group], gender)
+            derived = zip(frame["state"].tolist(), _pydatetimes(frame["start"]), _pydatetimes(frame["end"]))
+        else:
+            derived = []
+            for o in group:
+                result = state_func(gender, o[4])
+                derived.append((
+                    result["state"],
+                    o[3] - result["good_before"].to_pytimedelta(),
+                    o[3] + result["good_after"].to_pytimedelta(),
+                ))
+        for (obs_id, patient_id, _, obs_time, value, _), (state, start, end) in zip(group, derived):
+            rows.append({
+                "patient_id":    patient_id,
+                "abstraction":   abstraction,
+                "state":         state,
+                "start":         start,
+                "end":           end,
+                "obs_time":      obs_time,
+                "value":         value,
+                "source_obs_id": obs_id,
+            })
+    return rows
+
+def state_interval_source_stmt():
+    """Current observations that feed a materialized abstraction, with the patient's gender."""
+    O, P = models.Observation, models.Patient
+    return (
+        select(O.obs_id, O.patient_id, O.loinc_num, O.valid_start, O.value_num, P.gender)
+        .join(P, P.patient_id == O.patient_id)
+        .where(O.txn_end == None)
+        .where(O.loinc_num.in_(sorted(STATE_LOINCS)))
+    )
+
+async def sync_state_intervals(db: AsyncSession, obs_ids) -> None:
+    """
+    Re-derives the intervals sourced from these observations, which were just
+    written or closed: their rows are dropped, and re-added for those still
+    current. Only the changed versions are touched. Does not commit.
+    """
+    table = models.StateInterval.__table__
+    ids = sorted(set(obs_ids))
+    touched = set()
+    for i in range(0, len(ids), IN_CLAUSE_CHUNK):
+        batch = ids[i:i + IN_CLAUSE_CHUNK]
+        dropped = await db.execute(
+            sa_delete(table).where(table.c.source_obs_id.in_(batch))
+            .returning(table.c.patient_id, table.c.abstraction)
+        )
+        touched.update(dropped.all())
+        rows = await db.execute(state_interval_source_stmt().where(models.Observation.obs_id.in_(batch)))
+        intervals = state_interval_rows(rows)
+        if intervals:
+            await db.execute(insert(table), intervals)
+            touched.update((row["patient_id"], row["abstraction"]) for row in intervals)
+    _forget_interval_trees(db, touched)
+
+# (patient_id, abstraction) -> IntervalTree of that patient's materialized intervals
+state_interval_trees = LRUCache(maxsize=512)
+
+# Caches keyed by (patient_id, ...) that writes from other processes invalidate
+_patient_caches = [state_interval_trees]
+
+# Highest data_versions.version whose changes this process's caches reflect
+_seen_data_version = None
+
+async def _catch_up_on_writes(db: AsyncSession) -> int:
+    """
+    Drops cached results of patients whose data changed since the last call,
+    whichever process wrote it (see models.DataVersion). Returns the version
+    in db's snapshot: a result read there may be cached only while it still
+    equals _seen_data_version, i.e. no newer change has been seen meanwhile.
+    """
+    global _seen_data_version
+    DV = models.DataVersion
+    current = (await db.execute(select(func.max(DV.version)))).scalar() or 0
+    seen = _seen_data_version
+    if seen is not None and current > seen:
+        changed = set((await db.execute(select(DV.patient_id).where(DV.version > seen))).scalars())
+        for cache in _patient_caches:
+            if models.ALL_PATIENTS in changed:
+                cache.clear()
+            else:
+                cache.discard_where(lambda key: key[0] in changed)
+    if seen is None or current > _seen_data_version:
+        _seen_data_version = current
+    return current
+
+# Session.info key collecting trees to drop again once the writing transaction commits
+_STALE_TREES = "stale_interval_trees"
+
+def _forget_interval_trees(db: AsyncSession, keys) -> None:
+    for key in keys:
+        state_interval_trees.pop(key)
+    # A reader may rebuild a tree from the old rows before this transaction commits
+    db.info.setdefault(_STALE_TREES, set()).update(keys)
+
+@event.listens_for(Session, "after_commit")
+def _forget_committed_interval_trees(session) -> None:
+    for key in session.info.pop(_STALE_TREES, ()):
+        state_interval_trees.pop(key)
+
+@event.listens_for(Session, "after_rollback")
+def _keep_interval_trees(session) -> None:
+    session.info.pop(_STALE_TREES, None)
+
+# KB fingerprint state_intervals was last checked against in this process
+_intervals_checked_for = None
+# Background task bringing state_intervals up to the current rules, if one was started
+state_intervals_rebuild: Optional[asyncio.Task] = None
+
+def _refresh_state_intervals_if_stale() -> None:
+    """
+    Once per KB version: drops this process's trees, built under the previous
+    rules, and starts rebuild_state_intervals_in_background. Reads meanwhile
+    see the stored intervals.
+    """
+    global _intervals_checked_for, state_intervals_rebuild
+    version = revalidate_kb()
+    if version == _intervals_checked_for:
+        return
+    _intervals_checked_for = version
+    state_interval_trees.clear()
+    # A pass already running may have checked the rules before they changed: queue another
+    state_intervals_rebuild = asyncio.get_running_loop().create_task(
+        rebuild_state_intervals_in_background(after=state_intervals_rebuild)
+    )
+
+async def rebuild_state_intervals_in_background(after: Optional[asyncio.Task] = None) -> None:
+    """
+    Brings state_intervals up to the current rules, STATE_INTERVALS_REBUILD_PATIENTS
+    patients per transaction, so reads and writes carry on between batches and
+    each patient's intervals are either all old or all new. The rules
+    fingerprint is recorded once every batch is in; a rules change meanwhile
+    starts another pass. A no-op when the stored intervals are current.
+    Waits for the `after` task first, so passes never overlap.
+    """
+    global _intervals_checked_for
+    from app import schema
+    from app.database import SessionLocal
+    if after is not None and not after.done():
+        await asyncio.gather(after, return_exceptions=True)
+    try:
+        async with SessionLocal() as db:
+            while True:
+                fingerprint = state_intervals_fingerprint()
+                stored = await db.run_sync(lambda s: schema.stored_state_intervals_fingerprint(s.connection()))
+                await db.commit()
+                if stored == fingerprint:
+                    return
+                last = 0
+                while True:
+                    span = await db.run_sync(lambda s, after=last: schema.next_patient_range(s.connection(), after))
+                    await db.commit()
+                    if span is None:
+                        break
+                    await db.run_sync(lambda s, span=span: schema.rebuild_state_intervals_between(s.connection(), *span))
+                    await db.commit()
+                    last = span[1]
+                await db.run_sync(lambda s: schema.record_state_intervals_fingerprint(s.connection(), fingerprint))
+                await db.commit()
+    except OperationalError as e:
+        # Locked out by another writer for longer than busy_timeout: the next read retries
+        _intervals_checked_for = None
+        print(f"state_intervals not rebuilt under the new rules yet, will retry: {e}", flush=True)
+    except asyncio.CancelledError:
+        _intervals_checked_for = None
+        raise
+
+async def state_interval_tree(
+    db: AsyncSession,
+    patient_id: int,
+    abstraction: str = HEMOGLOBIN_ABSTRACTION
+) -> IntervalTree:
+    """
+    IntervalTree over all of a patient's materialized intervals, in observation
+    order. Cached per patient; sync_state_intervals drops the trees it changes,
+    and writes by other processes are caught by _catch_up_on_writes.
+    """
+    _refresh_state_intervals_if_stale()
+    version = await _catch_up_on_writes(db)
+    key = (patient_id, abstraction)
+    tree = state_interval_trees.get(key)
+    if tree is MISSING:
+        SI = models.StateInterval
+        rows = await db.execute(
+            select(SI.state, SI.start, SI.end, SI.value, SI.obs_time)
+            .where(SI.patient_id == patient_id)
+            .where(SI.abstraction == abstraction)
+            .order_by(SI.obs_time, SI.source_obs_id)
+        )
+        tree = IntervalTree(dict(row._mapping) for row in rows)
+        if version == _seen_data_version:
+            state_interval_trees.put(key, tree)
+    return tree
+
+def _hemoglobin_max_span() -> timedelta:
+    return timedelta(days=max(
+        before + after
+        for rows in compiled_kb().tables["hemoglobin_state"].values()
+        for *_, before, after in rows
+    ))
+
+# Longest interval each abstraction can produce. An interval that ends after A
+# starts after A - span, which bounds the index range a population query reads.
+STATE_MAX_SPAN = {
+    HEMOGLOBIN_ABSTRACTION: _hemoglobin_max_span,
+}
+
+def _covered(intervals, since: datetime, until: datetime) -> timedelta:
+    """Length of [since, until] covered by (start, end) pairs sorted by start; overlaps count once."""
+    covered = timedelta(0)
+    run_start = run_end = None
+    for start, end in intervals:
+        start, end = max(start, since), min(end, until)
+        if run_end is None or start > run_end:
+            if run_end is not None:
+                covered += run_end - run_start
+            run_start, run_end = start, end
+        elif end > run_end:
+            run_end = end
+    if run_end is not None:
+        covered += run_end - run_start
+    return covered
+
+async def patients_in_state(
+    db: AsyncSession,
+    state: str,
+    since: datetime,
+    until: datetime,
+    min_overlap: timedelta = timedelta(0),
+    abstraction: str = HEMOGLOBIN_ABSTRACTION
+) -> List[dict]:
+    """
+    Patients in `state` at any time in [since, until], read from the population
+    index of state_intervals. With min_overlap, only patients whose intervals in
+    that state cover at least that much of the window.
+    Returns [{"patient_id", "name", "overlap", "first_start", "last_end", "intervals"}]
+    ordered by patient_id.
+    """
+    _refresh_state_intervals_if_stale()
+    SI = models.StateInterval
+    rows = await db.execute(
+        select(SI.patient_id, SI.start, SI.end)
+        .where(SI.abstraction == abstraction)
+        .where(SI.state == state)
+        .where(SI.start.between(since - STATE_MAX_SPAN[abstraction](), until))
+        .where(SI.end >= since)
+        .order_by(SI.start)
+    )
+    by_patient = {}
+    for pid, start, end in rows:
+        by_patient.setdefault(pid, []).append((start, end))
+
+    matches = []
+    for pid in sorted(by_patient):
+        intervals = by_patient[pid]
+        overlap = _covered(intervals, since, until)
+        if overlap >= min_overlap:
+            matches.append({
+                "patient_id":  pid,
+                "name":        None,
+                "overlap":     overlap,
+                "first_start": intervals[0][0],
+                "last_end":    max(end for _, end in intervals),
+                "intervals":   len(intervals),
+            })
+
+    P = models.Patient
+    for i in range(0, len(matches), IN_CLAUSE_CHUNK):
+        batch = matches[i:i + IN_CLAUSE_CHUNK]
+        names = dict((await db.execute(
+            select(P.patient_id, P.first_name + " " + P.last_name)
+            .where(P.patient_id.in_([m["patient_id"] for m in batch]))
+        )).all())
+        for m in batch:
+            m["name"] = names.get(m["patient_id"])
+    return matches
+
+async def get_state_intervals(
+    db: AsyncSession,
+    patient_id: int,
+    since: datetime,
+    until: datetime,
+    state: Optional[str] = None,
+    abstraction: str = HEMOGLOBIN_ABSTRACTION
+) -> List[dict]:
+    """
+    Materialized intervals overlapping [since, until], optionally in one state,
+    in observation order. Same dict keys as infer_state_intervals.
+    """
+    tree = await state_interval_tree(db, patient_id, abstraction)
+    if state is not None:
+        tree = tree.for_state(state)
+    return [dict(interval) for interval in tree.overlapping(since, until)]
+
+async def get_states_at(
+    db: AsyncSession,
+    patient_id: int,
+    time_point: datetime,
+    abstraction: str = HEMOGLOBIN_ABSTRACTION
+) -> List[dict]:
+    """Materialized intervals containing time_point, in observation order."""
+    tree = await state_interval_tree(db, patient_id, abstraction)
+    return [dict(interval) for interval in tree.at(time_point)]
+
+async def get_nearest_state_intervals(
+    db: AsyncSession,
+    patient_id: int,
+    time_point: datetime,
+    abstraction: str = HEMOGLOBIN_ABSTRACTION
+) -> List[dict]:
+    """
+    The patient's intervals closest to time_point: those containing it, or else
+    the nearest one before or after it. Empty when the patient has none.
+    """
+    tree = await state_interval_tree(db, patient_id, abstraction)
+    return [dict(interval) for interval in tree.nearest(time_point)]
 
-    # 1. Get patient
-    patient = await db.get(Patient, patient_id)
-    if not patient:
-        return "Patient not found"
-    gender = "Male" if patient.gender.upper() == "M" else "Female"
 
-    # Helper to retrieve latest numeric observation for a LOINC code
-    async def latest_numeric_value(loinc):
-        res = await db.execute(
-            select(Observation)
-            .where(Observation.patient_id == patient_id)
-            .where(Observation.loinc_num == loinc)
-            .where(Observation.valid_start <= time_point)
-            .where((Observation.valid_end == None) | (Observation.valid_end >= time_point))
-            .order_by(Observation.valid_start.desc())
+def _latest_values_stmt(loinc_codes, time_point: Optional[datetime], patient_ids=None, as_of=None):
+    """
+    Latest observation per (patient, LOINC) valid at time_point (or overall when
+    time_point is None) as known at as_of (default: current versions), ranked
+    with a window function so every value comes back in one statement.
+    """
+    O = models.Observation
+    ranked = (
+        select(
+            O.patient_id,
+            O.loinc_num,
+            O.value_num,
+            func.row_number().over(
+                partition_by=(O.patient_id, O.loinc_num),
+                order_by=(O.valid_start.desc(), O.obs_id.desc())
+            ).label("rn")
+        )
+        .where(O.loinc_num.in_(list(loinc_codes)))
+        .where(known_at(as_of))
+    )
+    if time_point is not None:
+        ranked = (
+            ranked
+            .where(O.valid_start <= time_point)
+            .where(or_(O.valid_end == None, O.valid_end >= time_point))
         )
-        obs = res.scalars().first()
-        return obs.value_num if obs else None
+    if patient_ids is not None:
+        ranked = ranked.where(O.patient_id.in_(list(patient_ids)))
+    ranked = ranked.subquery()
+    return (
+        select(ranked.c.patient_id, ranked.c.loinc_num, ranked.c.value_num)
+        .where(ranked.c.rn == 1)
+    )
+
+
+async def latest_values_at_time(
+    db: AsyncSession,
+    patient_id: int,
+    loinc_codes,
+    time_point: datetime,
+    as_of: Optional[datetime] = None
+) -> Dict[str, float]:
+    """
+    Returns {loinc: value} with the latest observation valid at time_point
+    for every requested LOINC code, fetched in a single statement.
+    as_of answers from what the database knew at that transaction time.
+    """
+    rows = await db.execute(_latest_values_stmt(loinc_codes, time_point, [patient_id], as_of))
+    return {loinc: value for _, loinc, value in rows}
 
-    # 2. Get Hemoglobin and WBC
-    h_value = await latest_numeric_value("718-7")      # Hemoglobin
-    w_value = await latest_numeric_value("11218-5")     # WBC
 
-    # 3. Get Toxicity-related observations
-    fever     = await latest_numeric_value("8310-5")    # Temperature
-    chills    = await latest_numeric_value("75326-8")   # Chills (code to label)
-    skin      = await latest_numeric_value("39106-0")   # Skin-look (code to label)
-    allergy   = await latest_numeric_value("69730-0")   # Allergic-state (code to label)
+async def latest_values_for_patients(
+    db: AsyncSession,
+    patient_ids,
+    loinc_codes,
+    time_point: Optional[datetime] = None,
+    as_of: Optional[datetime] = None
+) -> Dict[int, Dict[str, float]]:
+    """
+    Same as latest_values_at_time for a group of patients: {patient_id: {loinc: value}}.
+    Without time_point the latest value is returned regardless of validity.
+    """
+    values = {}
+    rows = await db.execute(_latest_values_stmt(loinc_codes, time_point, patient_ids, as_of))
+    for pid, loinc, value in rows:
+        values.setdefault(pid, {})[loinc] = value
+    return values
+
 
-    # 4. Translate toxicity codes to labels
-    chills_map = {0: "None", 1: "Shaking", 2: "Rigor"}
-    skin_map   = {0: "Erythema", 1: "Vesiculation", 2: "Desquamation", 3: "Exfoliation"}
-    allergy_map= {0: "Edema", 1: "Bronchospasm", 2: "Severe-Bronchospasm", 3: "Anaphylactic-Shock"}
+def evaluate_treatment(gender: str, values: Dict[str, float], tox_grade: Optional[str] = None):
+    """
+    Applies the KB to a snapshot of rule inputs ({loinc: value}).
+    tox_grade skips grading when the caller already graded a batch with grade_toxicity.
+    Returns the recommendation dict, or a message string when it cannot be made.
+    """
+    kb = compiled_kb()
+    codes = kb.tables["toxicity_codes"]
+    h_value = values.get(HEMOGLOBIN_LOINC)     # Hemoglobin
+    w_value = values.get(WBC_LOINC)            # WBC
+    fever   = values.get(FEVER_LOINC)          # Temperature
+    chills  = values.get(CHILLS_LOINC)         # Chills (code to label)
+    skin    = values.get(SKIN_LOINC)           # Skin-look (code to label)
+    allergy = values.get(ALLERGY_LOINC)        # Allergic-state (code to label)
 
+    # Translate toxicity codes to labels
     if chills is not None:
-        chills = chills_map.get(int(chills), "Unknown")
+        chills = codes["Chills"].get(int(chills), "Unknown")
     if skin is not None:
-        skin = skin_map.get(int(skin), "Unknown")
+        skin = codes["Skin-look"].get(int(skin), "Unknown")
     if allergy is not None:
-        allergy = allergy_map.get(int(allergy), "Unknown")
+        allergy = codes["Allergic-state"].get(int(allergy), "Unknown")
 
-    # 5. Check for missing data
+    # Check for missing data
     if None in (h_value, w_value, fever, chills, skin, allergy):
         return "Insufficient data (need hemoglobin, WBC, and toxicity parameters)."
 
-    # 6. Compute states
-    hemo_state = get_hemoglobin_state(gender, h_value)
-    hema_state = get_hematological_state(gender, h_value, w_value)
-    tox_grade  = get_toxicity_grade(fever, chills, skin, allergy)
+    # Compute states as codes, then index the compiled rule array
+    hemo = kb.hemoglobin_code(gender, h_value) if gender in kb.hemoglobin_code_bands else 0
+    hema = kb.hematological_code(gender, h_value, w_value) if gender in kb.hematological else 0
+    if tox_grade is None:
+        grade = kb.toxicity.grade(fever, chills, skin, allergy)
+    else:
+        grade = kb.grade_codes.get(tox_grade, 0)
+    hemo_state = kb.hemoglobin_states[hemo]
+    hema_state = kb.hematological_states[hema]
+    tox_grade = TOXICITY_GRADES[grade]
 
-    # 7. Lookup recommendation
-    treatment = treatment_rules.get(gender, {}).get((hemo_state, hema_state, tox_grade))
+    # Lookup recommendation
+    treatment = kb.treatment(gender, hemo, hema, grade)
     if not treatment:
         return f"No treatment rule found for {hemo_state} + {hema_state} + {tox_grade}"
 
@@ -308,57 +1205,135 @@ async def get_current_treatment_at_time(db, patient_id: int, time_point: datetim
         "gender": gender,
         "hemoglobin_value": h_value,
         "wbc_value": w_value,
+        "fever": fever,
+        "chills": chills,
+        "skin_look": skin,
+        "allergic_state": allergy,
         "hemoglobin_state": hemo_state,
         "hematological_state": hema_state,
         "toxicity_grade": tox_grade,
         "treatment": treatment
     }
 
-def get_toxicity_grade(fever: float, chills: str, skin_look: str, allergic_state: str) -> str:
-    """Returns Grade I–IV based on max severity across symptoms."""
 
-    # Map for output priority
-    grade_order = ["Grade I", "Grade II", "Grade III", "Grade IV"]
+# ── Treatment recommendation cache ──────────────────────────────────────────
 
-    max_grade_index = -1
+# (patient_id, time_point, as_of, KB version) -> get_current_treatment_at_time result
+recommendation_cache = LRUCache(maxsize=4096)
+_patient_caches.append(recommendation_cache)
 
-    # Fever rule
-    if fever >= 40.0:
-        max_grade_index = max(max_grade_index, grade_order.index("Grade IV"))
-    elif fever >= 40.0:
-        max_grade_index = max(max_grade_index, grade_order.index("Grade III"))
-    elif fever >= 38.5:
-        max_grade_index = max(max_grade_index, grade_order.index("Grade II"))
-    else:
-        max_grade_index = max(max_grade_index, grade_order.index("Grade I"))
+# Session.info key collecting patients to drop again once the writing transaction commits
+_STALE_RECOMMENDATIONS = "stale_recommendations"
 
-    # Chills rule
-    chills_map = {
-        "None": "Grade I",
-        "Shaking": "Grade II",
-        "Rigor": "Grade III"  # also Grade IV, but since III is enough for max()
-    }
-    if chills in chills_map:
-        max_grade_index = max(max_grade_index, grade_order.index(chills_map[chills]))
-
-    # Skin-look rule
-    skin_map = {
-        "Erythema": "Grade I",
-        "Vesiculation": "Grade II",
-        "Desquamation": "Grade III",
-        "Exfoliation": "Grade IV"
-    }
-    if skin_look in skin_map:
-        max_grade_index = max(max_grade_index, grade_order.index(skin_map[skin_look]))
-
-    # Allergic-state rule
-    allergy_map = {
-        "Edema": "Grade I",
-        "Bronchospasm": "Grade II",
-        "Sever-Bronchospasm": "Grade III",
-        "Anaphylactic-Shock": "Grade IV"
-    }
-    if allergic_state in allergy_map:
-        max_grade_index = max(max_grade_index, grade_order.index(allergy_map[allergic_state]))
+def knowledge_base_version() -> str:
+    """Changes whenever a table evaluate_treatment reads from changes."""
+    return revalidate_kb()
+
+def _forget_recommendations(db: AsyncSession, writes) -> None:
+    """Drops cached recommendations of patients with a written (patient_id, loinc_num) rule input."""
+    patients = {pid for pid, loinc in writes if loinc in TREATMENT_LOINCS}
+    if not patients:
+        return
+    recommendation_cache.discard_where(lambda key: key[0] in patients)
+    db.info.setdefault(_STALE_RECOMMENDATIONS, set()).update(patients)
+
+@event.listens_for(Session, "after_commit")
+def _forget_committed_recommendations(session) -> None:
+    patients = session.info.pop(_STALE_RECOMMENDATIONS, None)
+    if patients:
+        recommendation_cache.discard_where(lambda key: key[0] in patients)
+
+@event.listens_for(Session, "after_rollback")
+def _keep_recommendations(session) -> None:
+    session.info.pop(_STALE_RECOMMENDATIONS, None)
+
+async def get_current_treatment_at_time(db, patient_id: int, time_point: datetime, as_of: Optional[datetime] = None):
+    """
+    Returns treatment recommendation for a patient at a given time, based on Hemoglobin state,
+    Hematological state, and Systemic Toxicity grade.
+    With as_of, reproduces the recommendation from what was recorded by then.
+    Results are cached until the patient's data is written, by any process.
+    """
+    version = await _catch_up_on_writes(db)
+    key = (patient_id, time_point, as_of, knowledge_base_version())
+    cached = recommendation_cache.get(key)
+    if cached is not MISSING:
+        return dict(cached) if isinstance(cached, dict) else cached
+
+    patient = await db.get(Patient, patient_id)
+    if not patient:
+        return "Patient not found"
+    gender = "Male" if patient.gender.upper() == "M" else "Female"
+
+    # Snapshot of all rule inputs in one round trip
+    values = await latest_values_at_time(db, patient_id, TREATMENT_LOINCS, time_point, as_of)
+    result = evaluate_treatment(gender, values)
+    if version == _seen_data_version:
+        recommendation_cache.put(key, result)
+    return dict(result) if isinstance(result, dict) else result
+
+
+# Patients evaluated per set-based round trip in cohort evaluation
+COHORT_CHUNK_SIZE = 500
+
+async def _patient_gender_chunks(db: AsyncSession, patient_ids, chunk_size: int):
+    """
+    Yields (requested_ids, {patient_id: gender}) per chunk. With no IDs given the
+    whole patients table is walked with keyset paging on patient_id.
+    """
+    if patient_ids is not None:
+        wanted = sorted(set(patient_ids))
+        for i in range(0, len(wanted), chunk_size):
+            ids = wanted[i:i + chunk_size]
+            rows = await db.execute(
+                select(Patient.patient_id, Patient.gender).where(Patient.patient_id.in_(ids))
+            )
+            yield ids, dict(rows.all())
+        return
 
-    return grade_order[max_grade_index] if max_grade_index >= 0 else "Unknown"
+    last_id = 0
+    while True:
+        rows = (await db.execute(
+            select(Patient.patient_id, Patient.gender)
+            .where(Patient.patient_id > last_id)
+            .order_by(Patient.patient_id)
+            .limit(chunk_size)
+        )).all()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield [pid for pid, _ in rows], dict(rows)
+
+
+async def get_cohort_treatment_at_time(
+    db: AsyncSession,
+    time_point: datetime,
+    patient_ids: Optional[List[int]] = None,
+    chunk_size: int = COHORT_CHUNK_SIZE,
+    as_of: Optional[datetime] = None
+):
+    """
+    Async generator yielding (patient_id, result) for every patient (or the given IDs)
+    at time_point (as known at as_of), where result is what
+    get_current_treatment_at_time would return.
+    Each chunk of patients costs two queries: demographics and all rule inputs,
+    and one grade_toxicity call grades the whole chunk.
+    """
+    toxicity_loincs = (FEVER_LOINC, CHILLS_LOINC, SKIN_LOINC, ALLERGY_LOINC)
+    async for ids, genders in _patient_gender_chunks(db, patient_ids, chunk_size):
+        values = await latest_values_for_patients(db, list(genders), TREATMENT_LOINCS, time_point, as_of)
+        found = [pid for pid in ids if pid in genders]
+        snapshots = [values.get(pid, {}) for pid in found]
+        grades = dict(zip(found, grade_toxicity(*(
+            [snapshot.get(code, np.nan) for snapshot in snapshots] for code in toxicity_loincs
+        ))))
+        for pid in ids:
+            if pid not in genders:
+                yield pid, "Patient not found"
+                continue
+            gender = "Male" if genders[pid].upper() == "M" else "Female"
+            yield pid, evaluate_treatment(gender, values.get(pid, {}), grades[pid])
+
+def get_toxicity_grade(fever: float, chills: str, skin_look: str, allergic_state: str) -> str:
+    """Returns Grade I–IV based on max severity across symptoms (knowledge_base.toxicity_rules)."""
+    return grade_toxicity_labels(fever, chills, skin_look, allergic_state)
@@ -1,11 +1,51 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 
-from app.config import DATABASE_URL
+from app.config import (
+    DATABASE_URL,
+    SQLITE_PROFILE,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+)
+
+
+def pool_options(url: str) -> dict:
+    """Pool sizing for file databases; in-memory SQLite keeps its single static connection."""
+    database = make_url(url).database
+    if not database or database == ":memory:" or database.startswith("file::memory:"):
+        return {}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
+
+
+def apply_sqlite_profile(engine, profile: dict = SQLITE_PROFILE) -> None:
+    """Runs the profile's PRAGMAs on each new connection of a sync or async engine."""
+    target = getattr(engine, "sync_engine", engine)
+    if target.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(target, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in profile.items():
+            if value not in (None, ""):
+                cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+# Same database through the sync driver, for schema setup and bulk seeding
+SYNC_DATABASE_URL = DATABASE_URL.replace("sqlite+aiosqlite", "sqlite")
 
 # Async engine ל‑SQLite
-engine = create_async_engine(DATABASE_URL, future=True, echo=False)
+engine = create_async_engine(DATABASE_URL, future=True, echo=False, **pool_options(DATABASE_URL))
+apply_sqlite_profile(engine)
 
 # הבסיס לכל המודלים
 Base = declarative_base()
@@ -14,5 +54,3 @@ Base = declarative_base()
 SessionLocal = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
-
-
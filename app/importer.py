@@ -0,0 +1,196 @@
+# app/importer.py
+import os
+from datetime import datetime
+from typing import Optional
+
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud, models, schemas
+
+# Column names, as in project_db.xlsx
+PATIENT_ID_COL = "Patient ID"
+FIRST_NAME_COL = "First name"
+LAST_NAME_COL  = "Last name"
+LOINC_COL      = "LOINC-NUM"
+VALUE_COL      = "Value"
+START_COL      = "Valid start time"
+END_COL        = "Valid end time"        # optional
+TXN_COL        = "Transaction time"      # optional
+
+# Rows read from the file per chunk; memory use is bounded by this
+IMPORT_CHUNK_ROWS = 10000
+# Validation messages kept in the report (the rest are only counted)
+MAX_REPORTED_ERRORS = 50
+
+
+def read_observation_chunks(path: str, chunk_rows: int = IMPORT_CHUNK_ROWS):
+    """
+    Yields lists of row dicts from a CSV or Excel file without loading it whole:
+    pandas chunked reader for CSV, openpyxl read-only streaming for Excel.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".xlsx", ".xlsm"):
+        from openpyxl import load_workbook
+
+        wb = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            header = [str(h).strip() if h is not None else "" for h in next(rows, ())]
+            chunk = []
+            for values in rows:
+                if all(v is None for v in values):
+                    continue    # read-only mode yields formatted but empty rows
+                chunk.append(dict(zip(header, values)))
+                if len(chunk) >= chunk_rows:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+        finally:
+            wb.close()
+    else:
+        for df in pd.read_csv(path, chunksize=chunk_rows, dtype=str, skipinitialspace=True):
+            df.columns = [c.strip() for c in df.columns]
+            yield df.to_dict("records")
+
+
+def _missing(value) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip()) or pd.isna(value)
+
+
+def _parse_time(value) -> Optional[datetime]:
+    if _missing(value):
+        return None
+    ts = pd.to_datetime(value, dayfirst=isinstance(value, str) and "/" in value)
+    return ts.to_pydatetime()
+
+
+def _name_key(row) -> str:
+    """The row's patient name folded as in patients.name_key (see models.fold_name)."""
+    return models.fold_name(f"{row[FIRST_NAME_COL]} {row[LAST_NAME_COL]}")
+
+
+async def _resolve_patients(db: AsyncSession, rows, name_to_id: dict, known_ids: set) -> None:
+    """Looks up, in one query each, the patient IDs and names not seen in earlier chunks."""
+    ids, names = set(), set()
+    for row in rows:
+        pid = row.get(PATIENT_ID_COL)
+        if not _missing(pid):
+            try:
+                ids.add(int(float(pid)))
+            except (TypeError, ValueError):
+                pass
+        elif not _missing(row.get(FIRST_NAME_COL)) and not _missing(row.get(LAST_NAME_COL)):
+            names.add(_name_key(row))
+
+    ids = sorted(ids - known_ids)
+    names = sorted(names - name_to_id.keys())
+    P = models.Patient
+    for i in range(0, len(ids), crud.IN_CLAUSE_CHUNK):
+        batch = ids[i:i + crud.IN_CLAUSE_CHUNK]
+        known_ids.update(await db.scalars(select(P.patient_id).where(P.patient_id.in_(batch))))
+    for i in range(0, len(names), crud.IN_CLAUSE_CHUNK):
+        batch = names[i:i + crud.IN_CLAUSE_CHUNK]
+        found = {}
+        rows = await db.execute(
+            select(P.name_key, P.patient_id).where(P.name_key.in_(batch))
+        )
+        for key, pid in rows:
+            # Homonyms cannot be told apart from the file: mark as ambiguous
+            found[key] = None if key in found else pid
+        # 0 marks names with no patient so they are not looked up again
+        for name in batch:
+            name_to_id[name] = found.get(name, 0)
+
+
+def _row_to_observation(row, name_to_id: dict, known_ids: set) -> schemas.ObservationCreate:
+    """Validates one file row; raises ValueError with a readable reason."""
+    pid = row.get(PATIENT_ID_COL)
+    if not _missing(pid):
+        try:
+            patient_id = int(float(pid))
+        except (TypeError, ValueError):
+            raise ValueError(f"bad patient ID {pid!r}")
+        if patient_id not in known_ids:
+            raise ValueError(f"unknown patient ID {patient_id}")
+    else:
+        first, last = row.get(FIRST_NAME_COL), row.get(LAST_NAME_COL)
+        if _missing(first) or _missing(last):
+            raise ValueError("no patient ID or name")
+        patient_id = name_to_id.get(_name_key(row), 0)
+        if patient_id is None:
+            raise ValueError(f"ambiguous patient name '{first} {last}'")
+        if not patient_id:
+            raise ValueError(f"unknown patient '{first} {last}'")
+
+    loinc = row.get(LOINC_COL)
+    if _missing(loinc):
+        raise ValueError("missing LOINC code")
+
+    try:
+        value = float(row.get(VALUE_COL))
+    except (TypeError, ValueError):
+        raise ValueError(f"non-numeric value {row.get(VALUE_COL)!r}")
+    if pd.isna(value):
+        raise ValueError("missing value")
+
+    try:
+        start = _parse_time(row.get(START_COL))
+        end = _parse_time(row.get(END_COL))
+        txn = _parse_time(row.get(TXN_COL))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"bad timestamp ({e})")
+    if start is None:
+        raise ValueError("missing valid start time")
+
+    return schemas.ObservationCreate(
+        patient_id=patient_id,
+        loinc_num=str(loinc).strip(),
+        value_num=value,
+        start=start,
+        end=end,
+        txn_start=txn
+    )
+
+
+async def import_observations(
+    db: AsyncSession,
+    path: str,
+    chunk_rows: int = IMPORT_CHUNK_ROWS,
+    progress=None
+) -> dict:
+    """
+    Streams observations from a CSV/Excel file into the database in one transaction.
+    Invalid rows are skipped and reported. progress(report) is called after each chunk.
+    Returns {"read", "imported", "skipped", "superseded", "errors"}.
+    """
+    report = {"read": 0, "imported": 0, "skipped": 0, "superseded": 0, "errors": []}
+    name_to_id, known_ids, touched = {}, set(), set()
+
+    async def valid_observations():
+        for rows in read_observation_chunks(path, chunk_rows):
+            await _resolve_patients(db, rows, name_to_id, known_ids)
+            for row in rows:
+                report["read"] += 1
+                try:
+                    obs = _row_to_observation(row, name_to_id, known_ids)
+                except ValueError as e:
+                    report["skipped"] += 1
+                    if len(report["errors"]) < MAX_REPORTED_ERRORS:
+                        # +1 for the header line
+                        report["errors"].append(f"row {report['read'] + 1}: {e}")
+                    continue
+                touched.add(obs.patient_id)
+                report["imported"] += 1
+                yield obs
+            if progress:
+                progress(report)
+
+    # The report counts the rows; keeping every obs_id would grow with the file
+    await crud.create_observations_bulk(db, valid_observations(), commit=False, collect_ids=False)
+    # Files may carry several recordings of one measurement: keep only the latest current
+    report["superseded"] = await crud.close_superseded_versions(db, touched)
+    await db.commit()
+    return report
@@ -0,0 +1,143 @@
+# app/intervals.py
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+
+class _Node:
+    """Intervals containing center, plus subtrees for those wholly left and right of it."""
+    __slots__ = ("center", "by_start", "by_end", "left", "right")
+
+    def __init__(self, center, by_start, by_end, left, right):
+        self.center = center
+        self.by_start = by_start    # positions, start ascending
+        self.by_end = by_end        # positions, end descending
+        self.left = left
+        self.right = right
+
+
+class IntervalTree:
+    """
+    Static centered interval tree over closed [start, end] intervals, built in
+    bulk from interval dicts such as infer_state_intervals or
+    get_state_intervals produce. Stabbing and overlap queries take
+    O(log n + k), nearest-interval queries O(log n).
+    Queries return the stored dicts in the order they were given.
+    """
+
+    def __init__(self, intervals: Iterable[dict], start: str = "start", end: str = "end"):
+        self._items = list(intervals)
+        self._start_key, self._end_key = start, end
+        self._starts_of = [item[start] for item in self._items]
+        self._ends_of = [item[end] for item in self._items]
+
+        positions = range(len(self._items))
+        self._by_start = sorted(positions, key=lambda i: (self._starts_of[i], i))
+        self._starts = [self._starts_of[i] for i in self._by_start]
+        self._by_end = sorted(positions, key=lambda i: (self._ends_of[i], i))
+        self._ends = [self._ends_of[i] for i in self._by_end]
+
+        self._root = self._build(list(positions))
+        self._per_state = {}
+
+    def _build(self, positions: List[int]) -> Optional[_Node]:
+        if not positions:
+            return None
+        # Median endpoint keeps both subtrees at most half the size
+        endpoints = sorted([self._starts_of[i] for i in positions] + [self._ends_of[i] for i in positions])
+        center = endpoints[len(endpoints) // 2]
+
+        left, here, right = [], [], []
+        for i in positions:
+            if self._ends_of[i] < center:
+                left.append(i)
+            elif self._starts_of[i] > center:
+                right.append(i)
+            else:
+                here.append(i)
+        return _Node(
+            center,
+            sorted(here, key=lambda i: self._starts_of[i]),
+            sorted(here, key=lambda i: self._ends_of[i], reverse=True),
+            self._build(left),
+            self._build(right),
+        )
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def _result(self, positions) -> List[dict]:
+        return [self._items[i] for i in sorted(positions)]
+
+    def _stab(self, t: datetime) -> List[int]:
+        found = []
+        node = self._root
+        while node is not None:
+            if t < node.center:
+                for i in node.by_start:
+                    if self._starts_of[i] > t:
+                        break
+                    found.append(i)
+                node = node.left
+            elif t > node.center:
+                for i in node.by_end:
+                    if self._ends_of[i] < t:
+                        break
+                    found.append(i)
+                node = node.right
+            else:
+                found.extend(node.by_start)
+                break
+        return found
+
+    def at(self, t: datetime) -> List[dict]:
+        """Intervals containing t."""
+        return self._result(self._stab(t))
+
+    def overlapping(self, since: datetime, until: datetime) -> List[dict]:
+        """Intervals sharing at least one instant with [since, until]."""
+        if since > until:
+            return []
+        # Those already open at since, then those opening inside the window
+        found = self._stab(since)
+        first = bisect_right(self._starts, since)
+        last = bisect_right(self._starts, until)
+        found.extend(self._by_start[first:last])
+        return self._result(found)
+
+    def nearest(self, t: datetime) -> List[dict]:
+        """
+        Intervals closest to t: those containing it, otherwise those ending
+        last before it or starting first after it, whichever is nearer
+        (both on a tie). Empty only when the tree is.
+        """
+        found = self._stab(t)
+        if found or not self._items:
+            return self._result(found)
+
+        before = bisect_left(self._ends, t)     # ends[:before] < t
+        after = bisect_right(self._starts, t)   # starts[after:] > t
+        gap_before = t - self._ends[before - 1] if before else None
+        gap_after = self._starts[after] - t if after < len(self._starts) else None
+
+        if gap_before is not None and (gap_after is None or gap_before <= gap_after):
+            last_end = self._ends[before - 1]
+            found.extend(self._by_end[bisect_left(self._ends, last_end):before])
+        if gap_after is not None and (gap_before is None or gap_after <= gap_before):
+            first_start = self._starts[after]
+            found.extend(self._by_start[after:bisect_right(self._starts, first_start)])
+        return self._result(found)
+
+    def for_state(self, state: str, key: str = "state") -> "IntervalTree":
+        """Subtree of the intervals in one state, built on first use and kept."""
+        tree = self._per_state.get((key, state))
+        if tree is None:
+            tree = IntervalTree(
+                (item for item in self._items if item[key] == state),
+                start=self._start_key, end=self._end_key
+            )
+            self._per_state[(key, state)] = tree
+        return tree
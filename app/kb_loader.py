@@ -0,0 +1,225 @@
+# app/kb_loader.py
+"""
+Rule tables as files: a directory with one CSV per table, or one YAML file
+mapping table names to lists of rows. Rows use the same columns either way:
+
+    hemoglobin_state     gender, low, high, state, good_before_days, good_after_days
+    hematological_state  gender, hemoglobin_low, hemoglobin_high, wbc_low, wbc_high, state
+    treatment_rules      gender, hemoglobin_state, hematological_state, toxicity_grade, treatment
+                         (one row per treatment line, in order)
+    toxicity_rules       parameter, grade, low, high, value
+                         (Fever rows give low/high, the others one value each)
+    toxicity_codes       parameter, code, label
+
+Tables left out keep their built-in definition. Bounds accept "inf". A
+table given must have rows, and the resulting set must be complete (see
+check_complete) before it replaces the running rules.
+"""
+import csv
+import os
+
+from app.kb_tables import GENDERS, TABLE_NAMES, TOXICITY_FEATURES
+
+COLUMNS = {
+    "hemoglobin_state":    ("gender", "low", "high", "state", "good_before_days", "good_after_days"),
+    "hematological_state": ("gender", "hemoglobin_low", "hemoglobin_high", "wbc_low", "wbc_high", "state"),
+    "treatment_rules":     ("gender", "hemoglobin_state", "hematological_state", "toxicity_grade", "treatment"),
+    "toxicity_rules":      ("parameter", "grade", "low", "high", "value"),
+    "toxicity_codes":      ("parameter", "code", "label"),
+}
+
+# toxicity_rules parameter graded by numeric bands; the others list labels
+BANDED_PARAMETER = "Fever"
+
+
+def _is_yaml(path: str) -> bool:
+    return path.lower().endswith((".yaml", ".yml"))
+
+
+def rules_stamp(path: str):
+    """What reload checks for changes: modification time and size of each rule file."""
+    try:
+        if os.path.isdir(path):
+            names = sorted(f"{name}.csv" for name in TABLE_NAMES if os.path.exists(os.path.join(path, f"{name}.csv")))
+            return tuple((name,) + tuple(_stat(os.path.join(path, name))) for name in names)
+        return tuple(_stat(path))
+    except OSError:
+        return None
+
+
+def _stat(path: str):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def _read_rows(path: str) -> dict:
+    """{table name: [row dict]} for the tables present at path."""
+    if _is_yaml(path):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("PyYAML is needed to read YAML rule files")
+        with open(path, encoding="utf-8") as f:
+            try:
+                data = yaml.safe_load(f) or {}
+            except yaml.YAMLError as e:
+                raise ValueError(f"{path}: not valid YAML: {e}")
+        if not isinstance(data, dict):
+            raise ValueError(f"{path}: expected a mapping of table names to rows")
+        unknown = set(data) - set(TABLE_NAMES)
+        if unknown:
+            raise ValueError(f"{path}: unknown tables {', '.join(sorted(unknown))}")
+        return {name: list(rows or []) for name, rows in data.items()}
+
+    if not os.path.isdir(path):
+        raise ValueError(f"{path}: expected a directory of CSV files or a .yaml file")
+    tables = {}
+    for name in TABLE_NAMES:
+        file = os.path.join(path, f"{name}.csv")
+        if os.path.exists(file):
+            with open(file, newline="", encoding="utf-8-sig") as f:
+                try:
+                    tables[name] = list(csv.DictReader(f))
+                except csv.Error as e:
+                    raise ValueError(f"{file}: not valid CSV: {e}")
+    return tables
+
+
+def _number(row: dict, column: str) -> float:
+    value = row.get(column)
+    if value is None or str(value).strip() == "":
+        raise ValueError(f"missing {column}")
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    # Numbers keep the form they are written in (12 vs 12.0), so a file
+    # exported from the built-in tables fingerprints the same
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{column} {value!r} is not a number")
+
+
+def _text(row: dict, column: str) -> str:
+    value = row.get(column)
+    if value is None or str(value).strip() == "":
+        raise ValueError(f"missing {column}")
+    return str(value).strip()
+
+
+def _build(name: str, rows: list) -> dict:
+    """Turns one table's rows into the dict shape knowledge_base uses."""
+    if not rows:
+        # A header-only CSV is most likely a half-saved edit, not "no rules"
+        raise ValueError(f"{name}: no rows")
+    table = {}
+    for n, row in enumerate(rows, 1):
+        try:
+            if not isinstance(row, dict):
+                raise ValueError("expected a mapping of columns")
+            if name == "hemoglobin_state":
+                table.setdefault(_text(row, "gender"), []).append((
+                    _number(row, "low"), _number(row, "high"), _text(row, "state"),
+                    _number(row, "good_before_days"), _number(row, "good_after_days"),
+                ))
+            elif name == "hematological_state":
+                h_band = (_number(row, "hemoglobin_low"), _number(row, "hemoglobin_high"))
+                w_band = (_number(row, "wbc_low"), _number(row, "wbc_high"))
+                table.setdefault(_text(row, "gender"), {}).setdefault(h_band, {})[w_band] = _text(row, "state")
+            elif name == "treatment_rules":
+                key = (_text(row, "hemoglobin_state"), _text(row, "hematological_state"), _text(row, "toxicity_grade"))
+                table.setdefault(_text(row, "gender"), {}).setdefault(key, []).append(_text(row, "treatment"))
+            elif name == "toxicity_rules":
+                parameter, grade = _text(row, "parameter"), _text(row, "grade")
+                if parameter == BANDED_PARAMETER:
+                    table.setdefault(parameter, {})[grade] = (_number(row, "low"), _number(row, "high"))
+                else:
+                    table.setdefault(parameter, {}).setdefault(grade, []).append(_text(row, "value"))
+            elif name == "toxicity_codes":
+                code = _number(row, "code")
+                if not isinstance(code, int) or code < 0:
+                    raise ValueError(f"code {code} is not a non-negative integer")
+                table.setdefault(_text(row, "parameter"), {})[code] = _text(row, "label")
+        except ValueError as e:
+            raise ValueError(f"{name} row {n}: {e}")
+    return table
+
+
+def load_rule_tables(path: str) -> dict:
+    """
+    Reads the rule tables at path. Returns {table name: dict} for the tables
+    present there; raises ValueError naming the table and row of a bad entry.
+    """
+    return {name: _build(name, rows) for name, rows in _read_rows(path).items()}
+
+
+def check_complete(tables: dict) -> None:
+    """
+    Raises ValueError unless tables ({name: dict} for every table, files
+    applied over the built-in ones) answer every lookup evaluate_treatment makes.
+    """
+    for name in TABLE_NAMES:
+        if not tables.get(name):
+            raise ValueError(f"{name}: no rules")
+    for name in ("hemoglobin_state", "hematological_state", "treatment_rules"):
+        missing = [gender for gender in GENDERS if not tables[name].get(gender)]
+        if missing:
+            raise ValueError(f"{name}: no rules for {', '.join(missing)}")
+    for name in ("toxicity_rules", "toxicity_codes"):
+        missing = [feature for feature in TOXICITY_FEATURES if not tables[name].get(feature)]
+        if missing:
+            raise ValueError(f"{name}: no entries for {', '.join(missing)}")
+    if not tables["toxicity_rules"].get(BANDED_PARAMETER):
+        raise ValueError(f"toxicity_rules: no {BANDED_PARAMETER} bands")
+
+
+def table_rows(name: str, table: dict) -> list:
+    """Inverse of the loader for one table: its rows as dicts."""
+    rows = []
+    if name == "hemoglobin_state":
+        for gender, bands in table.items():
+            for low, high, state, before, after in bands:
+                rows.append({"gender": gender, "low": low, "high": high, "state": state,
+                             "good_before_days": before, "good_after_days": after})
+    elif name == "hematological_state":
+        for gender, h_bands in table.items():
+            for (h_low, h_high), wbc_map in h_bands.items():
+                for (w_low, w_high), state in wbc_map.items():
+                    rows.append({"gender": gender, "hemoglobin_low": h_low, "hemoglobin_high": h_high,
+                                 "wbc_low": w_low, "wbc_high": w_high, "state": state})
+    elif name == "treatment_rules":
+        for gender, rules in table.items():
+            for (hemo, hema, grade), lines in rules.items():
+                for line in lines:
+                    rows.append({"gender": gender, "hemoglobin_state": hemo, "hematological_state": hema,
+                                 "toxicity_grade": grade, "treatment": line})
+    elif name == "toxicity_rules":
+        for parameter, grades in table.items():
+            for grade, rule in grades.items():
+                if parameter == BANDED_PARAMETER:
+                    rows.append({"parameter": parameter, "grade": grade, "low": rule[0], "high": rule[1]})
+                else:
+                    rows.extend({"parameter": parameter, "grade": grade, "value": value} for value in rule)
+    elif name == "toxicity_codes":
+        for parameter, codes in table.items():
+            rows.extend({"parameter": parameter, "code": code, "label": label} for code, label in codes.items())
+    return rows
+
+
+def export_rule_tables(tables: dict, path: str) -> None:
+    """Writes tables ({name: dict}) to path: a YAML file, or CSV files in a directory."""
+    if _is_yaml(path):
+        import yaml
+        with open(path, "w", encoding="utf-8") as f:
+            yaml.safe_dump({name: table_rows(name, table) for name, table in tables.items()},
+                           f, sort_keys=False, allow_unicode=True)
+        return
+    os.makedirs(path, exist_ok=True)
+    for name, table in tables.items():
+        with open(os.path.join(path, f"{name}.csv"), "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS[name])
+            writer.writeheader()
+            writer.writerows(table_rows(name, table))
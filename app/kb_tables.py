@@ -0,0 +1,267 @@
+# app/kb_tables.py
+import hashlib
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+import pandas as pd
+
+# The knowledge_base tables, in the order CompiledKB takes them
+TABLE_NAMES = ("hemoglobin_state", "hematological_state", "treatment_rules", "toxicity_rules", "toxicity_codes")
+
+# Genders as crud maps patients.gender, each needing its own state and rule tables
+GENDERS = ("Male", "Female")
+
+# Categorical toxicity parameters, coded in toxicity_codes and graded in toxicity_rules
+TOXICITY_FEATURES = ("Chills", "Skin-look", "Allergic-state")
+
+
+class BandTable:
+    """
+    Half-open [low, high) bands compiled to a sorted array of lower bounds,
+    so finding a value's band is one bisect instead of a scan.
+    """
+    __slots__ = ("lows", "highs", "payloads")
+
+    def __init__(self, bands):
+        bands = sorted(bands, key=lambda band: band[0])
+        self.lows = [low for low, _, _ in bands]
+        self.highs = [high for _, high, _ in bands]
+        self.payloads = [payload for _, _, payload in bands]
+
+    def lookup(self, value, default=None):
+        i = bisect_right(self.lows, value) - 1
+        # Gaps between bands and NaN fall through to the default
+        if i >= 0 and value < self.highs[i]:
+            return self.payloads[i]
+        return default
+
+
+def _timing(state: str, good_before: float, good_after: float) -> dict:
+    return {
+        "state": state,
+        "good_before": pd.Timedelta(days=good_before),
+        "good_after": pd.Timedelta(days=good_after)
+    }
+
+UNKNOWN_TIMING = _timing("Unknown", 0, 0)
+
+# Toxicity grades by number; 0 means no parameter could be graded
+TOXICITY_GRADES = ("Unknown", "Grade I", "Grade II", "Grade III", "Grade IV")
+
+
+def _band_index(lows: np.ndarray, highs: np.ndarray, values) -> np.ndarray:
+    """Index of each value's [low, high) band, -1 outside every band (gaps, NaN)."""
+    values = np.asarray(values, dtype=float)
+    idx = np.searchsorted(lows, values, side="right") - 1
+    inside = (idx >= 0) & (values < highs[np.maximum(idx, 0)])
+    return np.where(inside, idx, -1)
+
+
+class BandArrays:
+    """
+    NumPy form of one gender's hemoglobin bands for np.searchsorted. Labels and
+    timings carry an extra trailing "Unknown" entry, so band index -1 (no band)
+    selects it.
+    """
+    __slots__ = ("lows", "highs", "labels", "good_before", "good_after")
+
+    def __init__(self, rows):
+        rows = sorted(rows, key=lambda row: row[0])
+        self.lows = np.array([row[0] for row in rows], dtype=float)
+        self.highs = np.array([row[1] for row in rows], dtype=float)
+        self.labels = np.array([row[2] for row in rows] + ["Unknown"], dtype=object)
+        self.good_before = pd.to_timedelta([row[3] for row in rows] + [0], unit="D").to_numpy()
+        self.good_after = pd.to_timedelta([row[4] for row in rows] + [0], unit="D").to_numpy()
+
+    def bands(self, values: np.ndarray) -> np.ndarray:
+        """Band index of each value, -1 outside every band (gaps, NaN)."""
+        return _band_index(self.lows, self.highs, values)
+
+
+class ToxicityArrays:
+    """
+    toxicity_rules as grade-number arrays: fever bands, and per categorical
+    feature a code -> grade table with a trailing 0 for unknown or missing
+    codes. A label listed under several grades takes the lowest.
+    """
+
+    def __init__(self, toxicity_rules: dict, toxicity_codes: dict):
+        number = {label: n for n, label in enumerate(TOXICITY_GRADES)}
+        fever = sorted((low, high, number[grade]) for grade, (low, high) in toxicity_rules["Fever"].items())
+        self.fever_lows = np.array([low for low, _, _ in fever], dtype=float)
+        self.fever_highs = np.array([high for _, high, _ in fever], dtype=float)
+        self.fever_grades = np.array([grade for _, _, grade in fever] + [0], dtype=np.int8)
+
+        self.code_grades = {}
+        self.label_codes = {}
+        for feature, codes in toxicity_codes.items():
+            label_grades = {}
+            for grade, labels in toxicity_rules[feature].items():
+                for label in labels:
+                    label_grades[label] = min(label_grades.get(label, number[grade]), number[grade])
+            table = np.zeros(max(codes) + 2, dtype=np.int8)
+            for code, label in codes.items():
+                table[code] = label_grades.get(label, 0)
+            self.code_grades[feature] = table
+            self.label_codes[feature] = {label: code for code, label in codes.items()}
+
+        # Scalar views of the same tables: one patient without NumPy call overhead
+        self._fever_bands = BandTable(zip(self.fever_lows.tolist(), self.fever_highs.tolist(), self.fever_grades[:-1].tolist()))
+        self._label_grades = {
+            feature: {label: int(self.code_grades[feature][code]) for label, code in label_codes.items()}
+            for feature, label_codes in self.label_codes.items()
+        }
+
+    def _coded(self, feature: str, codes) -> np.ndarray:
+        table = self.code_grades[feature]
+        codes = np.asarray(codes, dtype=float)
+        known = (codes >= 0) & (codes < len(table) - 1) & (codes == np.floor(codes))
+        return table[np.where(known, codes, len(table) - 1).astype(np.intp)]
+
+    def grade(self, fever, chills, skin, allergy) -> int:
+        """grades() for one patient given by fever and symptom labels (None when missing)."""
+        grade = self._fever_bands.lookup(fever, 0) if isinstance(fever, (int, float)) else 0
+        for feature, label in zip(TOXICITY_FEATURES, (chills, skin, allergy)):
+            grade = max(grade, self._label_grades[feature].get(label, 0))
+        return grade
+
+    def grades(self, fever, chills, skin, allergy) -> np.ndarray:
+        """Maximal grade number per row over the four parameters."""
+        return np.maximum.reduce([
+            self.fever_grades[_band_index(self.fever_lows, self.fever_highs, fever)],
+            self._coded("Chills", chills),
+            self._coded("Skin-look", skin),
+            self._coded("Allergic-state", allergy),
+        ])
+
+
+class HematologicalGrid:
+    """
+    One gender's hematological states as a dense (hemoglobin band x WBC band)
+    array of state codes, 0 where no rule applies. The WBC columns are cut at
+    every WBC bound used by any hemoglobin band.
+    """
+    __slots__ = ("h_lows", "h_highs", "w_bounds", "grid", "_rows")
+
+    def __init__(self, h_bands: dict, state_codes: dict):
+        bands = sorted(h_bands.items(), key=lambda item: item[0][0])
+        self.h_lows = [low for (low, _), _ in bands]
+        self.h_highs = [high for (_, high), _ in bands]
+        self.w_bounds = sorted({bound for _, wbc_map in bands for band in wbc_map for bound in band})
+        self.grid = np.zeros((len(bands), max(len(self.w_bounds) - 1, 0)), dtype=np.int16)
+        for i, (_, wbc_map) in enumerate(bands):
+            # Reversed so that, as in a scan, the first matching WBC range wins
+            for (low, high), label in reversed(list(wbc_map.items())):
+                self.grid[i, bisect_left(self.w_bounds, low):bisect_left(self.w_bounds, high)] = state_codes[label]
+        self._rows = self.grid.tolist()
+
+    def code(self, h_value: float, wbc_value: float) -> int:
+        i = bisect_right(self.h_lows, h_value) - 1
+        if i < 0 or not h_value < self.h_highs[i]:
+            return 0
+        j = bisect_right(self.w_bounds, wbc_value) - 1
+        if j < 0 or j >= len(self.w_bounds) - 1:
+            return 0
+        return self._rows[i][j]
+
+
+def _enum(*label_groups) -> dict:
+    """Label -> code over the given labels in first-seen order; "Unknown" is always 0."""
+    codes = {"Unknown": 0}
+    for labels in label_groups:
+        for label in labels:
+            codes.setdefault(label, len(codes))
+    return codes
+
+
+class CompiledKB:
+    """
+    The knowledge_base tables compiled for lookups: states, genders and grades
+    become integer codes; hemoglobin bands are bisect tables (with ready-made
+    timing results, and BandArrays for whole arrays of values); hematological
+    states a dense grid per gender; treatment rules a dense
+    (gender, hemoglobin state, hematological state, grade) index array; and
+    toxicity grading arrays. Built once per KB version and never modified, so
+    a reload can swap in a new one while readers finish with the old.
+    """
+
+    def __init__(self, hemoglobin_state: dict, hematological_state: dict, treatment_rules: dict,
+                 toxicity_rules: dict, toxicity_codes: dict):
+        self.sources = (hemoglobin_state, hematological_state, treatment_rules, toxicity_rules, toxicity_codes)
+        self.tables = dict(zip(TABLE_NAMES, self.sources))
+        self.fingerprint = kb_fingerprint(*self.sources)
+
+        self.gender_codes = _enum(hemoglobin_state, hematological_state, treatment_rules)
+        self.hemoglobin_codes = _enum(
+            (row[2] for rows in hemoglobin_state.values() for row in rows),
+            (key[0] for rules in treatment_rules.values() for key in rules),
+        )
+        self.hematological_codes = _enum(
+            (label for h_bands in hematological_state.values() for wbc_map in h_bands.values() for label in wbc_map.values()),
+            (key[1] for rules in treatment_rules.values() for key in rules),
+        )
+        self.grade_codes = {label: n for n, label in enumerate(TOXICITY_GRADES)}
+        self.hemoglobin_states = tuple(self.hemoglobin_codes)
+        self.hematological_states = tuple(self.hematological_codes)
+
+        self.hemoglobin = {
+            gender: BandTable((low, high, _timing(label, before, after))
+                              for low, high, label, before, after in rows)
+            for gender, rows in hemoglobin_state.items()
+        }
+        self.hemoglobin_code_bands = {
+            gender: BandTable((low, high, self.hemoglobin_codes[label]) for low, high, label, _, _ in rows)
+            for gender, rows in hemoglobin_state.items()
+        }
+        self.hemoglobin_arrays = {gender: BandArrays(rows) for gender, rows in hemoglobin_state.items()}
+        self.hematological = {
+            gender: HematologicalGrid(h_bands, self.hematological_codes)
+            for gender, h_bands in hematological_state.items()
+        }
+        self.toxicity = ToxicityArrays(toxicity_rules, toxicity_codes)
+
+        # Distinct treatment lists, and per rule key the index of its list (-1: no rule)
+        self.treatments = []
+        self.treatment_index = np.full(
+            (len(self.gender_codes), len(self.hemoglobin_codes), len(self.hematological_codes), len(TOXICITY_GRADES)),
+            -1, dtype=np.int32
+        )
+        for gender, rules in treatment_rules.items():
+            for (hemo, hema, grade), lines in rules.items():
+                if grade not in self.grade_codes:
+                    raise ValueError(f"treatment rule for {gender} uses unknown toxicity grade {grade!r}")
+                self.treatment_index[
+                    self.gender_codes[gender], self.hemoglobin_codes[hemo],
+                    self.hematological_codes[hema], self.grade_codes[grade]
+                ] = len(self.treatments)
+                self.treatments.append(tuple(lines))
+        self._treatment_rows = self.treatment_index.tolist()
+
+    def hemoglobin_timing(self, gender: str, value: float) -> dict:
+        """Same result as get_hemoglobin_state_with_timing; a fresh dict each call."""
+        return dict(self.hemoglobin[gender].lookup(value, UNKNOWN_TIMING))
+
+    def hemoglobin_code(self, gender: str, value: float) -> int:
+        return self.hemoglobin_code_bands[gender].lookup(value, 0)
+
+    def hemoglobin_label(self, gender: str, value: float) -> str:
+        return self.hemoglobin_states[self.hemoglobin_code(gender, value)]
+
+    def hematological_code(self, gender: str, h_value: float, wbc_value: float) -> int:
+        return self.hematological[gender].code(h_value, wbc_value)
+
+    def hematological_label(self, gender: str, h_value: float, wbc_value: float) -> str:
+        return self.hematological_states[self.hematological_code(gender, h_value, wbc_value)]
+
+    def treatment(self, gender: str, hemo_code: int, hema_code: int, grade_code: int):
+        """The rule's treatment lines (a new list), or None when no rule matches."""
+        g = self.gender_codes.get(gender)
+        if g is None:
+            return None
+        i = self._treatment_rows[g][hemo_code][hema_code][grade_code]
+        return list(self.treatments[i]) if i >= 0 else None
+
+
+def kb_fingerprint(*tables) -> str:
+    """Content hash of the tables; catches any edit."""
+    return hashlib.sha256(repr(tables).encode()).hexdigest()
@@ -1,6 +1,13 @@
 # app/knowledge_base.py
 
-import pandas as pd
+import threading
+import time
+
+import numpy as np
+
+from app.config import KB_RULES_PATH, KB_RELOAD_SECONDS
+from app.kb_loader import check_complete, load_rule_tables, rules_stamp
+from app.kb_tables import CompiledKB, TABLE_NAMES, TOXICITY_GRADES, kb_fingerprint
 
 # Hemoglobin state based on gender and level, with Good-Before and Good-After (in days)
 hemoglobin_state = {
@@ -21,18 +28,7 @@ hemoglobin_state = {
 }
 
 def get_hemoglobin_state_with_timing(gender: str, value: float):
-    for low, high, label, good_before, good_after in hemoglobin_state[gender]:
-        if low <= value < high:
-            return {
-                "state": label,
-                "good_before": pd.Timedelta(days=good_before),
-                "good_after": pd.Timedelta(days=good_after)
-            }
-    return {
-        "state": "Unknown",
-        "good_before": pd.Timedelta(days=0),
-        "good_after": pd.Timedelta(days=0)
-    }
+    return compiled_kb().hemoglobin_timing(gender, value)
 
 # Hematological state based on gender, hemoglobin level, and WBC level
 hematological_state = {
@@ -133,7 +129,7 @@ toxicity_rules = {
     "Allergic-state": {
         "Grade I": ["Edema"],
         "Grade II": ["Bronchospasm"],
-        "Grade III": ["Sever-Bronchospasm"],
+        "Grade III": ["Severe-Bronchospasm"],
         "Grade IV": ["Anaphylactic-Shock"]
     },
     "Chills": {
@@ -155,57 +151,108 @@ toxicity_rules = {
     }
 }
 
+# Codes the categorical toxicity observations are stored as, per toxicity_rules feature
+toxicity_codes = {
+    "Chills":         {0: "None", 1: "Shaking", 2: "Rigor"},
+    "Skin-look":      {0: "Erythema", 1: "Vesiculation", 2: "Desquamation", 3: "Exfoliation"},
+    "Allergic-state": {0: "Edema", 1: "Bronchospasm", 2: "Severe-Bronchospasm", 3: "Anaphylactic-Shock"},
+}
+
+_GRADE_LABELS = np.array(TOXICITY_GRADES, dtype=object)
+
+def grade_toxicity(fever, chills, skin, allergy) -> np.ndarray:
+    """
+    Maximal-OR systemic toxicity grade for whole cohorts at once: equal-length
+    arrays of fever (°C) and chills, skin-look and allergic-state codes (as in
+    toxicity_codes; NaN when missing). Returns an array of TOXICITY_GRADES
+    labels, "Unknown" where no parameter could be graded.
+    """
+    return _GRADE_LABELS[compiled_kb().toxicity.grades(fever, chills, skin, allergy)]
+
+def grade_toxicity_labels(fever=None, chills=None, skin=None, allergy=None) -> str:
+    """One patient's grade from a fever value and symptom labels (None when missing), from the same tables."""
+    return TOXICITY_GRADES[compiled_kb().toxicity.grade(fever, chills, skin, allergy)]
+
 def get_toxicity_grade_from_features(fever=None, chills=None, skin=None, allergy=None):
     """
     Given observations for toxicity parameters, return the maximal grade (I-IV).
     """
-    value_to_grade = {
-        # Fever
-        "fever": lambda v: (
-            "GRADE I" if v <= 38.5 else
-            "GRADE II" if v <= 40.0 else
-            "GRADE III"
-        ),
-        # Chills
-        "chills": {
-            "None": "GRADE I",
-            "Shaking": "GRADE II",
-            "Rigor": "GRADE III"
-        },
-        # Skin-look
-        "skin": {
-            "Erythema": "GRADE I",
-            "Vesiculation": "GRADE II",
-            "Desquamation": "GRADE III",
-            "Exfoliation": "GRADE IV"
-        },
-        # Allergy
-        "allergy": {
-            "Edema": "GRADE I",
-            "Bronchospasm": "GRADE II",
-            "Sever-Bronchospasm": "GRADE III",
-            "Anaphylactic-Shock": "GRADE IV"
-        }
-    }
+    grade = grade_toxicity_labels(fever, chills, skin, allergy)
+    return "Grade I" if grade == "Unknown" else grade  # default
+
+
+# ── Compiled lookup tables ──────────────────────────────────────────────────
 
-    grades = []
+_compiled = None
+_lock = threading.Lock()
 
-    if isinstance(fever, (int, float)):
-        grades.append(value_to_grade["fever"](fever))
+# Rule files: stamp of the version last loaded (or rejected), and next check time
+_rules_stamp = None
+_next_rules_check = 0.0
 
-    if chills in value_to_grade["chills"]:
-        grades.append(value_to_grade["chills"][chills])
+def _kb_sources() -> tuple:
+    return hemoglobin_state, hematological_state, treatment_rules, toxicity_rules, toxicity_codes
 
-    if skin in value_to_grade["skin"]:
-        grades.append(value_to_grade["skin"][skin])
+def compiled_kb() -> CompiledKB:
+    """
+    The current CompiledKB. Callers should fetch it once per evaluation and use
+    that object throughout: reloads swap in a new one instead of changing it.
+    With KB_RULES_PATH set, the rule files are checked for changes every
+    KB_RELOAD_SECONDS. A table dict replaced in code is picked up on the next
+    call; revalidate_kb() also picks up edits made in place.
+    """
+    global _compiled
+    if KB_RULES_PATH and time.monotonic() >= _next_rules_check:
+        reload_rules()
+    kb = _compiled
+    if kb is None or any(a is not b for a, b in zip(kb.sources, _kb_sources())):
+        with _lock:
+            kb = _compiled = CompiledKB(*_kb_sources())
+    return kb
+
+def revalidate_kb() -> str:
+    """Recompiles if the dicts' content changed at all; returns their fingerprint. Meant for once per batch."""
+    global _compiled
+    kb = compiled_kb()
+    fingerprint = kb_fingerprint(*_kb_sources())
+    if fingerprint != kb.fingerprint:
+        with _lock:
+            _compiled = CompiledKB(*_kb_sources())
+    return fingerprint
 
-    if allergy in value_to_grade["allergy"]:
-        grades.append(value_to_grade["allergy"][allergy])
+def reload_rules(path: str = None, force: bool = False) -> bool:
+    """
+    Loads the rule tables at path (default KB_RULES_PATH) if its files changed
+    since the last load, compiles them over the built-in tables and swaps the
+    result in. A bad file, or one leaving the rules incomplete (a table, gender
+    or toxicity parameter without rules), is reported and the running KB kept,
+    so a half-saved edit never takes the rules down. Returns True when a new KB was swapped in.
+    """
+    global _compiled, _rules_stamp, _next_rules_check
+    global hemoglobin_state, hematological_state, treatment_rules, toxicity_rules, toxicity_codes
+    path = path or KB_RULES_PATH
+    with _lock:
+        _next_rules_check = time.monotonic() + KB_RELOAD_SECONDS
+        stamp = rules_stamp(path)
+        if stamp == _rules_stamp and not force:
+            return False
+        _rules_stamp = stamp
+        tables = dict(zip(TABLE_NAMES, _BUILT_IN))
+        try:
+            tables.update(load_rule_tables(path))
+            check_complete(tables)
+            compiled = CompiledKB(*(tables[name] for name in TABLE_NAMES))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Knowledge base rules at {path} not loaded, keeping the current rules: {e}", flush=True)
+            return False
+        # Module tables first: a concurrent compiled_kb() that sees them
+        # before the swap recompiles the same content
+        (hemoglobin_state, hematological_state, treatment_rules,
+         toxicity_rules, toxicity_codes) = compiled.sources
+        _compiled = compiled
+        return True
 
-    # Sort GRADE I → GRADE IV
-    grade_order = {"GRADE I": 1, "GRADE II": 2, "GRADE III": 3, "GRADE IV": 4}
-    if not grades:
-        return "GRADE I"  # default
+# Tables defined above, which rule files are applied over
+_BUILT_IN = _kb_sources()
 
-    max_grade = max(grades, key=lambda g: grade_order.get(g, 0))
-    return max_grade
+compiled_kb()
@@ -1,3 +1,4 @@
+import unicodedata
 from datetime import datetime
 from sqlalchemy import (
     Column,
@@ -7,10 +8,24 @@ from sqlalchemy import (
     DateTime,
     Float,
     ForeignKey,
+    Index,
+    text,
 )
 from sqlalchemy.orm import relationship
 from app.database import Base
 
+def fold_name(name: str) -> str:
+    """Case-, accent- and spacing-insensitive lookup key for a full name."""
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(stripped.casefold().split())
+
+
+def _patient_name_key(context) -> str:
+    params = context.get_current_parameters()
+    return fold_name(f"{params['first_name']} {params['last_name']}")
+
+
 class Patient(Base):
     __tablename__ = "patients"
 
@@ -19,9 +34,15 @@ class Patient(Base):
     last_name  = Column(String, nullable=False)
     gender     = Column(String(1), nullable=False)
     birth_date = Column(Date, nullable=False)
+    # fold_name("first last"): matches multi-word names however they were split
+    name_key   = Column(String, nullable=True, default=_patient_name_key)
 
     observations = relationship("Observation", back_populates="patient")
 
+    __table_args__ = (
+        Index("ix_patients_name_key", "name_key"),
+    )
+
 
 class Observation(Base):
     __tablename__ = "observations"
@@ -37,9 +58,82 @@ class Observation(Base):
 
     patient = relationship("Patient", back_populates="observations")
 
+    __table_args__ = (
+        # Current rows only: every hot query filters txn_end IS NULL, then
+        # ranges/orders on valid_start for one patient and LOINC
+        Index(
+            "ix_observations_current",
+            "patient_id", "loinc_num", "valid_start",
+            sqlite_where=text("txn_end IS NULL"),
+        ),
+        # All versions, for as-of-transaction-time queries: the txn columns
+        # follow valid_start so the transaction filter is answered from the index
+        Index(
+            "ix_observations_versions",
+            "patient_id", "loinc_num", "valid_start", "txn_start", "txn_end",
+        ),
+    )
+
+
+class StateInterval(Base):
+    """
+    Materialized abstraction: the state interval derived from one current
+    observation (see crud.STATE_ABSTRACTIONS). Maintained by every write path.
+    """
+    __tablename__ = "state_intervals"
+
+    interval_id   = Column(Integer, primary_key=True)
+    patient_id    = Column(Integer, ForeignKey("patients.patient_id"), nullable=False)
+    abstraction   = Column(String, nullable=False)
+    state         = Column(String, nullable=False)
+    start         = Column(DateTime, nullable=False)
+    end           = Column(DateTime, nullable=False)
+    obs_time      = Column(DateTime, nullable=False)
+    value         = Column(Float, nullable=False)
+    source_obs_id = Column(Integer, ForeignKey("observations.obs_id"), nullable=False, unique=True)
+
+    __table_args__ = (
+        # "When was the patient in state X": seek by state, range on start
+        Index("ix_state_intervals_state", "patient_id", "abstraction", "state", "start"),
+        # All states for a patient in a window
+        Index("ix_state_intervals_time", "patient_id", "abstraction", "start"),
+        # Population queries: every patient in a state during a window,
+        # answered from the index alone
+        Index("ix_state_intervals_population", "abstraction", "state", "start", "end", "patient_id"),
+    )
+
 
 class Loinc(Base):
     __tablename__ = "loinc"
 
     loinc_num   = Column(String, primary_key=True, index=True)
     common_name = Column(String, nullable=False)
+
+
+class Meta(Base):
+    __tablename__ = "meta"
+
+    key   = Column(String, primary_key=True)
+    value = Column(String, nullable=True)
+
+
+class DataVersion(Base):
+    """
+    Change marker per patient, bumped by triggers on every write to the
+    patient's row or observations (see schema.DATA_VERSION_TRIGGERS). Versions
+    come from one increasing sequence, so a process that remembers the highest
+    version it has seen can ask which patients changed since, whoever wrote.
+    patient_id ALL_PATIENTS marks changes to every patient at once.
+    """
+    __tablename__ = "data_versions"
+
+    patient_id = Column(Integer, primary_key=True)
+    version    = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_data_versions_version", "version"),
+    )
+
+
+# DataVersion.patient_id for changes that concern every patient (patient IDs start at 1)
+ALL_PATIENTS = 0
@@ -0,0 +1,209 @@
+# app/schema.py
+from sqlalchemy import bindparam, create_engine, delete, insert, select, text, update
+
+from app import crud, models
+from app.database import apply_sqlite_profile, pool_options
+
+# Full-text index over LOINC names. It keeps its own copy of the names and is
+# rebuilt wholesale by the LOINC seeder, the only writer of the loinc table.
+LOINC_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS loinc_fts "
+    "USING fts5(loinc_num UNINDEXED, common_name)"
+)
+
+
+def rebuild_loinc_search_index(conn) -> None:
+    """Repopulate loinc_fts from the loinc table (runs in the caller's transaction)."""
+    conn.execute(text("DELETE FROM loinc_fts"))
+    conn.execute(text(
+        "INSERT INTO loinc_fts (loinc_num, common_name) "
+        "SELECT loinc_num, common_name FROM loinc"
+    ))
+
+
+# Bumps one patient's data_versions row to the next version in the sequence
+_BUMP_DATA_VERSION = (
+    "INSERT OR REPLACE INTO data_versions (patient_id, version) "
+    "VALUES ({pid}, (SELECT COALESCE(MAX(version), 0) + 1 FROM data_versions))"
+)
+
+# Every write a cached per-patient result can depend on, from any process
+# (the CLI, the importer and the GUI share the database file)
+DATA_VERSION_TRIGGERS = tuple(
+    f"CREATE TRIGGER IF NOT EXISTS {name} AFTER {op} ON {table} {when}"
+    f"BEGIN {_BUMP_DATA_VERSION.format(pid=pid)}; END"
+    for name, op, table, when, pid in (
+        ("trg_observations_insert_version", "INSERT", "observations", "", "NEW.patient_id"),
+        ("trg_observations_update_version", "UPDATE", "observations", "", "NEW.patient_id"),
+        ("trg_observations_move_version", "UPDATE OF patient_id", "observations",
+         "WHEN OLD.patient_id IS NOT NEW.patient_id ", "OLD.patient_id"),
+        ("trg_observations_delete_version", "DELETE", "observations", "", "OLD.patient_id"),
+        ("trg_patients_update_version", "UPDATE", "patients", "", "NEW.patient_id"),
+        ("trg_patients_delete_version", "DELETE", "patients", "", "OLD.patient_id"),
+    )
+)
+
+
+def create_data_version_triggers(conn) -> None:
+    for ddl in DATA_VERSION_TRIGGERS:
+        conn.execute(text(ddl))
+
+
+def bump_all_patients(conn) -> None:
+    """Marks every patient's cached results stale, in every process."""
+    conn.execute(text(_BUMP_DATA_VERSION.format(pid=models.ALL_PATIENTS)))
+
+
+def bump_patients_between(conn, first: int, last: int) -> None:
+    """Marks the cached results of patients first..last stale, in every process."""
+    conn.execute(text(
+        "INSERT OR REPLACE INTO data_versions (patient_id, version) "
+        "SELECT patient_id, (SELECT COALESCE(MAX(version), 0) + 1 FROM data_versions) "
+        "FROM patients WHERE patient_id BETWEEN :first AND :last"
+    ), {"first": first, "last": last})
+
+
+# Indexes added after the first release; create_all skips them on existing tables
+UPGRADE_INDEXES = (
+    "ix_observations_current",
+    "ix_observations_versions",
+    "ix_patients_name_key",
+    "ix_state_intervals_population",
+)
+
+# Indexes no query uses any more, dropped from existing databases
+RETIRED_INDEXES = (
+    "ix_patients_name",     # name lookups go through ix_patients_name_key
+)
+
+# Meta key holding the rules fingerprint state_intervals was derived with
+STATE_INTERVALS_KEY = "state_intervals_fingerprint"
+STATE_INTERVALS_BATCH = 10000
+# Patients per transaction when state_intervals is rebuilt alongside readers
+STATE_INTERVALS_REBUILD_PATIENTS = 500
+
+
+def rebuild_state_intervals(conn) -> int:
+    """Re-derive every materialized state interval (runs in the caller's transaction)."""
+    table = models.StateInterval.__table__
+    conn.execute(delete(table))
+    written = 0
+    sources = conn.execute(crud.state_interval_source_stmt().execution_options(yield_per=STATE_INTERVALS_BATCH))
+    for rows in sources.partitions():
+        intervals = crud.state_interval_rows(rows)
+        if intervals:
+            conn.execute(insert(table), intervals)
+        written += len(intervals)
+    crud.state_interval_trees.clear()
+    bump_all_patients(conn)
+    return written
+
+
+def next_patient_range(conn, after_patient_id: int, patients: int = STATE_INTERVALS_REBUILD_PATIENTS):
+    """(first, last) patient_id of the next `patients` patients after after_patient_id, or None."""
+    P = models.Patient.__table__
+    ids = conn.execute(
+        select(P.c.patient_id).where(P.c.patient_id > after_patient_id)
+        .order_by(P.c.patient_id).limit(patients)
+    ).scalars().all()
+    return (ids[0], ids[-1]) if ids else None
+
+
+def rebuild_state_intervals_between(conn, first: int, last: int) -> int:
+    """
+    Re-derive the state intervals of patients first..last (runs in the
+    caller's transaction). Writes first, so the transaction takes the write
+    lock before reading and waits for other writers instead of failing.
+    """
+    table = models.StateInterval.__table__
+    conn.execute(delete(table).where(table.c.patient_id.between(first, last)))
+    rows = conn.execute(crud.state_interval_source_stmt().where(models.Observation.patient_id.between(first, last)))
+    intervals = crud.state_interval_rows(rows)
+    if intervals:
+        conn.execute(insert(table), intervals)
+    bump_patients_between(conn, first, last)
+    return len(intervals)
+
+
+def stored_state_intervals_fingerprint(conn):
+    meta = models.Meta.__table__
+    return conn.execute(select(meta.c.value).where(meta.c.key == STATE_INTERVALS_KEY)).scalar()
+
+
+def record_state_intervals_fingerprint(conn, fingerprint: str) -> None:
+    meta = models.Meta.__table__
+    conn.execute(delete(meta).where(meta.c.key == STATE_INTERVALS_KEY))
+    conn.execute(insert(meta).values(key=STATE_INTERVALS_KEY, value=fingerprint))
+
+
+def refresh_state_intervals(conn) -> bool:
+    """Rebuild state_intervals when it predates the current rules (or this table)."""
+    fingerprint = crud.state_intervals_fingerprint()
+    if stored_state_intervals_fingerprint(conn) == fingerprint:
+        return False
+    rebuild_state_intervals(conn)
+    record_state_intervals_fingerprint(conn, fingerprint)
+    return True
+
+
+def backfill_patient_name_keys(conn) -> int:
+    """Add patients.name_key to older databases and fill it where missing."""
+    columns = {row[1] for row in conn.execute(text("PRAGMA table_info(patients)"))}
+    if "name_key" not in columns:
+        conn.execute(text("ALTER TABLE patients ADD COLUMN name_key VARCHAR"))
+
+    table = models.Patient.__table__
+    rows = conn.execute(
+        select(table.c.patient_id, table.c.first_name, table.c.last_name)
+        .where(table.c.name_key.is_(None))
+    ).all()
+    if rows:
+        conn.execute(
+            update(table)
+            .where(table.c.patient_id == bindparam("pid"))
+            .values(name_key=bindparam("key")),
+            [{"pid": pid, "key": models.fold_name(f"{first} {last}")} for pid, first, last in rows]
+        )
+    return len(rows)
+
+
+def upgrade_schema(conn) -> None:
+    """
+    Idempotent schema steps that metadata.create_all does not cover:
+    objects outside the ORM and additions to tables that already exist.
+    """
+    backfill_patient_name_keys(conn)
+
+    for table in models.Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name in UPGRADE_INDEXES:
+                index.create(bind=conn, checkfirst=True)
+    for name in RETIRED_INDEXES:
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+    conn.execute(text(LOINC_FTS_DDL))
+    create_data_version_triggers(conn)
+
+    indexed = conn.execute(text("SELECT 1 FROM loinc_fts LIMIT 1")).first()
+    seeded  = conn.execute(text("SELECT 1 FROM loinc LIMIT 1")).first()
+    if seeded and not indexed:
+        rebuild_loinc_search_index(conn)
+
+    refresh_state_intervals(conn)
+
+    # Refresh planner statistics so the new indexes are preferred
+    conn.execute(text("PRAGMA optimize"))
+
+
+def ensure_schema(sync_url: str):
+    """
+    Brings the database at sync_url (sync driver URL) up to the current schema:
+    missing tables, then upgrade_schema. Every entry point (cli.py, app.py)
+    runs this before its first query. Returns the sync engine it used.
+    """
+    sync_engine = create_engine(sync_url, future=True, **pool_options(sync_url))
+    apply_sqlite_profile(sync_engine)
+    models.Base.metadata.create_all(bind=sync_engine)
+    with sync_engine.begin() as conn:
+        upgrade_schema(conn)
+    return sync_engine
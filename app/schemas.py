@@ -9,7 +9,9 @@ class ObservationBase(BaseModel):
     start: datetime
     end: Optional[datetime] = None
 
-class ObservationCreate(ObservationBase): ...
+class ObservationCreate(ObservationBase):
+    # Recording time; defaults to now (set for historical imports)
+    txn_start: Optional[datetime] = None
 
 class ObservationOut(ObservationBase):
     obs_id: int
@@ -29,3 +31,12 @@ class PatientOut(PatientBase):
     observations: List[ObservationOut] = []
     class Config:
         orm_mode = True
+
+class ObservationCorrection(BaseModel):
+    patient_id: int
+    loinc_num: str
+    # Valid time of the measurement to correct; None on a deletion means the latest one
+    measured_at: Optional[datetime] = None
+    txn_at: datetime
+    # None deletes the measurement
+    new_value: Optional[float] = None
@@ -0,0 +1,195 @@
+# app/synthetic.py
+import math
+import random
+from datetime import datetime, timedelta
+
+from faker import Faker
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud, schemas
+from app.knowledge_base import compiled_kb
+
+# Relative frequency of each LOINC in a patient's series
+DEFAULT_LOINC_MIX = {
+    crud.HEMOGLOBIN_LOINC: 4,
+    crud.WBC_LOINC:        3,
+    crud.FEVER_LOINC:      3,
+    crud.CHILLS_LOINC:     1,
+    crud.SKIN_LOINC:       1,
+    crud.ALLERGY_LOINC:    1,
+}
+
+# Fixed default anchor so the same seed always yields the same database
+DEFAULT_START = datetime(2024, 1, 1)
+
+# Patients written (and committed) per transaction
+GENERATOR_BATCH_PATIENTS = 1000
+
+
+def parse_loinc_mix(text: str) -> dict:
+    """Parses '718-7=4,11218-5=3' into {loinc: weight}."""
+    mix = {}
+    for part in text.split(","):
+        if not part.strip():
+            continue
+        code, _, weight = part.partition("=")
+        code = code.strip()
+        if code not in SERIES:
+            raise ValueError(f"No synthetic series for LOINC {code}")
+        mix[code] = float(weight) if weight.strip() else 1.0
+    if not mix:
+        raise ValueError("Empty LOINC mix")
+    return mix
+
+
+# ── Per-LOINC series: init(rng, gender) -> state, step(rng, state) -> (state, value) ──
+
+def _hemoglobin_init(rng, gender):
+    # Baselines spread wide enough to cover every hemoglobin_state band
+    mean = 14.5 if gender == "M" else 12.8
+    return {"base": min(max(rng.gauss(mean, 2.2), 6.0), 18.5), "h": None}
+
+def _hemoglobin_step(rng, state):
+    h = state["base"] if state["h"] is None else state["h"]
+    h = h + 0.25 * (state["base"] - h) + rng.gauss(0, 0.6)
+    state["h"] = min(max(h, 4.0), 21.0)
+    return state, round(state["h"], 1)
+
+def _wbc_init(rng, gender):
+    return {"base": rng.gauss(math.log(7000), 0.45), "w": None}
+
+def _wbc_step(rng, state):
+    w = state["base"] if state["w"] is None else state["w"]
+    state["w"] = w + 0.3 * (state["base"] - w) + rng.gauss(0, 0.15)
+    return state, float(round(math.exp(state["w"])))
+
+def _fever_init(rng, gender):
+    return {"episode": 0}
+
+def _fever_step(rng, state):
+    # Febrile episodes last a few readings
+    if state["episode"] == 0 and rng.random() < 0.08:
+        state["episode"] = rng.randint(1, 4)
+    if state["episode"]:
+        state["episode"] -= 1
+        return state, round(rng.uniform(38.3, 41.0), 1)
+    return state, round(rng.gauss(36.9, 0.35), 1)
+
+def _categorical(feature):
+    def init(rng, gender):
+        # Read per patient, so codes follow a reloaded knowledge base
+        codes = sorted(compiled_kb().tables["toxicity_codes"][feature])
+        levels = len(codes)
+        return {"codes": codes, "level": rng.choices(range(levels), weights=[levels - i for i in range(levels)])[0]}
+
+    def step(rng, state):
+        # Sticky Markov chain: mostly keep the grade, otherwise move one step
+        if rng.random() > 0.8:
+            state["level"] = min(max(state["level"] + rng.choice((-1, 1)), 0), len(state["codes"]) - 1)
+        return state, float(state["codes"][state["level"]])
+
+    return init, step
+
+SERIES = {
+    crud.HEMOGLOBIN_LOINC: (_hemoglobin_init, _hemoglobin_step),
+    crud.WBC_LOINC:        (_wbc_init, _wbc_step),
+    crud.FEVER_LOINC:      (_fever_init, _fever_step),
+    crud.CHILLS_LOINC:     _categorical("Chills"),
+    crud.SKIN_LOINC:       _categorical("Skin-look"),
+    crud.ALLERGY_LOINC:    _categorical("Allergic-state"),
+}
+
+
+def patient_observations(
+    rng: random.Random,
+    patient_id: int,
+    gender: str,
+    obs_per_patient: int,
+    start: datetime,
+    span_days: float,
+    loinc_mix: dict,
+    correction_rate: float
+):
+    """
+    Yields ObservationCreate for one patient's longitudinal series in time order.
+    A correction_rate share of results is re-recorded later with a revised value.
+    """
+    codes = list(loinc_mix)
+    weights = [loinc_mix[c] for c in codes]
+    states = {c: SERIES[c][0](rng, gender) for c in codes}
+    span = span_days * 86400
+
+    offsets = sorted(rng.uniform(0, span) for _ in range(obs_per_patient))
+    for offset in offsets:
+        code = rng.choices(codes, weights=weights)[0]
+        states[code], value = SERIES[code][1](rng, states[code])
+        valid_start = start + timedelta(seconds=int(offset))
+        recorded = valid_start + timedelta(minutes=rng.randint(5, 360))
+        yield schemas.ObservationCreate(
+            patient_id=patient_id, loinc_num=code, value_num=value,
+            start=valid_start, txn_start=recorded
+        )
+        if rng.random() < correction_rate:
+            _, revised = SERIES[code][1](rng, dict(states[code]))
+            yield schemas.ObservationCreate(
+                patient_id=patient_id, loinc_num=code, value_num=revised,
+                start=valid_start, txn_start=recorded + timedelta(hours=rng.randint(1, 72))
+            )
+
+
+async def generate_cohort(
+    db: AsyncSession,
+    seed: int,
+    patients: int,
+    obs_per_patient: int,
+    span_days: float = 365,
+    loinc_mix: dict = None,
+    correction_rate: float = 0.02,
+    start: datetime = DEFAULT_START,
+    batch_patients: int = GENERATOR_BATCH_PATIENTS,
+    progress=None
+) -> dict:
+    """
+    Writes a reproducible synthetic cohort through the bulk paths, one transaction
+    per batch of patients. The same arguments always produce the same data.
+    progress(summary) is called after each batch. Returns the summary dict.
+    """
+    loinc_mix = loinc_mix or DEFAULT_LOINC_MIX
+    fake = Faker()
+    fake.seed_instance(seed)
+    summary = {"patients": 0, "observations": 0, "corrections": 0}
+
+    for first in range(0, patients, batch_patients):
+        count = min(batch_patients, patients - first)
+        people = []
+        for i in range(first, first + count):
+            rng = random.Random(f"{seed}:{i}:patient")
+            gender = rng.choice(("M", "F"))
+            people.append(schemas.PatientCreate(
+                first_name=fake.first_name_male() if gender == "M" else fake.first_name_female(),
+                last_name=fake.last_name(),
+                gender=gender,
+                birth_date=start - timedelta(days=rng.randint(18 * 365, 90 * 365))
+            ))
+        patient_ids = await crud.create_patients_bulk(db, people, commit=False)
+
+        def observations():
+            for i, (pid, person) in enumerate(zip(patient_ids, people), first):
+                # Per-patient stream: a patient's series does not depend on batching
+                rng = random.Random(f"{seed}:{i}:series")
+                yield from patient_observations(
+                    rng, pid, person.gender, obs_per_patient,
+                    start, span_days, loinc_mix, correction_rate
+                )
+
+        obs_ids = await crud.create_observations_bulk(db, observations(), commit=False)
+        corrections = await crud.close_superseded_versions(db, patient_ids)
+        await db.commit()
+
+        summary["patients"] += count
+        summary["observations"] += len(obs_ids)
+        summary["corrections"] += corrections
+        if progress:
+            progress(summary)
+
+    return summary
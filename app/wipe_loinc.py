@@ -1,8 +1,12 @@
 # wipe_loinc.py
-from models import Loinc
+from sqlalchemy import text
+from models import Loinc, Meta
 from database import SyncSession
 
 with SyncSession() as db:
     db.query(Loinc).delete()
+    db.execute(text("DELETE FROM loinc_fts"))
+    # Forget the seeded CSV hash so the next start reseeds
+    db.query(Meta).filter(Meta.key == "loinc_csv_sha256").delete()
     db.commit()
     print("LOINC table cleared.")
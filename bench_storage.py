@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# bench_storage.py
+"""
+Read/write concurrency benchmark for the SQLite storage profile.
+
+Runs one writer committing small observation batches alongside several
+readers computing latest rule values, against a scratch database: once with
+SQLite's defaults (rollback journal, synchronous=FULL) and once with
+SQLITE_PROFILE from app/config.py.
+
+    python bench_storage.py [--seconds 10] [--readers 4] [--patients 300] [--dir .]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, schemas, synthetic
+from app.config import SQLITE_PROFILE
+from app.database import Base, apply_sqlite_profile, pool_options
+
+BASELINE_PROFILE = {"journal_mode": "DELETE", "synchronous": "FULL"}
+
+WRITE_BATCH = 20        # observations per writer commit
+READ_BATCH  = 20        # patients per reader query
+
+
+def _engine(path: str, profile: dict):
+    url = f"sqlite+aiosqlite:///{path}"
+    engine = create_async_engine(url, future=True, **pool_options(url))
+    apply_sqlite_profile(engine, profile)
+    return engine, sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+async def _write(path, profile, patient_ids, start_at, seconds) -> dict:
+    engine, Session = _engine(path, profile)
+    stats = {"commits": 0, "errors": 0}
+    rng = random.Random(0)
+    when = synthetic.DEFAULT_START + timedelta(days=400)
+    await asyncio.sleep(max(0.0, start_at - time.time()))
+    async with Session() as db:
+        while time.time() < start_at + seconds:
+            batch = []
+            for _ in range(WRITE_BATCH):
+                when += timedelta(minutes=1)
+                batch.append(schemas.ObservationCreate(
+                    patient_id=rng.choice(patient_ids), loinc_num=crud.HEMOGLOBIN_LOINC,
+                    value_num=round(rng.uniform(8, 16), 1), start=when
+                ))
+            try:
+                await crud.create_observations_bulk(db, batch)
+                stats["commits"] += 1
+            except Exception:
+                stats["errors"] += 1
+    await engine.dispose()
+    return stats
+
+
+async def _read(n, path, profile, patient_ids, start_at, seconds) -> dict:
+    engine, Session = _engine(path, profile)
+    stats = {"reads": 0, "errors": 0, "latencies": []}
+    rng = random.Random(n + 1)
+    await asyncio.sleep(max(0.0, start_at - time.time()))
+    async with Session() as db:
+        while time.time() < start_at + seconds:
+            ids = rng.sample(patient_ids, min(READ_BATCH, len(patient_ids)))
+            started = time.perf_counter()
+            try:
+                await crud.latest_values_for_patients(db, ids, crud.TREATMENT_LOINCS)
+                stats["reads"] += 1
+                stats["latencies"].append(time.perf_counter() - started)
+            except Exception:
+                stats["errors"] += 1
+            await db.rollback()     # end the read transaction, as each GUI request does
+    await engine.dispose()
+    return stats
+
+
+def _run_worker(role, *args) -> dict:
+    # Separate processes, like separate GUI/CLI instances: contention is SQLite's, not the GIL's
+    return asyncio.run(_write(*args) if role == "write" else _read(*args))
+
+
+async def _prepare(path: str, profile: dict, patients: int) -> list:
+    engine, Session = _engine(path, profile)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with Session() as db:
+        await synthetic.generate_cohort(db, seed=1, patients=patients, obs_per_patient=40)
+        patient_ids = [p.patient_id for p in await crud.list_patients(db)]
+    await engine.dispose()
+    return patient_ids
+
+
+def run_profile(label: str, profile: dict, args) -> dict:
+    path = os.path.join(tempfile.mkdtemp(prefix="cdss-bench-", dir=args.dir), "bench.db")
+    patient_ids = asyncio.run(_prepare(path, profile, args.patients))
+
+    start_at = time.time() + 2.0    # let every worker import and connect first
+    with ProcessPoolExecutor(max_workers=args.readers + 1) as pool:
+        writer = pool.submit(_run_worker, "write", path, profile, patient_ids, start_at, args.seconds)
+        readers = [
+            pool.submit(_run_worker, "read", n, path, profile, patient_ids, start_at, args.seconds)
+            for n in range(args.readers)
+        ]
+        written = writer.result()
+        read = [r.result() for r in readers]
+
+    latencies = sorted(lat for r in read for lat in r["latencies"]) or [0.0]
+    return {
+        "label": label,
+        "commits_per_s": written["commits"] / args.seconds,
+        "reads_per_s": sum(r["reads"] for r in read) / args.seconds,
+        "read_p50_ms": statistics.median(latencies) * 1000,
+        "read_p95_ms": latencies[int((len(latencies) - 1) * 0.95)] * 1000,
+        "errors": written["errors"] + sum(r["errors"] for r in read),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the SQLite storage profile.")
+    parser.add_argument("--seconds", type=float, default=10, help="duration of each run")
+    parser.add_argument("--readers", type=int, default=4, help="concurrent reader sessions")
+    parser.add_argument("--patients", type=int, default=300, help="patients in the scratch cohort")
+    parser.add_argument("--dir", default=".", help="where to create the scratch database (use a real disk)")
+    return parser.parse_args(argv)
+
+
+def main(args):
+    results = [
+        run_profile("defaults", BASELINE_PROFILE, args),
+        run_profile("profile", SQLITE_PROFILE, args),
+    ]
+    print(f"{'run':<10}{'commits/s':>11}{'reads/s':>10}{'read p50 ms':>13}{'read p95 ms':>13}{'errors':>8}")
+    for r in results:
+        print(
+            f"{r['label']:<10}{r['commits_per_s']:>11.1f}{r['reads_per_s']:>10.1f}"
+            f"{r['read_p50_ms']:>13.2f}{r['read_p95_ms']:>13.2f}"
+            f"{r['errors']:>8}",
+            flush=True
+        )
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -1,65 +1,84 @@
 #!/usr/bin/env python
 
 import os
+import argparse
 import asyncio
+import hashlib
 import random
 import pandas as pd
 from faker import Faker
-from datetime import datetime
-from sqlalchemy import create_engine
+from datetime import datetime, timedelta
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import select
-from app.knowledge_base import hemoglobin_state, hematological_state, treatment_rules
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from app.crud import get_hemoglobin_state, get_hematological_state, get_treatment
 from app import models
-from app.config import DATABASE_URL
-from app.database import Base, SessionLocal
-from app.models import Loinc
+from app.database import SYNC_DATABASE_URL, SessionLocal
+from app.schema import ensure_schema, rebuild_loinc_search_index
+from app.models import Loinc, Meta
 from app import crud, schemas
-from app.crud import (
-    get_hemoglobin_state,
-    get_hematological_state,
-    get_treatment,
-    get_hemoglobin_state_with_timing,
-    infer_state_intervals,
-    filter_intervals_by_state,
-    observations_history  # ✅ ADD THIS LINE
-)
+from app.importer import import_observations
+from app import synthetic
 
 
 # ── 1) Sync schema & engine ──────────────────────────────────────────────────
-sync_url    = DATABASE_URL.replace("sqlite+aiosqlite", "sqlite")
-sync_engine = create_engine(sync_url, future=True)
+sync_engine = ensure_schema(SYNC_DATABASE_URL)
 SyncSession = sessionmaker(bind=sync_engine, autoflush=False, autocommit=False)
-Base.metadata.create_all(bind=sync_engine)
 
 # ── 2) Seed LOINC locally from CSV ─────────────────────────────────────────────
-def seed_loinc_from_csv():
+LOINC_CSV_PATH   = "L_TableCore.csv"
+LOINC_HASH_KEY   = "loinc_csv_sha256"
+LOINC_CHUNK_ROWS = 20000
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def seed_loinc_from_csv(path: str = LOINC_CSV_PATH):
     try:
-        df = pd.read_csv(
-            "L_TableCore.csv",
-            usecols=["LOINC_NUM","LONG_COMMON_NAME"],
-            dtype=str
-        ).dropna(subset=["LOINC_NUM","LONG_COMMON_NAME"])
-    except Exception as e:
+        digest = file_sha256(path)
+    except OSError as e:
         print(f"Skipping LOINC seed ({e})", flush=True)
         return
 
     with SyncSession() as db:
-        count = db.query(Loinc).count()
-        if count >= 104673:
-            print(f"LOINC already seeded ({count} rows), skipping.", flush=True)
+        meta = db.get(Meta, LOINC_HASH_KEY)
+        if meta and meta.value == digest:
+            print("LOINC already seeded from this file, skipping.", flush=True)
             return
 
-    print(f"Seeding {len(df)} LOINC entries from CSV...", flush=True)
+    try:
+        reader = pd.read_csv(
+            path,
+            usecols=["LOINC_NUM","LONG_COMMON_NAME"],
+            dtype=str,
+            chunksize=LOINC_CHUNK_ROWS
+        )
+    except Exception as e:
+        print(f"Skipping LOINC seed ({e})", flush=True)
+        return
+
+    print(f"Seeding LOINC entries from {path}...", flush=True)
+    upsert = sqlite_insert(Loinc).prefix_with("OR REPLACE")
+    total = 0
+    # One transaction: either the whole file and its hash land, or nothing does
     with SyncSession() as db:
-        for _, r in df.iterrows():
-            db.merge(Loinc(
-                loinc_num   = r["LOINC_NUM"],
-                common_name = r["LONG_COMMON_NAME"]
-            ))
+        for chunk in reader:
+            chunk = chunk.dropna(subset=["LOINC_NUM","LONG_COMMON_NAME"])
+            rows = [
+                {"loinc_num": code, "common_name": name}
+                for code, name in zip(chunk["LOINC_NUM"], chunk["LONG_COMMON_NAME"])
+            ]
+            if rows:
+                db.execute(upsert, rows)
+                total += len(rows)
+        rebuild_loinc_search_index(db.connection())
+        db.merge(Meta(key=LOINC_HASH_KEY, value=digest))
         db.commit()
-    print("Local LOINC seeded.\n", flush=True)
+    crud.invalidate_loinc_cache()
+    print(f"Local LOINC seeded ({total} rows).\n", flush=True)
 
 seed_loinc_from_csv()
 
@@ -102,6 +121,16 @@ def safe_datetime(prompt: str, allow_now: bool=False) -> datetime:
         except ValueError:
             print("Incorrect input – use format dd/mm/YYYY HH:MM or 'now'.", flush=True)
 
+def safe_optional_datetime(prompt: str):
+    while True:
+        s = input(prompt).strip()
+        if not s:
+            return None
+        try:
+            return datetime.strptime(s, DATE_IN)
+        except ValueError:
+            print("Incorrect input – use format dd/mm/YYYY HH:MM or leave empty.", flush=True)
+
 def fmt(dt: datetime) -> str:
     return dt.strftime(DATE_OUT) if dt else "None"
 
@@ -121,7 +150,10 @@ def print_menu():
     print("8. Show Hemoglobin State Intervals", flush=True)
     print("9. Show Specific Hemoglobin State Intervals", flush=True)
     print("10. Show Treatment Recommendation at Specific Time", flush=True)
-    print("11. Exit", flush=True)
+    print("11. Cohort Treatment Recommendations at Specific Time", flush=True)
+    print("12. Import Observations from CSV/Excel", flush=True)
+    print("13. Patients in Hemoglobin State During Window", flush=True)
+    print("14. Exit", flush=True)
 
 
 
@@ -169,6 +201,7 @@ async def show_history():
     loinc = input("LOINC Code: ").strip()
     since = safe_datetime("Since (dd/mm/YYYY HH:MM or now): ", allow_now=True)
     until = safe_datetime("Until (dd/mm/YYYY HH:MM or now): ", allow_now=True)
+    as_of = safe_optional_datetime("As known at (dd/mm/YYYY HH:MM, empty for now): ")
 
     # Define mappings for categorical LOINC values
     loinc_value_mappings = {
@@ -179,86 +212,133 @@ async def show_history():
 
     async with SessionLocal() as db:
         name = await crud.get_loinc_name(db, loinc) or "(no name)"
-        hist = await crud.observations_history(db, pid, loinc, since, until)
 
-    if not hist:
-        print("No results.", flush=True)
-        return
+        # Rows are printed as they stream in, however long the history is
+        count = 0
+        async for o in crud.stream_observations_history(db, pid, loinc, since, until, as_of=as_of):
+            if count == 0:
+                print(f"\nLOINC: {loinc} – {name}", flush=True)
+            count += 1
+
+            display_value = o.value_num
+            if loinc in loinc_value_mappings:
+                display_value = loinc_value_mappings[loinc].get(int(o.value_num), f"Unknown({o.value_num})")
+
+            print(
+                f"ID={o.obs_id} value={display_value} "
+                f"valid=({fmt(o.valid_start)},{fmt(o.valid_end)}) "
+                f"txn=({fmt(o.txn_start)},{fmt(o.txn_end)})",
+                flush=True
+            )
 
-    print(f"\nLOINC: {loinc} – {name}", flush=True)
-    for o in hist:
-        display_value = o.value_num
-        if loinc in loinc_value_mappings:
-            display_value = loinc_value_mappings[loinc].get(int(o.value_num), f"Unknown({o.value_num})")
+    if not count:
+        print("No results.", flush=True)
 
-        print(
-            f"ID={o.obs_id} value={display_value} "
-            f"valid=({fmt(o.valid_start)},{fmt(o.valid_end)}) "
-            f"txn=({fmt(o.txn_start)},{fmt(o.txn_end)})",
-            flush=True
-        )
+async def resolve_test(db, test_input: str):
+    """Returns (loinc, common_name) for a LOINC code or test name, or (None, None)."""
+    loinc = test_input if "-" in test_input else await crud.get_loinc_code_by_name(db, test_input)
+    if not loinc:
+        return None, None
+    return loinc, await crud.get_loinc_name(db, loinc) or "(no name)"
+
+def print_correction_results(corrections, results, names):
+    for c, r in zip(corrections, results):
+        label = f"{c.loinc_num} – {names[c.loinc_num]}"
+        if r["status"] == "updated":
+            print(f"[updated] {label}: old ID={r['old_id']} -> new ID={r['new_id']} value={c.new_value}", flush=True)
+        elif r["status"] == "deleted":
+            print(f"[deleted] {label}: ID={r['old_id']} txn_end={fmt(c.txn_at)}", flush=True)
+        else:
+            when = f" measured at {fmt(c.measured_at)}" if c.measured_at else ""
+            print(f"[no match] {label}: no current observation{when}", flush=True)
+
+async def choose_patient(db, name: str):
+    """Resolves a full name to one patient, asking for the ID when several share it."""
+    candidates = await crud.find_patients_by_name(db, name)
+    if not candidates:
+        print("Patient not found.", flush=True)
+        return None
+    if len(candidates) == 1:
+        return candidates[0]
+    print(f"{len(candidates)} patients are called {name}:", flush=True)
+    for p in candidates:
+        print(f"  ID={p.patient_id} gender={p.gender} born={p.birth_date}", flush=True)
+    by_id = {p.patient_id: p for p in candidates}
+    while True:
+        pid = safe_int("Patient ID: ")
+        if pid in by_id:
+            return by_id[pid]
+        print("Choose one of the IDs listed above.", flush=True)
 
 async def retro_update():
     print("\n== Retroactive Update ==", flush=True)
     name = input("Patient full name (First Last): ").strip()
-    test_input = input("Test name or LOINC Code: ").strip()
 
     async with SessionLocal() as db:
-        # Determine whether it's a code or a name
-        loinc = test_input if "-" in test_input else await crud.get_loinc_code_by_name(db, test_input)
+        patient = await choose_patient(db, name)
+    if not patient:
+        return
+
+    # Collect every correction first; they are applied together in one transaction
+    corrections, names = [], {}
+    while True:
+        test_input = input("Test name or LOINC Code: ").strip()
+        async with SessionLocal() as db:
+            loinc, common_name = await resolve_test(db, test_input)
         if not loinc:
             print("Test not found by name or code.", flush=True)
-            return
-
-        common_name = await crud.get_loinc_name(db, loinc) or "(no name)"
-        print(f"Resolved test: {loinc} – {common_name}", flush=True)
-
-        # Show value options if needed
-        if loinc == "75326-8":
-            print("Chills options: 0=None, 1=Shaking, 2=Rigor", flush=True)
-        elif loinc == "39106-0":
-            print("Skin look options: 0=Erythema, 1=Vesiculation, 2=Desquamation, 3=Exfoliation", flush=True)
-        elif loinc == "69730-0":
-            print("Allergic state options: 0=Edema, 1=Bronchospasm, 2=Severe-Bronchospasm, 3=Anaphylactic-Shock", flush=True)
+        else:
+            names[loinc] = common_name
+            print(f"Resolved test: {loinc} – {common_name}", flush=True)
+
+            # Show value options if needed
+            if loinc == "75326-8":
+                print("Chills options: 0=None, 1=Shaking, 2=Rigor", flush=True)
+            elif loinc == "39106-0":
+                print("Skin look options: 0=Erythema, 1=Vesiculation, 2=Desquamation, 3=Exfoliation", flush=True)
+            elif loinc == "69730-0":
+                print("Allergic state options: 0=Edema, 1=Bronchospasm, 2=Severe-Bronchospasm, 3=Anaphylactic-Shock", flush=True)
+
+            measured = safe_datetime("Measured at (dd/mm/YYYY HH:MM or now): ", allow_now=True)
+            txn_at = safe_datetime("Update at (dd/mm/YYYY HH:MM or now): ", allow_now=True)
+
+            new_val = None
+            if loinc in ("75326-8", "39106-0", "69730-0"):
+                try:
+                    new_val = float(input("New value (use number from options): ").strip())
+                except ValueError:
+                    print("Invalid input – must be numeric index from options.", flush=True)
+            else:
+                new_val = safe_float("New value: ")
+
+            if new_val is not None:
+                corrections.append(schemas.ObservationCorrection(
+                    patient_id=patient.patient_id, loinc_num=loinc,
+                    measured_at=measured, txn_at=txn_at, new_value=new_val
+                ))
 
-    measured = safe_datetime("Measured at (dd/mm/YYYY HH:MM or now): ", allow_now=True)
-    txn_at = safe_datetime("Update at (dd/mm/YYYY HH:MM or now): ", allow_now=True)
+        if input("Add another correction for this patient? (y/N): ").strip().lower() != "y":
+            break
 
-    if loinc in ("75326-8", "39106-0", "69730-0"):
-        try:
-            new_val = float(input("New value (use number from options): ").strip())
-        except ValueError:
-            print("Invalid input – must be numeric index from options.", flush=True)
-            return
-    else:
-        new_val = safe_float("New value: ")
-
-    # Execute update
+    if not corrections:
+        return
     async with SessionLocal() as db:
-        changed = await crud.retroactive_update(
-            db, name, loinc_code=loinc,
-            measured_at=measured, txn_at=txn_at,
-            new_value=new_val
-        )
-        if not changed:
-            print("No matching observation.", flush=True)
-        else:
-            old, new = changed
-            print(f"\nLOINC: {loinc} – {common_name}", flush=True)
-            print(f"[old] ID={old.obs_id} value={old.value_num} txn_end={fmt(old.txn_end)}", flush=True)
-            print(f"[new] ID={new.obs_id} value={new.value_num} txn_start={fmt(new.txn_start)}", flush=True)
+        results = await crud.apply_corrections(db, corrections)
+    print_correction_results(corrections, results, names)
 
-    # == Retroactive Delete ==
+async def retro_delete():
     print("\n== Retroactive Delete ==", flush=True)
     name = input("Patient full name (First Last): ").strip()
     test_input = input("Test name or LOINC Code: ").strip()
 
     async with SessionLocal() as db:
-        loinc = test_input if "-" in test_input else await crud.get_loinc_code_by_name(db, test_input)
+        patient = await choose_patient(db, name)
+        if not patient:
+            return
+        loinc, common_name = await resolve_test(db, test_input)
         if not loinc:
             print("Test not found by name or code.", flush=True)
             return
-        common_name = await crud.get_loinc_name(db, loinc) or "(no name)"
 
     delete_at = safe_datetime("Delete at (dd/mm/YYYY HH:MM or now): ", allow_now=True)
     meas_i = input("Measured at (optional, dd/mm/YYYY HH:MM or now; empty): ").strip()
@@ -267,19 +347,18 @@ async def retro_update():
     elif not meas_i:
         measured = None
     else:
-        measured = safe_datetime("Measured at (dd/mm/YYYY HH:MM): ")
+        try:
+            measured = datetime.strptime(meas_i, DATE_IN)
+        except ValueError:
+            measured = safe_datetime("Measured at (dd/mm/YYYY HH:MM): ")
 
+    corrections = [schemas.ObservationCorrection(
+        patient_id=patient.patient_id, loinc_num=loinc,
+        measured_at=measured, txn_at=delete_at, new_value=None
+    )]
     async with SessionLocal() as db:
-        deleted = await crud.retroactive_delete(
-            db, name, loinc_code=loinc,
-            delete_at=delete_at, measured_at=measured
-        )
-        if not deleted:
-            print("No matching observation.", flush=True)
-        else:
-            o = deleted[0]
-            print(f"\nLOINC: {loinc} – {common_name}", flush=True)
-            print(f"Deleted ID={o.obs_id} value={o.value_num} txn_end={fmt(o.txn_end)}", flush=True)
+        results = await crud.apply_corrections(db, corrections)
+    print_correction_results(corrections, results, {loinc: common_name})
 
 
 # async def retro_update():
@@ -358,7 +437,7 @@ async def create_fake():
     tests = df.to_dict("records")
 
     created_patients = []
-    created_observations = []
+    pending_observations = []
 
     async with SessionLocal() as db:
         for gender in ("M", "F"):
@@ -378,25 +457,23 @@ async def create_fake():
 
                 # 3) Hemoglobin
                 h_value = round(random.uniform(8.0, 17.0), 2)
-                obs = await crud.create_observation(db, schemas.ObservationCreate(
+                pending_observations.append(schemas.ObservationCreate(
                     patient_id = patient.patient_id,
                     loinc_num  = "718-7",
                     value_num  = h_value,
                     start      = start,
                     end        = start + pd.Timedelta(minutes=1)
                 ))
-                created_observations.append((obs.obs_id, obs.patient_id, obs.loinc_num, obs.value_num))
 
                 # 4) WBC
                 wbc_value = round(random.uniform(3000, 12000), 2)
-                obs = await crud.create_observation(db, schemas.ObservationCreate(
+                pending_observations.append(schemas.ObservationCreate(
                     patient_id = patient.patient_id,
                     loinc_num  = "11218-5",
                     value_num  = wbc_value,
                     start      = start,
                     end        = start + pd.Timedelta(minutes=1)
                 ))
-                created_observations.append((obs.obs_id, obs.patient_id, obs.loinc_num, obs.value_num))
 
                 # 5) Toxicity symptoms (aligned with grade encoding)
                 toxicity_tests = [
@@ -406,14 +483,13 @@ async def create_fake():
                     ("69730-0", random.choice([0, 1, 2, 3]))               # Allergic-state: Edema → Anaphylactic shock
                 ]
                 for code, value in toxicity_tests:
-                    obs = await crud.create_observation(db, schemas.ObservationCreate(
+                    pending_observations.append(schemas.ObservationCreate(
                         patient_id = patient.patient_id,
                         loinc_num  = code,
                         value_num  = value,
                         start      = start,
                         end        = start + pd.Timedelta(minutes=1)
                     ))
-                    created_observations.append((obs.obs_id, obs.patient_id, obs.loinc_num, obs.value_num))
 
                 # 6) Extra Excel observations
                 for t in random.sample(tests, min(2, len(tests))):
@@ -428,14 +504,16 @@ async def create_fake():
                         print(f"  Skipping non-numeric value {val!r}", flush=True)
                         continue
                     start = pd.to_datetime(dt)
-                    obs = await crud.create_observation(db, schemas.ObservationCreate(
+                    pending_observations.append(schemas.ObservationCreate(
                         patient_id = patient.patient_id,
                         loinc_num  = str(code),
                         value_num  = num,
                         start      = start,
                         end        = start + pd.Timedelta(minutes=1)
                     ))
-                    created_observations.append((obs.obs_id, obs.patient_id, obs.loinc_num, obs.value_num))
+
+        # 7) All observations in one transaction
+        obs_ids = await crud.create_observations_bulk(db, pending_observations)
 
     # summary
     print("\nPatients created:", flush=True)
@@ -443,8 +521,8 @@ async def create_fake():
         print(f"  • ID={pid}  Name={fn} {ln}  Gender={g}", flush=True)
 
     print("\nObservations created:", flush=True)
-    for oid, pid, lo, val in created_observations:
-        print(f"  • ObsID={oid}  PatientID={pid}  LOINC={lo}  Value={val}", flush=True)
+    for oid, obs in zip(obs_ids, pending_observations):
+        print(f"  • ObsID={oid}  PatientID={obs.patient_id}  LOINC={obs.loinc_num}  Value={obs.value_num}", flush=True)
 
 def demo_reasoning():
     gender = "Female"
@@ -471,23 +549,22 @@ async def show_hemoglobin_state_intervals():
     since = safe_datetime("Since (dd/mm/YYYY HH:MM or now): ", allow_now=True)
     until = safe_datetime("Until (dd/mm/YYYY HH:MM or now): ", allow_now=True)
 
-    # Query observations
     async with SessionLocal() as db:
-        hist = await crud.observations_history(db, pid, "718-7", since, until)  # 718-7 is LOINC for Hemoglobin
-        if not hist:
-            print("No hemoglobin observations found.", flush=True)
-            return
-
-        # Get patient gender to apply correct rules
         patient = await db.get(models.Patient, pid)
+        if not patient:
+            print("Patient not found.", flush=True)
+            return
         gender = "Male" if patient.gender.upper() == "M" else "Female"
 
-        # Build list of (timestamp, value) tuples
-        observations = [(o.valid_start, o.value_num) for o in hist]
-
-        # Use temporal reasoning logic from crud.py
-        intervals = crud.infer_state_intervals(observations, gender, crud.get_hemoglobin_state_with_timing)
+        # Answered from the patient's interval tree
+        intervals = await crud.get_state_intervals(db, pid, since, until)
+        nearest = [] if intervals else await crud.get_nearest_state_intervals(db, pid, since)
 
+    if not intervals:
+        print("No hemoglobin observations found in that window.", flush=True)
+        for row in nearest:
+            print(f"Nearest: {row['state']} [valid {row['start']} to {row['end']}] (value={row['value']})", flush=True)
+        return
 
     # Print results
     print(f"\nInferred Hemoglobin States for Patient {pid} ({gender}):", flush=True)
@@ -507,16 +584,10 @@ async def show_specific_hemo_state_ranges():
     until = safe_datetime("Until (dd/mm/YYYY HH:MM or now): ", allow_now=True)
 
     async with SessionLocal() as db:
-        hist = await observations_history(db, pid, "718-7", since, until)
-        if not hist:
-            print("No hemoglobin observations found.", flush=True)
+        if not await db.get(models.Patient, pid):
+            print("Patient not found.", flush=True)
             return
-
-        patient = await db.get(models.Patient, pid)
-        gender = "Male" if patient.gender.upper() == "M" else "Female"
-        observations = [(o.valid_start, o.value_num) for o in hist]
-        intervals = infer_state_intervals(observations, gender, get_hemoglobin_state_with_timing)
-        filtered = filter_intervals_by_state(intervals, target_state)
+        filtered = await crud.get_state_intervals(db, pid, since, until, state=target_state)
 
     if not filtered:
         print(f"No intervals found for state '{target_state}'.", flush=True)
@@ -526,13 +597,41 @@ async def show_specific_hemo_state_ranges():
     for row in filtered:
         print(f"  From {row['start']} to {row['end']} (value={row['value']})", flush=True)
 
+async def show_patients_in_state():
+    print("\n== Patients in Hemoglobin State During Window ==", flush=True)
+    target_state = input("State (e.g., Severe Anemia): ").strip()
+    since = safe_datetime("From (dd/mm/YYYY HH:MM or now): ", allow_now=True)
+    until = safe_datetime("To (dd/mm/YYYY HH:MM or now): ", allow_now=True)
+    hours = input("Minimum time in state, hours (empty for any): ").strip()
+    try:
+        min_overlap = timedelta(hours=float(hours)) if hours else timedelta(0)
+    except ValueError:
+        print("Invalid number of hours.", flush=True)
+        return
+
+    async with SessionLocal() as db:
+        matches = await crud.patients_in_state(db, target_state, since, until, min_overlap=min_overlap)
+
+    if not matches:
+        print(f"No patients in '{target_state}' during that window.", flush=True)
+        return
+
+    print(f"\n{len(matches)} patient(s) in '{target_state}':", flush=True)
+    for m in matches:
+        print(
+            f"Patient {m['patient_id']} ({m['name']}): {m['overlap']} in state "
+            f"over {m['intervals']} interval(s), {fmt(m['first_start'])} – {fmt(m['last_end'])}",
+            flush=True
+        )
+
 async def show_treatment_recommendation():
     print("\n== Treatment Recommendation ==", flush=True)
     pid = safe_int("Patient ID: ")
     time_point = safe_datetime("Time to evaluate (dd/mm/YYYY HH:MM or now): ", allow_now=True)
+    as_of = safe_optional_datetime("As known at (dd/mm/YYYY HH:MM, empty for now): ")
 
     async with SessionLocal() as db:
-        result = await crud.get_current_treatment_at_time(db, pid, time_point)
+        result = await crud.get_current_treatment_at_time(db, pid, time_point, as_of=as_of)
 
         if isinstance(result, str):
             print(f"⚠️ {result}", flush=True)
@@ -543,50 +642,70 @@ async def show_treatment_recommendation():
         print(f"Hemoglobin: {result['hemoglobin_value']} → {result['hemoglobin_state']}")
         print(f"WBC: {result['wbc_value']} → {result['hematological_state']}")
 
-        # Value label mappings
-        chills_map = {0: "None", 1: "Shaking", 2: "Rigor"}
-        skin_map = {0: "Erythema", 1: "Vesiculation", 2: "Desquamation", 3: "Exfoliation"}
-        allergy_map = {0: "Edema", 1: "Bronchospasm", 2: "Severe-Bronchospasm", 3: "Anaphylactic-Shock"}
-
-        # Fetch toxicity-related values
-        async def fetch_val(loinc):
-            q = await db.execute(
-                select(models.Observation)
-                .where(models.Observation.patient_id == pid)
-                .where(models.Observation.loinc_num == loinc)
-                .where(models.Observation.valid_start <= time_point)
-                .where((models.Observation.valid_end == None) | (models.Observation.valid_end >= time_point))
-                .order_by(models.Observation.valid_start.desc())
-            )
-            return q.scalars().first()
-
-        chills_obs = await fetch_val("75326-8")
-        skin_obs = await fetch_val("39106-0")
-        allergy_obs = await fetch_val("69730-0")
-
+        # Toxicity labels come from the same snapshot used for the rules
         print("\nToxicity-related Observations:")
-        if chills_obs:
-            print(f"Chills: {chills_map.get(int(chills_obs.value_num), f'Unknown({chills_obs.value_num})')}")
-        else:
-            print("Chills: Not available")
-
-        if skin_obs:
-            print(f"Skin look: {skin_map.get(int(skin_obs.value_num), f'Unknown({skin_obs.value_num})')}")
-        else:
-            print("Skin look: Not available")
-
-        if allergy_obs:
-            print(f"Allergic state: {allergy_map.get(int(allergy_obs.value_num), f'Unknown({allergy_obs.value_num})')}")
-        else:
-            print("Allergic state: Not available")
+        print(f"Fever: {result['fever']}")
+        print(f"Chills: {result['chills']}")
+        print(f"Skin look: {result['skin_look']}")
+        print(f"Allergic state: {result['allergic_state']}")
 
         # Final treatment recommendation
         print("\nRecommended treatment:")
         for line in result["treatment"]:
             print(f" - {line}")
 
+async def show_cohort_treatment():
+    print("\n== Cohort Treatment Recommendations ==", flush=True)
+    ids_input = input("Patient IDs (comma separated, empty for all): ").strip()
+    try:
+        patient_ids = [int(x) for x in ids_input.split(",") if x.strip()] or None
+    except ValueError:
+        print("Incorrect input – IDs must be whole numbers.", flush=True)
+        return
+    time_point = safe_datetime("Time to evaluate (dd/mm/YYYY HH:MM or now): ", allow_now=True)
+    as_of = safe_optional_datetime("As known at (dd/mm/YYYY HH:MM, empty for now): ")
+
+    evaluated = recommended = 0
+    async with SessionLocal() as db:
+        async for pid, result in crud.get_cohort_treatment_at_time(db, time_point, patient_ids, as_of=as_of):
+            evaluated += 1
+            if isinstance(result, str):
+                print(f"Patient {pid}: ⚠️ {result}", flush=True)
+                continue
+            recommended += 1
+            print(
+                f"Patient {pid}: {result['hemoglobin_state']} / {result['hematological_state']} / "
+                f"{result['toxicity_grade']} → {'; '.join(result['treatment'])}",
+                flush=True
+            )
+
+    print(f"\nEvaluated {evaluated} patients, {recommended} with a recommendation.", flush=True)
 
 
+async def import_observations_file():
+    print("\n== Import Observations ==", flush=True)
+    path = input(f"File path (CSV or Excel) [{PROJECT_DB_PATH}]: ").strip() or PROJECT_DB_PATH
+    if not os.path.exists(path):
+        print(f"File not found: '{path}'", flush=True)
+        return
+
+    def progress(report):
+        print(f"  read {report['read']} rows, imported {report['imported']}, skipped {report['skipped']}", flush=True)
+
+    async with SessionLocal() as db:
+        try:
+            report = await import_observations(db, path, progress=progress)
+        except Exception as e:
+            print(f"Import failed, nothing was saved: {e}", flush=True)
+            return
+
+    print(
+        f"\nImported {report['imported']} of {report['read']} rows "
+        f"({report['skipped']} skipped, {report['superseded']} superseded versions closed).",
+        flush=True
+    )
+    for err in report["errors"]:
+        print(f"  • {err}", flush=True)
 
 
 async def main():
@@ -603,12 +722,78 @@ async def main():
         elif choice == "8": await show_hemoglobin_state_intervals()
         elif choice == "9": await show_specific_hemo_state_ranges()
         elif choice == "10": await show_treatment_recommendation()
-        elif choice == "11": break
+        elif choice == "11": await show_cohort_treatment()
+        elif choice == "12": await import_observations_file()
+        elif choice == "13": await show_patients_in_state()
+        elif choice == "14": break
         else:
             print("Invalid choice, please try again.", flush=True)
 
+# ── 5) Non-interactive subcommands ──────────────────────────────────────────
+async def generate(args):
+    try:
+        loinc_mix = synthetic.parse_loinc_mix(args.loinc_mix) if args.loinc_mix else None
+    except ValueError as e:
+        print(f"Invalid --loinc-mix: {e}", flush=True)
+        return
+
+    def progress(summary):
+        print(
+            f"  {summary['patients']}/{args.patients} patients, "
+            f"{summary['observations']} observations, {summary['corrections']} corrections",
+            flush=True
+        )
+
+    print(f"Generating synthetic cohort (seed={args.seed})...", flush=True)
+    async with SessionLocal() as db:
+        summary = await synthetic.generate_cohort(
+            db,
+            seed=args.seed,
+            patients=args.patients,
+            obs_per_patient=args.obs_per_patient,
+            span_days=args.span_days,
+            loinc_mix=loinc_mix,
+            correction_rate=args.corrections,
+            batch_patients=args.batch_patients,
+            progress=progress
+        )
+    print(f"Done: {summary['patients']} patients, {summary['observations']} observations.", flush=True)
+
+def export_kb(args):
+    from app import kb_loader
+    from app.knowledge_base import compiled_kb
+    try:
+        kb_loader.export_rule_tables(compiled_kb().tables, args.path)
+    except (OSError, ImportError) as e:
+        print(f"Could not export the knowledge base: {e}", flush=True)
+        return
+    print(f"Knowledge base written to {args.path} (load it with KB_RULES_PATH={args.path}).", flush=True)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="CDSS terminal interface (interactive menu when no command is given)")
+    commands = parser.add_subparsers(dest="command")
+
+    gen = commands.add_parser("generate", help="write a deterministic synthetic cohort for load testing")
+    gen.add_argument("--seed", type=int, default=0, help="random seed (same seed, same data)")
+    gen.add_argument("--patients", type=int, default=1000)
+    gen.add_argument("--obs-per-patient", type=int, default=50)
+    gen.add_argument("--span-days", type=float, default=365, help="time span of each patient's series")
+    gen.add_argument("--loinc-mix", default="", help="weights per LOINC, e.g. 718-7=4,11218-5=3 (default: all rule inputs)")
+    gen.add_argument("--corrections", type=float, default=0.02, help="share of results re-recorded retroactively")
+    gen.add_argument("--batch-patients", type=int, default=synthetic.GENERATOR_BATCH_PATIENTS, help="patients per transaction")
+
+    export = commands.add_parser("export-kb", help="write the current rule tables as editable files")
+    export.add_argument("path", help="a .yaml file, or a directory for one CSV per table")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    args = parse_args()
+    if args.command == "generate":
+        asyncio.run(generate(args))
+    elif args.command == "export-kb":
+        export_kb(args)
+    else:
+        asyncio.run(main())
 
 
 
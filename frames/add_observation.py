@@ -2,12 +2,11 @@
 import tkinter as tk
 from tkinter import messagebox
 from datetime import datetime
-import asyncio
-import threading
 
 from app.schemas import ObservationCreate
 from app.database import SessionLocal
 from app import crud
+from frames.worker import worker_for
 
 # Categorical LOINC value descriptions
 LOINC_MAPPINGS = {
@@ -107,18 +106,15 @@ def render(parent):
             end=end
         )
 
-        threading.Thread(target=create_observation_threadsafe, args=(data,)).start()
-
-    def create_observation_threadsafe(data):
-        asyncio.run(run_create_observation(data))
+        worker_for(frame).submit(
+            run_create_observation(data),
+            on_done=lambda obs: messagebox.showinfo("Success", f"Created observation ID: {obs.obs_id}"),
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to create observation:\n{e}")
+        )
 
     async def run_create_observation(data):
         async with SessionLocal() as db:
-            try:
-                obs = await crud.create_observation(db, data)
-                messagebox.showinfo("Success", f"Created observation ID: {obs.obs_id}")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to create observation:\n{e}")
+            return await crud.create_observation(db, data)
 
     submit_btn = tk.Button(frame, text="Submit", command=on_submit)
     submit_btn.grid(row=6, column=0, columnspan=2, pady=20)
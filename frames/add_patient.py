@@ -2,12 +2,11 @@
 import tkinter as tk
 from tkinter import messagebox
 from datetime import datetime
-import asyncio
-import threading
 
 from app.schemas import PatientCreate
 from app.database import SessionLocal
 from app import crud
+from frames.worker import worker_for
 
 def render(parent):
     frame = tk.Frame(parent, bg="white")
@@ -41,18 +40,15 @@ def render(parent):
             return
 
         data = PatientCreate(first_name=first, last_name=last, gender=gender, birth_date=birth_date)
-        threading.Thread(target=create_patient_threadsafe, args=(data,)).start()
-
-    def create_patient_threadsafe(data):
-        asyncio.run(run_create_patient(data))
+        worker_for(frame).submit(
+            run_create_patient(data),
+            on_done=lambda patient: messagebox.showinfo("Success", f"Created patient ID: {patient.patient_id}"),
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to create patient:\n{e}")
+        )
 
     async def run_create_patient(data):
         async with SessionLocal() as db:
-            try:
-                patient = await crud.create_patient(db, data)
-                messagebox.showinfo("Success", f"Created patient ID: {patient.patient_id}")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to create patient:\n{e}")
+            return await crud.create_patient(db, data)
 
     submit_btn = tk.Button(frame, text="Submit", command=on_submit)
     submit_btn.grid(row=len(labels) + 1, column=0, columnspan=2, pady=20)
@@ -2,11 +2,10 @@
 import tkinter as tk
 from tkinter import messagebox, scrolledtext
 from datetime import datetime
-import asyncio
-import threading
 
 from app.database import SessionLocal
 from app import crud, models
+from frames.worker import worker_for
 
 def render(parent):
     frame = tk.Frame(parent, bg="white")
@@ -40,29 +39,43 @@ def render(parent):
             messagebox.showerror("Error", f"Input error: {e}")
             return
 
-        threading.Thread(target=lambda: asyncio.run(fetch_intervals(pid, since, until))).start()
+        worker_for(frame).request(
+            frame, ("hemo_intervals", pid, since, until),
+            lambda: fetch_intervals(pid, since, until), on_done=show
+        )
+
+    def show(output_text):
+        output.delete("1.0", tk.END)
+        output.insert(tk.END, output_text)
 
     async def fetch_intervals(pid, since, until):
         async with SessionLocal() as db:
-            hist = await crud.observations_history(db, pid, "718-7", since, until)
-            if not hist:
-                output_text = "No hemoglobin observations found."
-            else:
-                patient = await db.get(models.Patient, pid)
-                gender = "Male" if patient.gender.upper() == "M" else "Female"
-                values = [(o.valid_start, o.value_num) for o in hist]
-                intervals = crud.infer_state_intervals(values, gender, crud.get_hemoglobin_state_with_timing)
+            patient = await db.get(models.Patient, pid)
+            if not patient:
+                return f"Patient {pid} not found."
+            intervals = await crud.get_state_intervals(db, pid, since, until)
+            nearest = [] if intervals else await crud.get_nearest_state_intervals(db, pid, since)
+        if not intervals:
+            output_text = "No hemoglobin observations found in that window.\n"
+            for row in nearest:
+                output_text += (
+                    f"Nearest: {row['state']} [valid {row['start']} to {row['end']}] "
+                    f"(value={row['value']})\n"
+                )
+            return output_text
+
+        gender = "Male" if patient.gender.upper() == "M" else "Female"
 
-                output_text = f"Patient {pid} ({gender}) Hemoglobin States:\n\n"
-                for row in intervals:
-                    output_text += (
-                        f"{row['obs_time']} → {row['state']} "
-                        f"[valid {row['start']} to {row['end']}] "
-                        f"(value={row['value']})\n"
-                    )
+        output_text = f"Patient {pid} ({gender}) Hemoglobin States:\n\n"
+        for row in intervals:
+            output_text += (
+                f"{row['obs_time']} → {row['state']} "
+                f"[valid {row['start']} to {row['end']}] "
+                f"(value={row['value']})\n"
+            )
+        return output_text
 
-            output.delete("1.0", tk.END)
-            output.insert(tk.END, output_text)
+    frame.bind("<Destroy>", lambda e: e.widget is frame and worker_for(parent).cancel(frame))
 
     tk.Button(frame, text="View Intervals", command=submit).pack(pady=10)
 
@@ -1,12 +1,10 @@
 # frames/patient_status.py
 import tkinter as tk
 from tkinter import ttk
-import asyncio
-import threading
 
-from app import models
+from app import crud
 from app.database import SessionLocal
-from sqlalchemy import select
+from frames.worker import worker_for
 
 # Selected LOINC codes to monitor
 LOINC_CODES = {
@@ -24,6 +22,9 @@ TOXICITY_MAPS = {
     "69730-0": {0: "Edema", 1: "Bronchospasm", 2: "Severe-Bronchospasm", 3: "Anaphylactic-Shock"}
 }
 
+# Patients shown (and fetched) per page
+PAGE_SIZE = 50
+
 def render(parent):
     frame = tk.Frame(parent, bg="white")
     frame.pack(expand=True, fill=tk.BOTH, padx=10, pady=10)
@@ -36,32 +37,56 @@ def render(parent):
         table.column(col, anchor="center", width=100)
     table.pack(expand=True, fill=tk.BOTH, pady=10)
 
+    nav = tk.Frame(frame, bg="white")
+    nav.pack(pady=5)
+    page = {"index": 0, "total": 0}
+    page_label = tk.Label(nav, text="", bg="white")
+
     def fetch_and_display():
-        threading.Thread(target=lambda: asyncio.run(populate_table(table))).start()
+        index = page["index"]
+        # Paging replaces the pending load; Refresh while loading joins it
+        worker_for(frame).request(
+            frame, ("patient_status", index),
+            lambda: load_page(index), on_done=lambda result: populate_table(table, *result)
+        )
+
+    def change_page(step):
+        last = max(0, (page["total"] - 1) // PAGE_SIZE)
+        page["index"] = min(max(0, page["index"] + step), last)
+        fetch_and_display()
 
-    async def populate_table(tree):
+    async def load_page(index):
         async with SessionLocal() as db:
-            tree.delete(*tree.get_children())
-            patients = await db.execute(select(models.Patient))
-            for patient in patients.scalars():
-                row = [f"{patient.first_name} {patient.last_name}"]
-                for code in LOINC_CODES.keys():
-                    obs = await db.execute(
-                        select(models.Observation)
-                        .where(models.Observation.patient_id == patient.patient_id)
-                        .where(models.Observation.loinc_num == code)
-                        .order_by(models.Observation.valid_start.desc())
-                        .limit(1)
-                    )
-                    latest = obs.scalars().first()
-                    if latest:
-                        val = latest.value_num
-                        if code in TOXICITY_MAPS:
-                            val = TOXICITY_MAPS[code].get(int(val), f"Unknown({val})")
-                    else:
-                        val = "-"
-                    row.append(val)
-                tree.insert("", tk.END, values=row)
+            total = await crud.count_patients(db)
+            patients = await crud.list_patients(db, offset=index * PAGE_SIZE, limit=PAGE_SIZE)
+            # One query for every (patient, LOINC) on the visible page
+            latest = await crud.latest_values_for_patients(
+                db, [p.patient_id for p in patients], LOINC_CODES.keys()
+            )
+        return total, patients, latest
+
+    def populate_table(tree, total, patients, latest):
+        page["total"] = total
+        tree.delete(*tree.get_children())
+        for patient in patients:
+            values = latest.get(patient.patient_id, {})
+            row = [f"{patient.first_name} {patient.last_name}"]
+            for code in LOINC_CODES.keys():
+                val = values.get(code)
+                if val is None:
+                    val = "-"
+                elif code in TOXICITY_MAPS:
+                    val = TOXICITY_MAPS[code].get(int(val), f"Unknown({val})")
+                row.append(val)
+            tree.insert("", tk.END, values=row)
+
+        pages = max(1, -(-page["total"] // PAGE_SIZE))
+        page_label.config(text=f"Page {page['index'] + 1} of {pages} ({page['total']} patients)")
+
+    frame.bind("<Destroy>", lambda e: e.widget is frame and worker_for(parent).cancel(frame))
 
-    tk.Button(frame, text="Refresh", command=fetch_and_display).pack(pady=5)
+    tk.Button(nav, text="< Prev", command=lambda: change_page(-1)).pack(side=tk.LEFT, padx=5)
+    page_label.pack(side=tk.LEFT, padx=5)
+    tk.Button(nav, text="Next >", command=lambda: change_page(1)).pack(side=tk.LEFT, padx=5)
+    tk.Button(nav, text="Refresh", command=fetch_and_display).pack(side=tk.LEFT, padx=5)
     fetch_and_display()
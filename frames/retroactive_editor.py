@@ -1,11 +1,10 @@
 import tkinter as tk
 from tkinter import messagebox
 from datetime import datetime
-import asyncio
-import threading
 
 from app.database import SessionLocal
-from app import crud
+from app import crud, schemas
+from frames.worker import worker_for
 
 def render(parent):
     notebook = tk.Frame(parent)
@@ -13,9 +12,14 @@ def render(parent):
 
     update_frame = tk.LabelFrame(notebook, text="Retroactive Update", padx=10, pady=10)
     delete_frame = tk.LabelFrame(notebook, text="Retroactive Delete", padx=10, pady=10)
+    batch_frame = tk.LabelFrame(notebook, text="Pending Batch", padx=10, pady=10)
 
     update_frame.pack(fill=tk.BOTH, expand=True, pady=10)
     delete_frame.pack(fill=tk.BOTH, expand=True, pady=10)
+    batch_frame.pack(fill=tk.BOTH, expand=True, pady=10)
+
+    # Raw (name, test, measured, txn, value) items; value None means delete
+    pending = []
 
     # ─── UPDATE SECTION ──────────────────────────────────────────────────────
     update_entries = {}
@@ -31,7 +35,7 @@ def render(parent):
         entry.grid(row=i, column=1, pady=2)
         update_entries[label] = entry
 
-    def submit_update():
+    def read_update():
         name = update_entries["Patient Name (First Last)"].get().strip()
         loinc_input = update_entries["LOINC Code or Test Name"].get().strip()
         try:
@@ -40,25 +44,21 @@ def render(parent):
             val = float(update_entries["New Value (use index for categorical)"].get().strip())
         except Exception as e:
             messagebox.showerror("Error", f"Input error: {e}")
-            return
+            return None
+        return (name, loinc_input, measured, txn, val)
 
-        threading.Thread(target=lambda: asyncio.run(run_update(name, loinc_input, measured, txn, val))).start()
-
-    async def run_update(name, loinc_or_name, measured, txn, val):
-        async with SessionLocal() as db:
-            # Try resolving name to LOINC if needed
-            loinc = loinc_or_name if "-" in loinc_or_name else await crud.get_loinc_code_by_name(db, loinc_or_name)
-            if not loinc:
-                messagebox.showerror("Error", f"Test '{loinc_or_name}' not found.")
-                return
+    def submit_update():
+        item = read_update()
+        if item:
+            worker_for(notebook).submit(run_batch([item]), on_done=show_result)
 
-            result = await crud.retroactive_update(db, name, loinc, measured, txn, val)
-            if not result:
-                messagebox.showinfo("Result", "No matching observation found.")
-            else:
-                messagebox.showinfo("Updated", f"Observation updated for LOINC {loinc}.")
+    def queue_update():
+        item = read_update()
+        if item:
+            add_pending(item)
 
-    tk.Button(update_frame, text="Submit Update", command=submit_update).grid(row=6, column=0, columnspan=2, pady=10)
+    tk.Button(update_frame, text="Submit Update", command=submit_update).grid(row=6, column=0, pady=10)
+    tk.Button(update_frame, text="Add to Batch", command=queue_update).grid(row=6, column=1, pady=10)
 
     # ─── DELETE SECTION ──────────────────────────────────────────────────────
     delete_entries = {}
@@ -73,7 +73,7 @@ def render(parent):
         entry.grid(row=i, column=1, pady=2)
         delete_entries[label] = entry
 
-    def submit_delete():
+    def read_delete():
         name = delete_entries["Patient Name (First Last)"].get().strip()
         loinc_input = delete_entries["LOINC Code or Test Name"].get().strip()
         try:
@@ -82,24 +82,88 @@ def render(parent):
             measured = None if not measured_input else parse_datetime(measured_input)
         except Exception as e:
             messagebox.showerror("Error", f"Input error: {e}")
-            return
-
-        threading.Thread(target=lambda: asyncio.run(run_delete(name, loinc_input, delete_at, measured))).start()
+            return None
+        return (name, loinc_input, measured, delete_at, None)
 
-    async def run_delete(name, loinc_or_name, delete_at, measured):
+    def submit_delete():
+        item = read_delete()
+        if item:
+            worker_for(notebook).submit(run_batch([item]), on_done=show_result)
+
+    def queue_delete():
+        item = read_delete()
+        if item:
+            add_pending(item)
+
+    tk.Button(delete_frame, text="Submit Delete", command=submit_delete).grid(row=5, column=0, pady=10)
+    tk.Button(delete_frame, text="Add to Batch", command=queue_delete).grid(row=5, column=1, pady=10)
+
+    # ─── BATCH SECTION ───────────────────────────────────────────────────────
+    pending_list = tk.Listbox(batch_frame, height=6, width=80)
+    pending_list.pack(fill=tk.BOTH, expand=True)
+
+    def add_pending(item):
+        name, test, measured, txn, val = item
+        action = "delete" if val is None else f"set {val}"
+        measured_text = measured.strftime("%d/%m/%Y %H:%M") if measured else "latest"
+        pending.append(item)
+        pending_list.insert(tk.END, f"{name} | {test} | measured {measured_text} | {action} at {txn.strftime('%d/%m/%Y %H:%M')}")
+
+    def clear_pending():
+        pending.clear()
+        pending_list.delete(0, tk.END)
+
+    def apply_pending():
+        if not pending:
+            messagebox.showinfo("Batch", "No pending corrections.")
+            return
+        items = list(pending)
+        clear_pending()
+        worker_for(notebook).submit(
+            run_batch(items), on_done=show_result,
+            on_error=lambda e: messagebox.showerror("Error", f"Batch rolled back: {e}")
+        )
+
+    buttons = tk.Frame(batch_frame)
+    buttons.pack(pady=5)
+    tk.Button(buttons, text="Apply Batch", command=apply_pending).pack(side=tk.LEFT, padx=5)
+    tk.Button(buttons, text="Clear", command=clear_pending).pack(side=tk.LEFT, padx=5)
+
+    async def run_batch(items):
+        """Resolves names and tests, then applies every correction in one transaction."""
+        corrections, lines = [], []
         async with SessionLocal() as db:
-            loinc = loinc_or_name if "-" in loinc_or_name else await crud.get_loinc_code_by_name(db, loinc_or_name)
-            if not loinc:
-                messagebox.showerror("Error", f"Test '{loinc_or_name}' not found.")
-                return
-
-            result = await crud.retroactive_delete(db, name, loinc, delete_at, measured)
-            if not result:
-                messagebox.showinfo("Result", "No matching observation found.")
-            else:
-                messagebox.showinfo("Deleted", f"Observation deleted for LOINC {loinc}.")
-
-    tk.Button(delete_frame, text="Submit Delete", command=submit_delete).grid(row=5, column=0, columnspan=2, pady=10)
+            patients, tests = {}, {}
+            for name, test, measured, txn, val in items:
+                if name not in patients:
+                    patients[name] = await crud.find_patients_by_name(db, name)
+                if test not in tests:
+                    tests[test] = test if "-" in test else await crud.get_loinc_code_by_name(db, test)
+                if not patients[name]:
+                    lines.append(f"{name} / {test}: patient not found")
+                elif len(patients[name]) > 1:
+                    ids = ", ".join(str(p.patient_id) for p in patients[name])
+                    lines.append(f"{name} / {test}: ambiguous name (patient IDs {ids})")
+                elif not tests[test]:
+                    lines.append(f"{name} / {test}: test not found")
+                else:
+                    corrections.append((name, schemas.ObservationCorrection(
+                        patient_id=patients[name][0].patient_id, loinc_num=tests[test],
+                        measured_at=measured, txn_at=txn, new_value=val
+                    )))
+
+            if corrections:
+                results = await crud.apply_corrections(db, [c for _, c in corrections])
+                for (name, c), r in zip(corrections, results):
+                    if r["status"] == "not_found":
+                        lines.append(f"{name} / {c.loinc_num}: no matching observation")
+                    else:
+                        lines.append(f"{name} / {c.loinc_num}: {r['status']}")
+
+        return lines
+
+    def show_result(lines):
+        messagebox.showinfo("Result", "\n".join(lines))
 
 # ─── Helpers ────────────────────────────────────────────────────────────────
 def parse_datetime(text):
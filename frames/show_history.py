@@ -2,11 +2,13 @@
 import tkinter as tk
 from tkinter import messagebox, scrolledtext
 from datetime import datetime
-import asyncio
-import threading
 
 from app.database import SessionLocal
 from app import crud
+from frames.worker import worker_for
+
+# History rows inserted into the output per widget update
+ROWS_PER_UPDATE = 200
 
 def render(parent):
     frame = tk.Frame(parent, bg="white")
@@ -18,7 +20,8 @@ def render(parent):
         "Patient ID",
         "LOINC Code",
         "Since (dd/mm/YYYY HH:MM or now)",
-        "Until (dd/mm/YYYY HH:MM or now)"
+        "Until (dd/mm/YYYY HH:MM or now)",
+        "Known As Of (optional: dd/mm/YYYY HH:MM)"
     ]
     entries = {}
 
@@ -41,36 +44,56 @@ def render(parent):
         loinc = entries["LOINC Code"].get().strip()
         since_raw = entries["Since (dd/mm/YYYY HH:MM or now)"].get().strip().lower()
         until_raw = entries["Until (dd/mm/YYYY HH:MM or now)"].get().strip().lower()
+        as_of_raw = entries["Known As Of (optional: dd/mm/YYYY HH:MM)"].get().strip()
 
         try:
             since = datetime.utcnow() if since_raw == "now" else datetime.strptime(since_raw, "%d/%m/%Y %H:%M")
             until = datetime.utcnow() if until_raw == "now" else datetime.strptime(until_raw, "%d/%m/%Y %H:%M")
+            as_of = datetime.strptime(as_of_raw, "%d/%m/%Y %H:%M") if as_of_raw else None
         except ValueError:
             messagebox.showerror("Input Error", "Invalid date format.")
             return
 
-        threading.Thread(target=fetch_history_threadsafe, args=(pid, loinc, since, until)).start()
+        # A new fetch replaces the one in flight; repeated clicks share one query.
+        # The slot is part of the key because streamed rows only reach current subscribers.
+        worker_for(frame).request(
+            frame, (frame, "history", pid, loinc, since, until, as_of),
+            lambda progress: run_fetch_history(progress, pid, loinc, since, until, as_of),
+            on_progress=show_rows, on_done=finish
+        )
+
+    def show_rows(item):
+        kind, text = item
+        if kind == "header":
+            output.delete("1.0", tk.END)
+        output.insert(tk.END, text)
 
-    def fetch_history_threadsafe(pid, loinc, since, until):
-        asyncio.run(run_fetch_history(pid, loinc, since, until))
+    def finish(count):
+        if not count:
+            output.insert(tk.END, "No results found.")
 
-    async def run_fetch_history(pid, loinc, since, until):
+    async def run_fetch_history(progress, pid, loinc, since, until, as_of):
         async with SessionLocal() as db:
-            hist = await crud.observations_history(db, pid, loinc, since, until)
             name = await crud.get_loinc_name(db, loinc) or "(no name)"
-            output_text = f"LOINC: {loinc} – {name}\n\n"
-
-            if not hist:
-                output_text += "No results found."
-            else:
-                for o in hist:
-                    output_text += (
-                        f"ID={o.obs_id} Value={o.value_num} "
-                        f"Valid=({o.valid_start}, {o.valid_end}) "
-                        f"Txn=({o.txn_start}, {o.txn_end})\n"
-                    )
-            output.delete("1.0", tk.END)
-            output.insert(tk.END, output_text)
+            progress(("header", f"LOINC: {loinc} – {name}\n\n"))
+
+            # Hand rows to the widget in batches as they stream in
+            count, lines = 0, []
+            async for o in crud.stream_observations_history(db, pid, loinc, since, until, as_of=as_of):
+                count += 1
+                lines.append(
+                    f"ID={o.obs_id} Value={o.value_num} "
+                    f"Valid=({o.valid_start}, {o.valid_end}) "
+                    f"Txn=({o.txn_start}, {o.txn_end})\n"
+                )
+                if len(lines) >= ROWS_PER_UPDATE:
+                    progress(("rows", "".join(lines)))
+                    lines = []
+            if lines:
+                progress(("rows", "".join(lines)))
+        return count
+
+    frame.bind("<Destroy>", lambda e: e.widget is frame and worker_for(parent).cancel(frame))
 
     submit_btn = tk.Button(frame, text="Fetch", command=on_submit)
     submit_btn.grid(row=len(labels)+2, column=0, columnspan=2, pady=10)
@@ -2,11 +2,10 @@
 import tkinter as tk
 from tkinter import messagebox, scrolledtext
 from datetime import datetime
-import asyncio
-import threading
 
 from app.database import SessionLocal
 from app import crud
+from frames.worker import worker_for
 
 def render(parent):
     frame = tk.Frame(parent, bg="white")
@@ -19,6 +18,7 @@ def render(parent):
 
     pid_entry = tk.Entry(form, width=40)
     time_entry = tk.Entry(form, width=40)
+    as_of_entry = tk.Entry(form, width=40)
 
     tk.Label(form, text="Patient ID", bg="white").grid(row=0, column=0, sticky="w", pady=5)
     pid_entry.grid(row=0, column=1, pady=5)
@@ -26,6 +26,9 @@ def render(parent):
     tk.Label(form, text="Time (dd/mm/YYYY HH:MM or now)", bg="white").grid(row=1, column=0, sticky="w", pady=5)
     time_entry.grid(row=1, column=1, pady=5)
 
+    tk.Label(form, text="Known As Of (optional: dd/mm/YYYY HH:MM)", bg="white").grid(row=2, column=0, sticky="w", pady=5)
+    as_of_entry.grid(row=2, column=1, pady=5)
+
     output = scrolledtext.ScrolledText(frame, width=80, height=18)
     output.pack(pady=(10, 0))
 
@@ -33,15 +36,21 @@ def render(parent):
         try:
             pid = int(pid_entry.get().strip())
             time = datetime.utcnow() if time_entry.get().strip().lower() == "now" else datetime.strptime(time_entry.get(), "%d/%m/%Y %H:%M")
+            as_of_raw = as_of_entry.get().strip()
+            as_of = datetime.strptime(as_of_raw, "%d/%m/%Y %H:%M") if as_of_raw else None
         except Exception as e:
             messagebox.showerror("Error", f"Input error: {e}")
             return
 
-        threading.Thread(target=lambda: asyncio.run(fetch_recommendation(pid, time))).start()
+        worker_for(frame).submit(fetch_recommendation(pid, time, as_of), on_done=show)
+
+    def show(output_text):
+        output.delete("1.0", tk.END)
+        output.insert(tk.END, output_text)
 
-    async def fetch_recommendation(pid, time_point):
+    async def fetch_recommendation(pid, time_point, as_of):
         async with SessionLocal() as db:
-            result = await crud.get_current_treatment_at_time(db, pid, time_point)
+            result = await crud.get_current_treatment_at_time(db, pid, time_point, as_of=as_of)
             print(result)
             if isinstance(result, str):
                 output_text = f"⚠️ {result}"
@@ -59,7 +68,6 @@ def render(parent):
                 for line in result['treatment']:
                     output_text += f"  • {line}\n"
 
-            output.delete("1.0", tk.END)
-            output.insert(tk.END, output_text)
+            return output_text
 
     tk.Button(frame, text="Get Recommendation", command=submit).pack(pady=10)
@@ -0,0 +1,165 @@
+# frames/worker.py
+import asyncio
+import queue
+import threading
+import tkinter as tk
+from tkinter import messagebox
+
+from app.database import engine
+
+# How often the Tk thread collects finished results
+POLL_MS = 20
+
+
+class _SharedRequest:
+    """One in-flight query and the view slots waiting for its result."""
+
+    def __init__(self):
+        self.future = None
+        self.subscribers = {}   # slot -> (on_done, on_error, on_progress)
+
+
+class AsyncWorker:
+    """
+    One long-lived asyncio loop on a daemon thread, shared by every GUI action.
+    Sessions opened there reuse the engine's pooled connections. Results are
+    handed back to the Tk thread by a poll scheduled with after(), so callbacks
+    may touch widgets.
+    """
+
+    def __init__(self, root: tk.Misc):
+        self.root = root
+        self.loop = asyncio.new_event_loop()
+        self._finished = queue.SimpleQueue()     # callables to run on the Tk thread
+        # Touched only on the Tk thread
+        self._inflight = {}     # query key -> _SharedRequest
+        self._slots = {}        # view slot -> query key it is waiting for
+        self._thread = threading.Thread(target=self._run, name="cdss-async", daemon=True)
+        self._thread.start()
+        self._poll_id = root.after(POLL_MS, self._poll)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro, on_done=None, on_error=None):
+        """
+        Schedules coro on the worker loop and returns its concurrent Future.
+        on_done(result) or on_error(exc) is then called on the Tk thread;
+        errors without a handler are shown in a message box.
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        future.add_done_callback(lambda f: self._finished.put(lambda: self._deliver(f, on_done, on_error)))
+        return future
+
+    def request(self, slot, key, make_coro, on_done=None, on_error=None, on_progress=None):
+        """
+        Latest-wins, de-duplicated submit for views that refresh a widget.
+        slot names the widget being filled: a newer request for the same slot
+        supersedes the older one, which is cancelled once nobody waits for it.
+        key names the query: while one with an equal key is in flight, callers
+        share its result instead of running it again. make_coro() builds the
+        coroutine and is only called when a new run is needed.
+
+        With on_progress, make_coro(progress) is called instead; each
+        progress(item) from the coroutine reaches on_progress(item) on the Tk
+        thread, in order, while the request is still current. Subscribers that
+        join later do not see earlier items, so streaming views put the slot
+        in the key.
+        """
+        previous = self._slots.get(slot)
+        if previous is not None and previous != key:
+            self._unsubscribe(slot, previous)
+
+        shared = self._inflight.get(key)
+        if shared is None:
+            shared = _SharedRequest()
+
+            def progress(item):
+                self._finished.put(lambda: self._deliver_progress(key, shared, item))
+
+            coro = make_coro(progress) if on_progress else make_coro()
+            shared.future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+            self._inflight[key] = shared
+            shared.future.add_done_callback(
+                lambda f: self._finished.put(lambda: self._deliver_shared(key, shared))
+            )
+        shared.subscribers[slot] = (on_done, on_error, on_progress)
+        self._slots[slot] = key
+        return shared.future
+
+    def cancel(self, slot) -> None:
+        """Drops slot's pending request, e.g. when its view is destroyed."""
+        key = self._slots.get(slot)
+        if key is not None:
+            self._unsubscribe(slot, key)
+
+    def _unsubscribe(self, slot, key) -> None:
+        self._slots.pop(slot, None)
+        shared = self._inflight.get(key)
+        if shared is None:
+            return
+        shared.subscribers.pop(slot, None)
+        if not shared.subscribers:
+            shared.future.cancel()
+            del self._inflight[key]
+
+    def _deliver_shared(self, key, shared) -> None:
+        if self._inflight.get(key) is not shared:
+            return      # superseded or cancelled before it finished
+        del self._inflight[key]
+        for slot, (on_done, on_error, _) in shared.subscribers.items():
+            if self._slots.get(slot) == key:
+                del self._slots[slot]
+            self._deliver(shared.future, on_done, on_error)
+
+    def _deliver_progress(self, key, shared, item) -> None:
+        if self._inflight.get(key) is not shared:
+            return
+        for _, _, on_progress in list(shared.subscribers.values()):
+            if on_progress:
+                try:
+                    on_progress(item)
+                except tk.TclError:
+                    pass
+
+    def _deliver(self, future, on_done, on_error) -> None:
+        if future.cancelled():
+            return
+        try:
+            error = future.exception()
+            if error is None:
+                if on_done:
+                    on_done(future.result())
+            elif on_error:
+                on_error(error)
+            else:
+                messagebox.showerror("Error", str(error))
+        except tk.TclError:
+            pass    # the view was closed before its result arrived
+
+    def _poll(self):
+        try:
+            while True:
+                try:
+                    callback = self._finished.get_nowait()
+                except queue.Empty:
+                    break
+                callback()
+        finally:
+            # A failing callback is reported by Tk but must not stop delivery
+            self._poll_id = self.root.after(POLL_MS, self._poll)
+
+    def stop(self, timeout: float = 5) -> None:
+        """Closes pooled connections and stops the loop; call before destroying the root."""
+        self.root.after_cancel(self._poll_id)
+        try:
+            asyncio.run_coroutine_threadsafe(engine.dispose(), self.loop).result(timeout)
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout)
+
+
+def worker_for(widget: tk.Misc) -> AsyncWorker:
+    """The AsyncWorker owned by the application window containing widget."""
+    return widget.winfo_toplevel().worker
@@ -0,0 +1,47 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+
+# app.database builds its engine at import: point it at a scratch file first
+_scratch = tempfile.mkdtemp(prefix="cdss-tests-")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_scratch}/test.db"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+
+@pytest.fixture
+def restore_kb(tmp_path):
+    """Puts the built-in rules back after a test that reloads rule files."""
+    from app import kb_loader, knowledge_base
+    builtin = str(tmp_path / "builtin-rules")
+    kb_loader.export_rule_tables(knowledge_base.compiled_kb().tables, builtin)
+    fingerprint = knowledge_base.compiled_kb().fingerprint
+    yield
+    knowledge_base.reload_rules(builtin, force=True)
+    assert knowledge_base.compiled_kb().fingerprint == fingerprint
+
+
+def run(coro):
+    """Runs coro on a fresh event loop; pooled connections do not outlive it."""
+    import asyncio
+    from app.database import engine
+
+    async def main():
+        try:
+            return await coro
+        finally:
+            await engine.dispose()
+    return asyncio.run(main())
+
+
+@pytest.fixture(scope="session")
+def database():
+    """The scratch database with the full schema, as cli.py sets it up."""
+    from app.database import SYNC_DATABASE_URL
+    from app.schema import ensure_schema
+
+    sync_engine = ensure_schema(SYNC_DATABASE_URL)
+    yield sync_engine
+    sync_engine.dispose()
@@ -0,0 +1,99 @@
+# tests/test_corrections.py
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import select
+
+from app import crud, models, schemas
+from app.database import SessionLocal
+from conftest import run
+
+T0 = datetime(2025, 4, 1, 8, 0)
+WBC = crud.WBC_LOINC
+
+
+def setup(values):
+    """A new patient with one WBC measurement per value, a day apart."""
+    async def add():
+        async with SessionLocal() as db:
+            patient = await crud.create_patient(db, schemas.PatientCreate(
+                first_name="Chain", last_name="Patient", gender="M", birth_date=date(1975, 1, 1)
+            ))
+            for i, value in enumerate(values):
+                await crud.create_observation(db, schemas.ObservationCreate(
+                    patient_id=patient.patient_id, loinc_num=WBC, value_num=value,
+                    start=T0 + timedelta(days=i)
+                ))
+            return patient.patient_id
+    return run(add())
+
+
+def correct(pid, items):
+    """apply_corrections over (measured_at, new_value) items, an hour apart in transaction time."""
+    corrections = [
+        schemas.ObservationCorrection(
+            patient_id=pid, loinc_num=WBC, measured_at=measured_at,
+            txn_at=datetime.utcnow() + timedelta(hours=i + 1), new_value=new_value
+        )
+        for i, (measured_at, new_value) in enumerate(items)
+    ]
+
+    async def apply():
+        async with SessionLocal() as db:
+            return await crud.apply_corrections(db, corrections)
+    return run(apply())
+
+
+def current(pid):
+    """{valid_start: value} of the current versions."""
+    async def read():
+        async with SessionLocal() as db:
+            O = models.Observation
+            rows = await db.execute(
+                select(O.valid_start, O.value_num)
+                .where(O.patient_id == pid, O.loinc_num == WBC, O.txn_end == None)
+            )
+            return dict(rows.all())
+    return run(read())
+
+
+def test_updates_on_one_measurement_chain(database):
+    pid = setup([4000, 5000])
+    results = correct(pid, [(T0, 4100), (T0, 4200), (T0, 4300)])
+    assert [r["status"] for r in results] == ["updated"] * 3
+    # Each item replaces the version the one before it inserted
+    assert results[1]["old_id"] == results[0]["new_id"]
+    assert results[2]["old_id"] == results[1]["new_id"]
+    assert current(pid) == {T0: 4300, T0 + timedelta(days=1): 5000}
+
+
+def test_update_then_delete_then_update(database):
+    pid = setup([4000])
+    results = correct(pid, [(T0, 4100), (T0, None), (T0, 4200)])
+    assert [r["status"] for r in results] == ["updated", "deleted", "not_found"]
+    assert results[1]["old_id"] == results[0]["new_id"]
+    assert results[2] == {"status": "not_found", "old_id": None, "new_id": None}
+    assert current(pid) == {}
+
+
+def test_deletes_of_the_latest_step_back(database):
+    pid = setup([4000, 5000, 6000])
+    results = correct(pid, [(None, None), (None, None)])
+    assert [r["status"] for r in results] == ["deleted", "deleted"]
+    assert results[0]["old_id"] != results[1]["old_id"]
+    assert current(pid) == {T0: 4000}
+
+
+def test_delete_of_the_latest_after_a_timed_delete(database):
+    pid = setup([4000, 5000])
+    latest = T0 + timedelta(days=1)
+    results = correct(pid, [(latest, None), (None, None), (None, None)])
+    assert [r["status"] for r in results] == ["deleted", "deleted", "not_found"]
+    assert current(pid) == {}
+
+
+def test_not_found_items_leave_the_rest_applied(database):
+    pid = setup([4000])
+    results = correct(pid, [(T0 - timedelta(days=5), 1.0), (T0, 4500)])
+    assert [r["status"] for r in results] == ["not_found", "updated"]
+    assert current(pid) == {T0: 4500}
+    assert correct(setup([]), [(None, None)])[0]["status"] == "not_found"
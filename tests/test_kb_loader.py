@@ -0,0 +1,173 @@
+# tests/test_kb_loader.py
+import os
+
+import pytest
+
+from app import crud, kb_loader
+from app.kb_tables import TABLE_NAMES, kb_fingerprint
+from app.knowledge_base import compiled_kb, reload_rules
+
+SAMPLE = {
+    crud.HEMOGLOBIN_LOINC: 9.0, crud.WBC_LOINC: 6000, crud.FEVER_LOINC: 39.0,
+    crud.CHILLS_LOINC: 0, crud.SKIN_LOINC: 0, crud.ALLERGY_LOINC: 0,
+}
+
+
+def write(path, text):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+@pytest.fixture
+def rules_dir(tmp_path):
+    """The built-in rules exported as CSV files."""
+    path = str(tmp_path / "rules")
+    kb_loader.export_rule_tables(compiled_kb().tables, path)
+    return path
+
+
+@pytest.mark.parametrize("name", ["rules", "rules.yaml"])
+def test_round_trip_keeps_fingerprint(tmp_path, restore_kb, name):
+    builtin = compiled_kb()
+    path = str(tmp_path / name)
+    kb_loader.export_rule_tables(builtin.tables, path)
+
+    tables = kb_loader.load_rule_tables(path)
+    assert set(tables) == set(TABLE_NAMES)
+    assert kb_fingerprint(*(tables[name] for name in TABLE_NAMES)) == builtin.fingerprint
+
+    assert reload_rules(path, force=True)
+    assert compiled_kb() is not builtin
+    assert compiled_kb().fingerprint == builtin.fingerprint
+
+
+def test_numbers_keep_their_written_form():
+    rows = [{"parameter": "Fever", "grade": "Grade I", "low": "0", "high": "38.5"},
+            {"parameter": "Fever", "grade": "Grade II", "low": "38.5", "high": "inf"}]
+    table = kb_loader._build("toxicity_rules", rows)
+    assert table["Fever"]["Grade I"] == (0, 38.5)
+    assert isinstance(table["Fever"]["Grade I"][0], int)
+    assert table["Fever"]["Grade II"][1] == float("inf")
+
+
+def test_bad_row_names_table_and_row(rules_dir):
+    path = os.path.join(rules_dir, "hemoglobin_state.csv")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("Male,abc,12,Odd,1,1\n")
+    with pytest.raises(ValueError, match=r"hemoglobin_state row \d+: low 'abc' is not a number"):
+        kb_loader.load_rule_tables(rules_dir)
+
+
+def test_unknown_yaml_table_is_rejected(tmp_path):
+    path = str(tmp_path / "rules.yaml")
+    write(path, "treatment_rulez: []\n")
+    with pytest.raises(ValueError, match="unknown tables treatment_rulez"):
+        kb_loader.load_rule_tables(path)
+
+
+def test_missing_table_keeps_built_in(tmp_path, restore_kb):
+    path = str(tmp_path / "rules")
+    kb_loader.export_rule_tables({"toxicity_codes": compiled_kb().tables["toxicity_codes"]}, path)
+    fingerprint = compiled_kb().fingerprint
+    assert reload_rules(path, force=True)
+    assert compiled_kb().fingerprint == fingerprint
+
+
+# Edits that must not replace the running rules: each leaves a file that
+# parses but cannot answer every lookup evaluate_treatment makes
+INCOMPLETE = {
+    "only one toxicity feature": ("toxicity_codes.csv", "parameter,code,label\nChills,0,None\n"),
+    "header only": ("treatment_rules.csv", "gender,hemoglobin_state,hematological_state,toxicity_grade,treatment\n"),
+    "empty file": ("hematological_state.csv", ""),
+    "one gender": ("hemoglobin_state.csv", "gender,low,high,state,good_before_days,good_after_days\nMale,0,9,Severe Anemia,2,5\n"),
+    "no fever bands": ("toxicity_rules.csv", "parameter,grade,low,high,value\n"
+                                             "Chills,Grade I,,,None\nSkin-look,Grade I,,,Erythema\nAllergic-state,Grade I,,,Edema\n"),
+    "negative code": ("toxicity_codes.csv", "parameter,code,label\nChills,-1,None\nSkin-look,0,Erythema\nAllergic-state,0,Edema\n"),
+}
+
+
+@pytest.mark.parametrize("case", sorted(INCOMPLETE))
+def test_incomplete_file_keeps_running_rules(rules_dir, restore_kb, case, capsys):
+    assert reload_rules(rules_dir, force=True)
+    running = compiled_kb()
+    expected = crud.evaluate_treatment("Female", SAMPLE)
+
+    name, text = INCOMPLETE[case]
+    write(os.path.join(rules_dir, name), text)
+    assert reload_rules(rules_dir, force=True) is False
+    assert compiled_kb() is running
+    assert crud.evaluate_treatment("Female", SAMPLE) == expected
+    assert "keeping the current rules" in capsys.readouterr().out
+
+
+def test_truncated_yaml_keeps_running_rules(tmp_path, restore_kb, capsys):
+    path = str(tmp_path / "rules.yaml")
+    kb_loader.export_rule_tables(compiled_kb().tables, path)
+    assert reload_rules(path, force=True)
+    running = compiled_kb()
+
+    # A save cut off inside a flow mapping
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    write(path, text + "hemoglobin_state:\n- {gender: Male, low: 0")
+    with pytest.raises(ValueError, match="not valid YAML"):
+        kb_loader.load_rule_tables(path)
+    assert reload_rules(path, force=True) is False
+    assert compiled_kb() is running
+    assert "keeping the current rules" in capsys.readouterr().out
+
+
+def test_unreadable_csv_keeps_running_rules(rules_dir, restore_kb, capsys):
+    assert reload_rules(rules_dir, force=True)
+    running = compiled_kb()
+
+    # An unclosed quote swallows the rest of the file into one field
+    write(os.path.join(rules_dir, "toxicity_codes.csv"),
+          'parameter,code,label\nChills,0,"' + "x" * 200_000 + "\n")
+    with pytest.raises(ValueError, match="not valid CSV"):
+        kb_loader.load_rule_tables(rules_dir)
+    assert reload_rules(rules_dir, force=True) is False
+    assert compiled_kb() is running
+    assert "keeping the current rules" in capsys.readouterr().out
+
+
+def test_check_complete_accepts_built_in_rules():
+    kb_loader.check_complete(compiled_kb().tables)
+
+
+def test_edited_file_is_swapped_in(rules_dir, restore_kb):
+    assert reload_rules(rules_dir, force=True)
+    before = crud.evaluate_treatment("Female", SAMPLE)
+    assert isinstance(before, dict)
+    state = (before["hemoglobin_state"], before["hematological_state"], before["toxicity_grade"])
+
+    # Replace that rule's treatment lines with one edited line
+    path = os.path.join(rules_dir, "treatment_rules.csv")
+    with open(path, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    key = ",".join(("Female",) + state) + ","
+    kept = [line for line in lines if not line.startswith(key)]
+    write(path, "\n".join(kept + [key + "Edited treatment"]) + "\n")
+
+    assert reload_rules(rules_dir) is True        # picked up by the file stamp, without force
+    assert reload_rules(rules_dir) is False       # unchanged since
+    after = crud.evaluate_treatment("Female", SAMPLE)
+    assert after["treatment"] == ["Edited treatment"]
+    assert crud.knowledge_base_version() == compiled_kb().fingerprint
+
+
+def test_synthetic_codes_follow_reloaded_rules(rules_dir, restore_kb):
+    import random
+    from datetime import datetime
+    from app import synthetic
+
+    path = os.path.join(rules_dir, "toxicity_codes.csv")
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    write(path, text.replace("Chills,0,", "Chills,10,").replace("Chills,1,", "Chills,11,").replace("Chills,2,", "Chills,12,"))
+    assert reload_rules(rules_dir, force=True)
+
+    observations = synthetic.patient_observations(
+        random.Random(0), 1, "F", 200, datetime(2025, 1, 1), 30, {crud.CHILLS_LOINC: 1}, 0
+    )
+    assert {o.value_num for o in observations} <= {10.0, 11.0, 12.0}
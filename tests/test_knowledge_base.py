@@ -0,0 +1,134 @@
+# tests/test_knowledge_base.py
+import random
+
+import pytest
+
+from app import crud, kb_loader
+from app.kb_tables import TOXICITY_FEATURES, TOXICITY_GRADES
+from app.knowledge_base import compiled_kb, reload_rules
+
+
+# Reference evaluation: plain scans of the rule dicts, as before they were compiled
+
+def scan_hemoglobin(tables, gender, value):
+    for low, high, label, _, _ in tables["hemoglobin_state"][gender]:
+        if low <= value < high:
+            return label
+    return "Unknown"
+
+
+def scan_hematological(tables, gender, h_value, wbc_value):
+    for (h_low, h_high), wbc_map in tables["hematological_state"][gender].items():
+        if h_low <= h_value < h_high:
+            for (w_low, w_high), label in wbc_map.items():
+                if w_low <= wbc_value < w_high:
+                    return label
+    return "Unknown"
+
+
+def scan_toxicity(tables, fever, labels):
+    rules = tables["toxicity_rules"]
+    grade = 0
+    for label, (low, high) in rules["Fever"].items():
+        if low <= fever < high:
+            grade = max(grade, TOXICITY_GRADES.index(label))
+    for feature, label in zip(TOXICITY_FEATURES, labels):
+        listed = [TOXICITY_GRADES.index(g) for g, values in rules[feature].items() if label in values]
+        if listed:
+            grade = max(grade, min(listed))
+    return TOXICITY_GRADES[grade]
+
+
+def scan_evaluate(tables, gender, values):
+    codes = tables["toxicity_codes"]
+    h, w, fever = values[crud.HEMOGLOBIN_LOINC], values[crud.WBC_LOINC], values[crud.FEVER_LOINC]
+    labels = [
+        codes[feature].get(int(values[loinc]), "Unknown")
+        for feature, loinc in zip(TOXICITY_FEATURES, (crud.CHILLS_LOINC, crud.SKIN_LOINC, crud.ALLERGY_LOINC))
+    ]
+    hemo = scan_hemoglobin(tables, gender, h)
+    hema = scan_hematological(tables, gender, h, w)
+    grade = scan_toxicity(tables, fever, labels)
+    treatment = tables["treatment_rules"].get(gender, {}).get((hemo, hema, grade))
+    if not treatment:
+        return f"No treatment rule found for {hemo} + {hema} + {grade}"
+    return treatment
+
+
+def random_inputs(n, seed=0):
+    rnd = random.Random(seed)
+    for _ in range(n):
+        gender = rnd.choice(("Male", "Female"))
+        yield gender, {
+            crud.HEMOGLOBIN_LOINC: rnd.choice((rnd.uniform(4, 22), rnd.choice((0, 8, 9, 10, 12, 13, 14, 16)))),
+            crud.WBC_LOINC: rnd.choice((rnd.uniform(0, 15000), rnd.choice((0, 4000, 10000)))),
+            crud.FEVER_LOINC: rnd.choice((rnd.uniform(35, 42), 38.5, 40.0)),
+            crud.CHILLS_LOINC: rnd.randint(0, 3),
+            crud.SKIN_LOINC: rnd.randint(0, 4),
+            crud.ALLERGY_LOINC: rnd.randint(0, 4),
+        }
+
+
+def assert_matches_scan(n=20000, seed=0):
+    tables = compiled_kb().tables
+    found = 0
+    for gender, values in random_inputs(n, seed):
+        result = crud.evaluate_treatment(gender, values)
+        expected = scan_evaluate(tables, gender, values)
+        got = result["treatment"] if isinstance(result, dict) else result
+        assert got == expected, (gender, values)
+        found += isinstance(result, dict)
+    return found
+
+
+def test_evaluate_treatment_matches_dict_scan():
+    assert assert_matches_scan() > 0
+
+
+def test_evaluate_treatment_result_fields():
+    gender, values = "Female", {
+        crud.HEMOGLOBIN_LOINC: 7.5, crud.WBC_LOINC: 3000, crud.FEVER_LOINC: 37.0,
+        crud.CHILLS_LOINC: 0, crud.SKIN_LOINC: 0, crud.ALLERGY_LOINC: 0,
+    }
+    tables = compiled_kb().tables
+    result = crud.evaluate_treatment(gender, values)
+    expected = scan_evaluate(tables, gender, values)
+    if isinstance(result, dict):
+        assert result["hemoglobin_state"] == scan_hemoglobin(tables, gender, 7.5)
+        assert result["chills"] == tables["toxicity_codes"]["Chills"][0]
+        assert result["treatment"] == expected
+    else:
+        assert result == expected
+    del values[crud.WBC_LOINC]
+    assert crud.evaluate_treatment(gender, values).startswith("Insufficient data")
+
+
+def test_evaluate_treatment_matches_dict_scan_after_reload(tmp_path, restore_kb):
+    # Shift every band and rename a state: the compiled lookups must follow the files
+    tables = dict(compiled_kb().tables)
+    tables["hemoglobin_state"] = {
+        gender: [(low + 0.5, high + 0.5 if high != float("inf") else high,
+                  "Very Low" if label == "Severe Anemia" else label, before, after)
+                 for low, high, label, before, after in rows]
+        for gender, rows in tables["hemoglobin_state"].items()
+    }
+    tables["treatment_rules"] = {
+        gender: {(("Very Low" if hemo == "Severe Anemia" else hemo), hema, grade): lines
+                 for (hemo, hema, grade), lines in rules.items()}
+        for gender, rules in tables["treatment_rules"].items()
+    }
+    path = str(tmp_path / "rules.yaml")
+    kb_loader.export_rule_tables(tables, path)
+    assert reload_rules(path, force=True)
+    assert "Very Low" in compiled_kb().hemoglobin_states
+    assert assert_matches_scan(seed=1) > 0
+
+
+@pytest.mark.parametrize("grade", ["Grade II", "Unknown"])
+def test_evaluate_treatment_with_pregraded_toxicity(grade):
+    for gender, values in random_inputs(500, seed=2):
+        result = crud.evaluate_treatment(gender, values, grade)
+        if isinstance(result, dict):
+            assert result["toxicity_grade"] == grade
+        else:
+            assert result.endswith(f"+ {grade}")
@@ -0,0 +1,38 @@
+# tests/test_patients.py
+from datetime import date
+
+from sqlalchemy import event
+
+from app import crud, schemas
+from app.database import SessionLocal, engine
+from conftest import run
+
+
+def test_cached_name_lookup_runs_no_query(database):
+    async def lookups():
+        async with SessionLocal() as db:
+            for first, last in (("Mary Ann", "Names"), ("Mary", "Ann Names")):
+                await crud.create_patient(db, schemas.PatientCreate(
+                    first_name=first, last_name=last, gender="F", birth_date=date(1990, 5, 1)
+                ))
+        async with SessionLocal() as db:
+            missed = [(p.patient_id, p.first_name, p.last_name) for p in
+                      await crud.find_patients_by_name(db, "mary ann NAMES")]
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine.sync_engine, "before_cursor_execute", listener)
+        try:
+            async with SessionLocal() as db:
+                hit = await crud.find_patients_by_name(db, "Mary  Ann Names")
+                # The rebuilt instances belong to the session
+                assert await crud.find_patient_by_name(db, "mary ann names") is hit[0]
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", listener)
+        return missed, [(p.patient_id, p.first_name, p.last_name, p.birth_date) for p in hit], statements
+
+    missed, hit, statements = run(lookups())
+    assert [row[:3] for row in hit] == missed
+    assert [row[1:3] for row in hit] == [("Mary Ann", "Names"), ("Mary", "Ann Names")]
+    assert hit[0][3] == date(1990, 5, 1)
+    assert statements == []
@@ -0,0 +1,63 @@
+# tests/test_schema.py
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, models, schemas
+from app.schema import ensure_schema
+from conftest import run
+
+
+@pytest.fixture
+def fresh_caches():
+    # Patient IDs restart in another database file: keep cached results apart
+    def clear():
+        crud.recommendation_cache.clear()
+        crud.state_interval_trees.clear()
+        crud.patient_name_cache.clear()
+        crud._seen_data_version = None
+    clear()
+    yield
+    clear()
+
+
+def test_ensure_schema_upgrades_first_release_database(tmp_path, fresh_caches):
+    url = f"sqlite:///{tmp_path}/first-release.db"
+    old = create_engine(url)
+    with old.begin() as conn:
+        # The tables as the first release created them
+        models.Base.metadata.create_all(conn)
+        conn.execute(text("DROP TABLE state_intervals"))
+        conn.execute(text("DROP TABLE data_versions"))
+        conn.execute(text("DROP INDEX ix_patients_name_key"))
+        conn.execute(text("ALTER TABLE patients DROP COLUMN name_key"))
+        conn.execute(text(
+            "INSERT INTO patients (first_name, last_name, gender, birth_date) VALUES ('Ada', 'Old', 'F', '1970-01-01')"
+        ))
+    old.dispose()
+
+    ensure_schema(url).dispose()
+
+    engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://"))
+    Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def use_it():
+        try:
+            async with Session() as db:
+                [patient] = await crud.find_patients_by_name(db, "ada OLD")
+                await crud.create_observation(db, schemas.ObservationCreate(
+                    patient_id=patient.patient_id, loinc_num=crud.HEMOGLOBIN_LOINC,
+                    value_num=7.5, start=datetime(2025, 1, 1)
+                ))
+                result = await crud.get_current_treatment_at_time(db, patient.patient_id, datetime(2025, 1, 1, 1))
+                intervals = await crud.get_states_at(db, patient.patient_id, datetime(2025, 1, 1, 1))
+                return result, [i["state"] for i in intervals]
+        finally:
+            await engine.dispose()
+
+    result, states = run(use_it())
+    assert result.startswith("Insufficient data")
+    assert states == ["Severe Anemia"]
@@ -0,0 +1,41 @@
+# tests/test_state_inference.py
+import random
+from datetime import datetime, timedelta
+
+from app import crud
+from app.knowledge_base import get_hemoglobin_state_with_timing
+
+
+def _scalar_state(gender, value):
+    # Not in COLUMNAR_STATE_FUNCS, so infer_state_intervals takes the per-value path
+    return get_hemoglobin_state_with_timing(gender, value)
+
+
+def _observations(n=500, seed=0):
+    rnd = random.Random(seed)
+    t0 = datetime(2025, 1, 1, 8, 30)
+    values = [rnd.uniform(4, 22) for _ in range(n)] + [float("nan"), 0.0, 16.0, 1e6]
+    return [(t0 + timedelta(hours=7 * i, seconds=i), v) for i, v in enumerate(values)]
+
+
+def test_columnar_intervals_match_scalar_path():
+    for gender in ("Male", "Female"):
+        observations = _observations()
+        columnar = crud.infer_state_intervals(observations, gender, get_hemoglobin_state_with_timing)
+        scalar = crud.infer_state_intervals(observations, gender, _scalar_state)
+        assert len(columnar) == len(scalar)
+        for got, want in zip(columnar, scalar):
+            assert got["state"] == want["state"]
+            assert got["obs_time"] == want["obs_time"]
+            assert got["value"] == want["value"] or got["value"] != got["value"]
+            # obs_time -/+ Timedelta is a plain datetime; the columnar path must give the same
+            for bound in ("start", "end"):
+                assert got[bound] == want[bound]
+                assert type(got[bound]) is type(want[bound]) is datetime
+
+
+def test_infer_hemoglobin_intervals_columns():
+    observations = _observations(50)
+    frame = crud.infer_hemoglobin_intervals([t for t, _ in observations], [v for _, v in observations], "Female")
+    assert list(frame.columns) == ["state", "start", "end", "value", "obs_time"]
+    assert frame["state"].iloc[-4] == "Unknown"     # NaN falls outside every band
@@ -0,0 +1,114 @@
+# tests/test_state_intervals.py
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import text
+
+from app import crud, kb_loader, schema, schemas
+from app.database import SessionLocal
+from app.knowledge_base import compiled_kb, reload_rules
+from conftest import run
+
+T0 = datetime(2025, 3, 1, 9, 0)
+
+
+async def add_patient(db, hemoglobin, gender="F"):
+    patient = await crud.create_patient(db, schemas.PatientCreate(
+        first_name="Test", last_name="Patient", gender=gender, birth_date=date(1980, 1, 1)
+    ))
+    for i, value in enumerate(hemoglobin):
+        await crud.create_observation(db, schemas.ObservationCreate(
+            patient_id=patient.patient_id, loinc_num=crud.HEMOGLOBIN_LOINC,
+            value_num=value, start=T0 + timedelta(days=10 * i)
+        ))
+    return patient.patient_id
+
+
+def states_at(pid, t):
+    async def read():
+        async with SessionLocal() as db:
+            return [interval["state"] for interval in await crud.get_states_at(db, pid, t)]
+    return run(read())
+
+
+def very_low_rules(tmp_path):
+    """The running rules with "Severe Anemia" renamed "Very Low", exported as a rules file."""
+    path = str(tmp_path / "rules.yaml")
+    kb_loader.export_rule_tables({"hemoglobin_state": {
+        gender: [(low, high, "Very Low" if label == "Severe Anemia" else label, before, after)
+                 for low, high, label, before, after in rows]
+        for gender, rows in compiled_kb().tables["hemoglobin_state"].items()
+    }}, path)
+    return path
+
+
+def test_write_from_another_connection_is_seen(database):
+    pid = run(_add(7.5))
+    assert states_at(pid, T0) == ["Severe Anemia"]
+    assert (pid, crud.HEMOGLOBIN_ABSTRACTION) in crud.state_interval_trees._data
+
+    # Same as another process: a plain connection, invisible to this process's listeners
+    with database.begin() as conn:
+        conn.execute(text("UPDATE observations SET valid_start = :t WHERE patient_id = :pid"),
+                     {"t": T0 + timedelta(days=300), "pid": pid})
+        conn.execute(text("DELETE FROM state_intervals WHERE patient_id = :pid"), {"pid": pid})
+    assert states_at(pid, T0) == []
+
+
+def test_rules_reload_rebuilds_in_background(tmp_path, database, restore_kb):
+    pid = run(_add(7.5))
+    assert states_at(pid, T0) == ["Severe Anemia"]
+
+    assert reload_rules(very_low_rules(tmp_path), force=True)
+
+    async def read_during_and_after():
+        async with SessionLocal() as db:
+            # The first read starts the rebuild and still sees the stored rows
+            during = [i["state"] for i in await crud.get_states_at(db, pid, T0)]
+            assert crud.state_intervals_rebuild is not None
+            await crud.state_intervals_rebuild
+        async with SessionLocal() as db:
+            after = [i["state"] for i in await crud.get_states_at(db, pid, T0)]
+            cohort = await crud.patients_in_state(db, "Very Low", T0, T0 + timedelta(days=1))
+        return during, after, [row["patient_id"] for row in cohort]
+
+    during, after, cohort = run(read_during_and_after())
+    assert during == ["Severe Anemia"]
+    assert after == ["Very Low"]
+    assert pid in cohort
+
+
+def test_trees_dropped_when_rules_change_elsewhere(tmp_path, database, restore_kb):
+    # Another process rebuilt under new rules: the stored fingerprint already
+    # matches here, yet this process's trees were built under the old rules
+    pid = run(_add(7.5))
+    assert states_at(pid, T0) == ["Severe Anemia"]
+    assert reload_rules(very_low_rules(tmp_path), force=True)
+    with database.begin() as conn:
+        schema.rebuild_state_intervals(conn)
+        schema.record_state_intervals_fingerprint(conn, crud.state_intervals_fingerprint())
+    crud.state_interval_trees.put((pid, crud.HEMOGLOBIN_ABSTRACTION), crud.IntervalTree([]))    # a stale tree
+    assert states_at(pid, T0) == ["Very Low"]
+
+
+def _add(*hemoglobin):
+    async def add():
+        async with SessionLocal() as db:
+            return await add_patient(db, hemoglobin)
+    return add()
+
+
+def test_rules_change_while_a_pass_is_in_flight(tmp_path, database, restore_kb):
+    pid = run(_add(7.5))
+    path = very_low_rules(tmp_path)
+
+    async def reload_between_reads():
+        crud._intervals_checked_for = None          # as in a freshly started process
+        async with SessionLocal() as db:
+            await crud.get_states_at(db, pid, T0)   # starts a pass under the current rules
+            assert reload_rules(path, force=True)
+            await crud.get_states_at(db, pid, T0)
+            await crud.state_intervals_rebuild
+        async with SessionLocal() as db:
+            return [i["state"] for i in await crud.get_states_at(db, pid, T0)]
+
+    assert run(reload_between_reads()) == ["Very Low"]
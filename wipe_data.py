@@ -1,11 +1,14 @@
 # wipe_patients_and_observations.py
 
-from app.models import Patient, Observation
+from app.models import Patient, Observation, StateInterval
 from app.database import SyncSession
 
 with SyncSession() as db:
     print("Wiping all patients and observations...", flush=True)
 
+    # Derived intervals reference observations: they go first
+    db.query(StateInterval).delete()
+
     # Delete observations first (foreign key constraint)
     deleted_obs = db.query(Observation).delete()
     print(f"Deleted {deleted_obs} observations.", flush=True)